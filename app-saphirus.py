@@ -1,10 +1,23 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
-from pypdf import PdfReader
-from twilio.rest import Client
 import logging
-import uuid
+import hashlib
+from productos import compilar_clasificador, compilar_limpieza
+from lector_pdf import procesar_pdf_con_progreso
+from listas import (parsear_lista, mostrar_lineas_invalidas, formatear_lista_texto, generar_mensaje_df,
+                    combinar_listas, texto_de_combinacion, calcular_totales, csv_de_totales)
+from busqueda import buscar_en_indice
+from whatsapp import encolar_whatsapp, mostrar_envios_whatsapp
+from comparador import comparar_listas, mostrar_comparacion
+from persistencia import registrar_evento, guardar_snapshot, guardar_diario, iniciar_persistencia
+from auditoria import (preparar_datos_auditoria, generar_listas_finales, filas_de_ids, filas_de_categoria,
+                       marcar_estado, fijar_cantidad, fijar_producto, agregar_filas, borrar_filas,
+                       buscar_filas_auditoria, categorias_auditoria, contar_auditoria, formatear_cantidad,
+                       compartir_auditoria, unirse_a_auditoria, vigilar_auditoria_compartida)
+
+logger = logging.getLogger(__name__)
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(page_title="Repositor V49", page_icon="⚡", layout="wide")
@@ -40,14 +53,20 @@ st.markdown("""
 
 # --- GESTIÓN DE ESTADO ---
 if 'audit_data' not in st.session_state:
-    st.session_state.audit_data = [] 
+    st.session_state.audit_data = None
 if 'audit_started' not in st.session_state:
     st.session_state.audit_started = False
 # NUEVO: Lista de categorías ocultas (Archivadas)
 if 'cats_ocultas' not in st.session_state:
     st.session_state.cats_ocultas = set()
+if 'audit_vistas' not in st.session_state:
+    st.session_state.audit_vistas = {}
 if 'stock_report_log' not in st.session_state:
     st.session_state.stock_report_log = []
+if 'sum_cantidad' not in st.session_state:
+    st.session_state.sum_cantidad = 2
+if 'whatsapp_envios' not in st.session_state:
+    st.session_state.whatsapp_envios = []
 # --- CREDENCIALES ---
 def cargar_credenciales():
     try:
@@ -91,239 +110,209 @@ PATRONES = {
 
 # --- CATEGORIAS ---
 CATEGORIAS = {
-    'textil_disney': {'pattern': lambda p: "TEXTIL" in p and "DISNEY" in p, 'emoji': "", 'nombre': "TEXTILES DISNEY", 'prioridad': 0.1},
-    'difusor_disney': {'pattern': lambda p: "DIFUSOR" in p and "DISNEY" in p, 'emoji': "", 'nombre': "DIFUSORES DISNEY", 'prioridad': 0.2},
-    'tarjeta': {'pattern': lambda p: "TARJETA" in p and "AROMATICA" in p, 'emoji': "💳", 'nombre': "Tarjetas Aromáticas", 'prioridad': 0.5},
-    'sahumerio_saphirus': {'pattern': lambda p: "SAHUMERIO" in p and "SAPHIRUS" in p and not any(x in p for x in ["AMBAR", "HIMALAYA", "HIERBAS"]), 'emoji': "🧘‍♂️", 'nombre': "Sahumerios Saphirus", 'prioridad': 14.5},
-    'touch_dispositivo': {'pattern': lambda p: "DISPOSITIVO" in p and "TOUCH" in p, 'emoji': "🖱️", 'nombre': "Dispositivos Touch", 'prioridad': 1},
-    'touch_repuesto': {'pattern': lambda p: ("REPUESTO" in p and "TOUCH" in p) or "GR/13" in p, 'emoji': "🔄", 'nombre': "Repuestos de Touch", 'prioridad': 2},
-    'perfume_mini': {'pattern': lambda p: "MINI MILANO" in p, 'emoji': "🧴", 'nombre': "Perfume Mini Milano", 'prioridad': 3},
-    'perfume_parfum': {'pattern': lambda p: "PARFUM" in p, 'emoji': "🧴", 'nombre': "Parfum / Perfumes", 'prioridad': 4},
-    'shiny_general': {'pattern': lambda p: "SHINY" in p and ("LIMPIAVIDRIOS" in p or "DESENGRASANTE" in p or "LUSTRAMUEBLE" in p), 'emoji': "✨", 'nombre': "Shiny General", 'prioridad': 5},
-    'ambar_aerosol': {'pattern': lambda p: "AMBAR" in p and "AEROSOL" in p, 'emoji': "🔸", 'nombre': "Aerosoles Ambar", 'prioridad': 6},
-    'ambar_textil': {'pattern': lambda p: "AMBAR" in p and ("TEXTIL" in p or "150 ML" in p), 'emoji': "🔸", 'nombre': "Textiles Ambar", 'prioridad': 7},
-    'ambar_sahumerio': {'pattern': lambda p: "AMBAR" in p and "SAHUMERIO" in p, 'emoji': "🔸", 'nombre': "Sahumerios Ambar", 'prioridad': 8},
-    'ambar_varios': {'pattern': lambda p: "AMBAR" in p, 'emoji': "🔸", 'nombre': "Línea Ambar Varios", 'prioridad': 9},
-    'home_spray': {'pattern': lambda p: "HOME SPRAY" in p or "500 ML" in p or "500ML" in p, 'emoji': "🏠", 'nombre': "Home Spray", 'prioridad': 10},
-    'aparatos': {'pattern': lambda p: "APARATO" in p or "HORNILLO" in p, 'emoji': "⚙️", 'nombre': "Aparatos", 'prioridad': 11},
-    'premium': {'pattern': lambda p: "PREMIUM" in p, 'emoji': "💎", 'nombre': "Difusores Premium", 'prioridad': 12},
-    'sahumerio_hierbas': {'pattern': lambda p: "SAHUMERIO" in p and "HIERBAS" in p, 'emoji': "🌿", 'nombre': "Sahumerios Hierbas", 'prioridad': 13},
-    'sahumerio_himalaya': {'pattern': lambda p: "SAHUMERIO" in p and "HIMALAYA" in p, 'emoji': "🏔️", 'nombre': "Sahumerios Himalaya", 'prioridad': 14},
-    'sahumerio_varios': {'pattern': lambda p: "SAHUMERIO" in p, 'emoji': "🧘", 'nombre': "Sahumerios Varios", 'prioridad': 15},
-    'auto_caritas': {'pattern': lambda p: "CARITAS" in p, 'emoji': "😎", 'nombre': "Autos - Caritas", 'prioridad': 16},
-    'auto_ruta': {'pattern': lambda p: "RUTA" in p or "RUTA 66" in p, 'emoji': "🛣️", 'nombre': "Autos - Ruta 66", 'prioridad': 17},
-    'auto_varios': {'pattern': lambda p: "AUTO" in p, 'emoji': "🚗", 'nombre': "Autos - Varios", 'prioridad': 18},
-    'textil_mini': {'pattern': lambda p: "TEXTIL" in p and "MINI" in p, 'emoji': "🤏", 'nombre': "Textiles Mini", 'prioridad': 19},
-    'textil': {'pattern': lambda p: "TEXTIL" in p, 'emoji': "👕", 'nombre': "Textiles Saphirus", 'prioridad': 20},
-    'aerosol': {'pattern': lambda p: "AEROSOL" in p, 'emoji': "💨", 'nombre': "Aerosoles Saphirus", 'prioridad': 21},
-    'difusor': {'pattern': lambda p: "DIFUSOR" in p or "VARILLA" in p, 'emoji': "🎍", 'nombre': "Difusores", 'prioridad': 22},
-    'vela': {'pattern': lambda p: "VELA" in p, 'emoji': "🕯️", 'nombre': "Velas", 'prioridad': 23},
-    'aceite': {'pattern': lambda p: "ACEITE" in p, 'emoji': "💧", 'nombre': "Aceites", 'prioridad': 24},
-    'antihumedad': {'pattern': lambda p: "ANTIHUMEDAD" in p, 'emoji': "💧", 'nombre': "Antihumedad", 'prioridad': 25},
-    'limpiador': {'pattern': lambda p: "LIMPIADOR" in p, 'emoji': "🧼", 'nombre': "Limpiadores Multisuperficies", 'prioridad': 26},
+    'textil_disney': {'claves': [("TEXTIL", "DISNEY")], 'emoji': "", 'nombre': "TEXTILES DISNEY", 'prioridad': 0.1},
+    'difusor_disney': {'claves': [("DIFUSOR", "DISNEY")], 'emoji': "", 'nombre': "DIFUSORES DISNEY", 'prioridad': 0.2},
+    'tarjeta': {'claves': [("TARJETA", "AROMATICA")], 'emoji': "💳", 'nombre': "Tarjetas Aromáticas", 'prioridad': 0.5},
+    'sahumerio_saphirus': {'claves': [("SAHUMERIO", "SAPHIRUS")], 'excluye': ("AMBAR", "HIMALAYA", "HIERBAS"), 'emoji': "🧘‍♂️", 'nombre': "Sahumerios Saphirus", 'prioridad': 14.5},
+    'touch_dispositivo': {'claves': [("DISPOSITIVO", "TOUCH")], 'emoji': "🖱️", 'nombre': "Dispositivos Touch", 'prioridad': 1},
+    'touch_repuesto': {'claves': [("REPUESTO", "TOUCH"), ("GR/13",)], 'emoji': "🔄", 'nombre': "Repuestos de Touch", 'prioridad': 2},
+    'perfume_mini': {'claves': [("MINI MILANO",)], 'emoji': "🧴", 'nombre': "Perfume Mini Milano", 'prioridad': 3},
+    'perfume_parfum': {'claves': [("PARFUM",)], 'emoji': "🧴", 'nombre': "Parfum / Perfumes", 'prioridad': 4},
+    'shiny_general': {'claves': [("SHINY", "LIMPIAVIDRIOS"), ("SHINY", "DESENGRASANTE"), ("SHINY", "LUSTRAMUEBLE")], 'emoji': "✨", 'nombre': "Shiny General", 'prioridad': 5},
+    'ambar_aerosol': {'claves': [("AMBAR", "AEROSOL")], 'emoji': "🔸", 'nombre': "Aerosoles Ambar", 'prioridad': 6},
+    'ambar_textil': {'claves': [("AMBAR", "TEXTIL"), ("AMBAR", "150 ML")], 'emoji': "🔸", 'nombre': "Textiles Ambar", 'prioridad': 7},
+    'ambar_sahumerio': {'claves': [("AMBAR", "SAHUMERIO")], 'emoji': "🔸", 'nombre': "Sahumerios Ambar", 'prioridad': 8},
+    'ambar_varios': {'claves': [("AMBAR",)], 'emoji': "🔸", 'nombre': "Línea Ambar Varios", 'prioridad': 9},
+    'home_spray': {'claves': [("HOME SPRAY",), ("500 ML",), ("500ML",)], 'emoji': "🏠", 'nombre': "Home Spray", 'prioridad': 10},
+    'aparatos': {'claves': [("APARATO",), ("HORNILLO",)], 'emoji': "⚙️", 'nombre': "Aparatos", 'prioridad': 11},
+    'premium': {'claves': [("PREMIUM",)], 'emoji': "💎", 'nombre': "Difusores Premium", 'prioridad': 12},
+    'sahumerio_hierbas': {'claves': [("SAHUMERIO", "HIERBAS")], 'emoji': "🌿", 'nombre': "Sahumerios Hierbas", 'prioridad': 13},
+    'sahumerio_himalaya': {'claves': [("SAHUMERIO", "HIMALAYA")], 'emoji': "🏔️", 'nombre': "Sahumerios Himalaya", 'prioridad': 14},
+    'sahumerio_varios': {'claves': [("SAHUMERIO",)], 'emoji': "🧘", 'nombre': "Sahumerios Varios", 'prioridad': 15},
+    'auto_caritas': {'claves': [("CARITAS",)], 'emoji': "😎", 'nombre': "Autos - Caritas", 'prioridad': 16},
+    'auto_ruta': {'claves': [("RUTA",), ("RUTA 66",)], 'emoji': "🛣️", 'nombre': "Autos - Ruta 66", 'prioridad': 17},
+    'auto_varios': {'claves': [("AUTO",)], 'emoji': "🚗", 'nombre': "Autos - Varios", 'prioridad': 18},
+    'textil_mini': {'claves': [("TEXTIL", "MINI")], 'emoji': "🤏", 'nombre': "Textiles Mini", 'prioridad': 19},
+    'textil': {'claves': [("TEXTIL",)], 'emoji': "👕", 'nombre': "Textiles Saphirus", 'prioridad': 20},
+    'aerosol': {'claves': [("AEROSOL",)], 'emoji': "💨", 'nombre': "Aerosoles Saphirus", 'prioridad': 21},
+    'difusor': {'claves': [("DIFUSOR",), ("VARILLA",)], 'emoji': "🎍", 'nombre': "Difusores", 'prioridad': 22},
+    'vela': {'claves': [("VELA",)], 'emoji': "🕯️", 'nombre': "Velas", 'prioridad': 23},
+    'aceite': {'claves': [("ACEITE",)], 'emoji': "💧", 'nombre': "Aceites", 'prioridad': 24},
+    'antihumedad': {'claves': [("ANTIHUMEDAD",)], 'emoji': "💧", 'nombre': "Antihumedad", 'prioridad': 25},
+    'limpiador': {'claves': [("LIMPIADOR",)], 'emoji': "🧼", 'nombre': "Limpiadores Multisuperficies", 'prioridad': 26},
 }
 
-def detectar_categoria(producto):
-    p = producto.upper()
-    for key, config in sorted(CATEGORIAS.items(), key=lambda x: x[1]['prioridad']):
-        if config['pattern'](p):
-            prefix = f"{config['emoji']} " if config['emoji'] else ""
-            return f"{prefix}{config['nombre']}"
-    return "📦 Varios"
-
-def aplicar_reglas_compiladas(texto, reglas):
-    resultado = texto.upper()
-    for regla in reglas:
-        if isinstance(regla, tuple):
-            patron, reemplazo = regla
-            resultado = patron.sub(reemplazo, resultado)
-        else:
-            resultado = regla.sub("", resultado)
-    return re.sub(r"\s+", " ", resultado).strip()
-
-def limpiar_producto_por_categoria(row):
-    cat = row["Categoria"]
-    nom = row["Producto"]
-    
-    mapeo = {
-        "TEXTILES DISNEY": 'textil_disney', "DIFUSORES DISNEY": 'difusor_disney', 
-        "Tarjetas Aromáticas": 'tarjeta', "Sahumerios Saphirus": 'sahumerio_saphirus', 
-        "Shiny General": 'shiny_general', "Limpiadores": 'limpiadores', "Difusores Premium": 'premium', 
-        "Aceites": 'aceites', "Sahumerios Ambar": 'sahumerio_ambar', "Repuestos de Touch": 'repuesto_touch', 
-        "Dispositivos Touch": 'dispositivo_touch', "Antihumedad": 'antihumedad', "Perfume": 'perfumes', 
-        "Parfum": 'perfumes', "Aparatos": 'aparatos', "Sahumerios": 'sahumerio_tipo', "Home Spray": 'home_spray', 
-        "Textiles Mini": 'textil_mini', "Textiles": 'textil', "Autos": 'autos', "Aerosoles": 'aerosol', 
-        "Difusores": 'difusor', "Velas": 'velas',
-    }
-    
-    for key, regla_key in mapeo.items():
-        if key in cat:
-            if regla_key == 'aparatos':
-                 res = aplicar_reglas_compiladas(nom, PATRONES['aparatos'])
-                 return res
-            resultado = aplicar_reglas_compiladas(nom, PATRONES.get(regla_key, []))
-            resultado = aplicar_reglas_compiladas(resultado, PATRONES['general'])
-            if "Touch" in cat and "REPUESTO NEGRO" in resultado: 
-                resultado = resultado.replace("REPUESTO NEGRO", "NEGRO + REPUESTO")
-            return resultado if len(resultado) >= 2 else nom
-    return aplicar_reglas_compiladas(nom, PATRONES['general'])
-
-def extraer_texto_pdf(archivo):
-    try:
-        reader = PdfReader(archivo)
-        texto = "".join([p.extract_text() for p in reader.pages if p.extract_text()])
-        return texto.replace("\n", " ")
-    except Exception: return None
-
-def parsear_datos(texto):
-    datos = []
-    matches = re.findall(r'"\s*(\d{8})\s*"\s*,\s*"\s*([-0-9,]+)\s+([^"]+)"', texto)
-    if not matches:
-        matches = re.findall(r'(\d{8})\s+([-0-9]+,\d{2})\s+(.*?)(?=\s\d{1,3}(?:\.\d{3})*,\d{2})', texto)
-    for m in matches:
-        datos.append({"ID": m[0], "Cantidad": m[1], "Producto": m[2].strip()})
-    return datos
-
-def limpiar_dataframe(df):
-    df["Cantidad"] = df["Cantidad"].apply(lambda x: float(x.replace(",", ".")) if isinstance(x, str) else x)
-    df["Producto"] = df["Producto"].apply(lambda x: re.sub(r'^\d{8}\s*', '', x.strip()))
-    df = df[df["Cantidad"] > 0]
-    df["Categoria"] = df["Producto"].apply(detectar_categoria)
-    df["Producto"] = df.apply(limpiar_producto_por_categoria, axis=1)
-    return df.groupby(["Categoria", "Producto"], as_index=False)["Cantidad"].sum()
-
-@st.cache_data
-def procesar_pdf(archivo):
-    try:
-        texto = extraer_texto_pdf(archivo)
-        if not texto: return None
-        datos = parsear_datos(texto)
-        if not datos: return None
-        df = pd.DataFrame(datos)
-        return limpiar_dataframe(df)
-    except Exception as e:
-        return None
-
-def preparar_datos_auditoria(texto_lista):
-    items = []
-    categoria_actual = "General"
-    lineas = texto_lista.split('\n')
-    for linea in lineas:
-        linea = linea.strip()
-        if not linea: continue
-        if linea.startswith("==") and linea.endswith("=="):
-            categoria_actual = linea.replace("==", "").strip()
-        elif " x " in linea:
-            try:
-                partes = linea.split(" x ", 1)
-                cant_str = partes[0].strip()
-                prod = partes[1].strip()
-                cant = float(cant_str) if '.' in cant_str else int(cant_str)
-                items.append({
-                    "id": str(uuid.uuid4()),
-                    "Categoría": categoria_actual,
-                    "Producto": prod,
-                    "Cantidad": cant,
-                    "Estado": "pdte." # Abreviatura por defecto
-                })
-            except: continue
-    return items
-
-def generar_listas_finales(data):
-    pedido_web = {} 
-    reponido = {}
-    pendiente = {}
-    
-    # Nuevo mapeo con abreviaturas
-    mapa_estados = {"ped.": "pedido", "rep.": "repuesto", "pdte.": "pendiente"}
-    
-    for item in data:
-        cat = item['Categoría']
-        linea = f"{item['Cantidad']} x {item['Producto']}"
-        status_normalizado = mapa_estados.get(item['Estado'], "pendiente")
-        
-        if status_normalizado == 'pedido':
-            if cat not in pedido_web: pedido_web[cat] = []
-            pedido_web[cat].append(linea)
-        elif status_normalizado == 'repuesto':
-            if cat not in reponido: reponido[cat] = []
-            reponido[cat].append(linea)
-        elif status_normalizado == 'pendiente':
-            if cat not in pendiente: pendiente[cat] = []
-            pendiente[cat].append(linea)
-    return pedido_web, reponido, pendiente
-
-def formatear_lista_texto(diccionario, titulo):
-    if not diccionario: return ""
-    txt = f"📋 *{titulo.upper()}*\n"
-    for cat in sorted(diccionario.keys()):
-        txt += f"\n== {cat} ==\n"
-        for prod in diccionario[cat]:
-            txt += f"{prod}\n"
-    return txt
-
-def generar_mensaje_df(df):
-    txt = "📋 *LISTA DE REPOSICIÓN*\n"
-    for c in sorted(df["Categoria"].unique()):
-        txt += f"\n== {c.upper()} ==\n"
-        for _, r in df[df["Categoria"] == c].sort_values("Producto").iterrows():
-            cant = int(r['Cantidad']) if r['Cantidad'].is_integer() else r['Cantidad']
-            txt += f"{cant} x {r['Producto']}\n"
-    return txt
+# --- CLASIFICADOR COMPILADO ---
+CLASIFICADOR = compilar_clasificador(CATEGORIAS)
+
+MAPEO_LIMPIEZA = {
+    "TEXTILES DISNEY": 'textil_disney', "DIFUSORES DISNEY": 'difusor_disney', 
+    "Tarjetas Aromáticas": 'tarjeta', "Sahumerios Saphirus": 'sahumerio_saphirus', 
+    "Shiny General": 'shiny_general', "Limpiadores": 'limpiadores', "Difusores Premium": 'premium', 
+    "Aceites": 'aceites', "Sahumerios Ambar": 'sahumerio_ambar', "Repuestos de Touch": 'repuesto_touch', 
+    "Dispositivos Touch": 'dispositivo_touch', "Antihumedad": 'antihumedad', "Perfume": 'perfumes', 
+    "Parfum": 'perfumes', "Aparatos": 'aparatos', "Sahumerios": 'sahumerio_tipo', "Home Spray": 'home_spray', 
+    "Textiles Mini": 'textil_mini', "Textiles": 'textil', "Autos": 'autos', "Aerosoles": 'aerosol', 
+    "Difusores": 'difusor', "Velas": 'velas',
+}
 
+# --- MOTOR DE LIMPIEZA ---
+LIMPIEZA = compilar_limpieza(PATRONES, MAPEO_LIMPIEZA)
+
+# --- CATEGORIZADOR ---
+# Clasificador, limpieza y la huella de las reglas: si cambian CATEGORIAS o PATRONES cambia la huella, y con ella
+# la caché de productos, el catálogo y la caché de PDFs que se usan.
+HUELLA_REGLAS = hashlib.sha1(repr((CATEGORIAS, PATRONES, MAPEO_LIMPIEZA)).encode()).hexdigest()
+CATEGORIZADOR = {'clasificador': CLASIFICADOR, 'limpieza': LIMPIEZA, 'huella': HUELLA_REGLAS}
+
+# --- ESTADOS DE AUDITORÍA ---
+# Nombres de los estados (el almacén está en auditoria.py); todo arranca en "pdte." (abreviatura por defecto).
+ESTADOS_AUDITORIA = ('pdte.', 'ped.', 'rep.')
+# Estados que van a las listas finales (pedido web, repuesto hoy, pendientes)
+ESTADOS_LISTAS_FINALES = ('ped.', 'rep.', 'pdte.')
+
+def df_de_filas(aud, filas):
+    cantidades = aud['cantidad'][filas]
+    if (cantidades == np.round(cantidades)).all(): cantidades = cantidades.astype(np.int64)
+    return pd.DataFrame({
+        "id": aud['ids'][filas],
+        "Categoría": np.asarray(aud['categorias'], dtype=object)[aud['categoria'][filas]],
+        "Producto": [aud['productos'][f] for f in filas.tolist()],
+        "Cantidad": cantidades,
+        "Estado": np.asarray(ESTADOS_AUDITORIA, dtype=object)[aud['estado'][filas]],
+    })
+
+def df_de_categoria(aud, categoria):
+    return df_de_filas(aud, filas_de_categoria(aud, categoria))
+
+# Filas que muestra como máximo la búsqueda de la auditoría
+BUSQUEDA_MAX_FILAS = 100
+
+def vista_de_categoria(aud, categoria):
+    # DataFrame del editor (con la columna de tildes) guardado por versión de la categoría: solo se rearma si cambió.
+    # Como es el mismo objeto entre reruns, el data_editor conserva su estado (tildes) mientras no cambien los datos.
+    clave = (aud['base'], aud['version'][categoria])
+    guardada = st.session_state.audit_vistas.get(categoria)
+    if guardada is not None and guardada[0] == clave: return guardada[1]
+    df_cat = df_de_categoria(aud, categoria)
+    df_cat.insert(0, "Seleccionar", False)
+    st.session_state.audit_vistas[categoria] = (clave, df_cat)
+    return df_cat
+
+# --- WHATSAPP ---
+# La cola de envíos está en whatsapp.py; acá solo se validan las credenciales.
 def enviar_whatsapp(mensaje, creds):
     if not all([creds['SID'], creds['TOK'], creds['FROM'], creds['TO']]):
         st.error("Faltan credenciales o internet.")
         return False
-    try:
-        Client(creds['SID'], creds['TOK']).messages.create(body=mensaje, from_=creds['FROM'], to=creds['TO'])
-        return True
-    except Exception as e:
-        st.error(f"Error envío: {e}")
-        return False
+    st.session_state.whatsapp_envios.append(encolar_whatsapp(mensaje, creds))
+    return True
 
 # --- LÓGICA DE EDICIÓN AVANZADA (Borrar, Añadir) ---
-def actualizar_datos_categoria(df_nuevo, categoria):
-    # 1. Convertir DF editado a diccionarios
-    nuevos_items = df_nuevo.to_dict('records')
+# Columnas del editor que se guardan (los tildes de 'Seleccionar' no se guardan)
+COLUMNAS_EDITABLES = ("Producto", "Cantidad", "Estado")
+
+def _normalizar_celda(col, valor):
+    # Asegurar consistencia
+    if col == "Producto": return valor if isinstance(valor, str) and valor else "Nuevo Item"
+    if col == "Cantidad": return valor if valor and not pd.isna(valor) else 1.0
+    return valor if valor in ESTADOS_AUDITORIA else "pdte."
+
+def actualizar_datos_categoria(df_vista, cambios, categoria):
+    # Aplica solo el delta del data_editor (edited_rows / deleted_rows / added_rows) sobre el almacén:
+    # el trabajo depende del tamaño del cambio, no de la auditoría. Las posiciones son las de df_vista.
+    aud = st.session_state.audit_data
+    # La vista puede mezclar categorías (búsqueda): cada operación marca como cambiada la categoría de su fila.
+    ids_vista = df_vista['id']
+    borradas = [p for p in cambios.get('deleted_rows', []) if p < len(ids_vista)]
+    hubo_cambio = False
     
-    # 2. Separar datos: Conservar todo lo que NO es de esta categoría
-    otros_items = [x for x in st.session_state.audit_data if x['Categoría'] != categoria]
+    for pos, celdas in cambios.get('edited_rows', {}).items():
+        fila = aud['indice'].get(ids_vista.iat[pos])
+        if fila is None or pos in borradas: continue
+        for col, valor in celdas.items():
+            if col not in COLUMNAS_EDITABLES: continue
+            valor = _normalizar_celda(col, valor)
+            if col == "Producto" and aud['productos'][fila] != valor: fijar_producto(aud, fila, valor)
+            elif col == "Cantidad" and aud['cantidad'][fila] != valor: fijar_cantidad(aud, fila, valor)
+            elif col == "Estado" and ESTADOS_AUDITORIA[aud['estado'][fila]] != valor: marcar_estado(aud, [fila], valor)
+            else: continue
+            hubo_cambio = True
     
-    # 3. Procesar los nuevos datos de ESTA categoría
-    items_procesados = []
-    for item in nuevos_items:
-        # Si agregaron fila nueva, generar ID
-        if not item.get('id') or pd.isna(item.get('id')):
-            item['id'] = str(uuid.uuid4())
-        
-        # Asegurar consistencia
-        item['Categoría'] = categoria
-        if not item.get('Producto'): item['Producto'] = "Nuevo Item"
-        if not item.get('Cantidad'): item['Cantidad'] = 1.0
-        if not item.get('Estado'): item['Estado'] = "pdte."
-            
-        items_procesados.append(item)
+    if borradas:
+        borrar_filas(aud, filas_de_ids(aud, [ids_vista.iat[p] for p in borradas]))
+        hubo_cambio = True
     
-    # 4. Reconstruir estado global
-    st.session_state.audit_data = otros_items + items_procesados
+    # Solo las filas agregadas reciben id nuevo
+    agregadas = cambios.get('added_rows', [])
+    if agregadas:
+        agregar_filas(aud, categoria, *[[_normalizar_celda(col, r.get(col)) for r in agregadas] for col in COLUMNAS_EDITABLES])
+        hubo_cambio = True
+    return hubo_cambio
 
 # NUEVO: Ocultar categoría sin borrar datos
 def ocultar_categoria(cat_target):
     st.session_state.cats_ocultas.add(cat_target)
+    registrar_evento("ocultar", cat_target)
     st.rerun()
 
 def restaurar_todas_categorias():
+    registrar_evento("mostrar", sorted(st.session_state.cats_ocultas))
     st.session_state.cats_ocultas.clear()
     st.rerun()
 
 def actualizar_categoria_masiva(cat_target, nuevo_estado):
-    for item in st.session_state.audit_data:
-        if item['Categoría'] == cat_target:
-            item['Estado'] = nuevo_estado
+    aud = st.session_state.audit_data
+    marcar_estado(aud, filas_de_categoria(aud, cat_target), nuevo_estado)
     st.rerun()
 
+# --- SUMA / RESTA DE LISTAS ---
+def titulo_de_lista(lista):
+    # La primera línea no vacía es el título si no es categoría ni producto
+    titulo_original = lista['titulo']
+    titulo = re.sub(r'[^\w\s]', '', titulo_original).strip().upper() or "SIN TITULO"
+    return titulo, titulo_original
+
+def operar_varias_listas(listas, signos):
+    titulos = [titulo_de_lista(lista) for lista in listas]
+
+    # Lógica para definir el título final
+    if titulos and titulos[0][0] != "SIN TITULO" and all(t == titulos[0][0] for t, _ in titulos):
+        # Si coinciden (ej. todas son "PEDIDO WEB"), conserva el título con emojis y formato
+        titulo_final = titulos[0][1]
+    else:
+        # Si son distintas o no tienen título claro, usamos uno genérico
+        titulo_final = "📋 *LISTA SUMADA*" if all(signo > 0 for signo in signos) else "📋 *LISTA RESTADA*"
+
+    # IMPORTANTE: solo quedan productos con cantidad mayor a 0 (y las categorías a las que les quedó alguno)
+    return texto_de_combinacion(*combinar_listas(listas, signos), titulo_final, solo_positivos=True)
+
+def operar_listas(l1, l2, es_suma=True):
+    return operar_varias_listas([parsear_lista(l1), parsear_lista(l2)], [1, 1 if es_suma else -1])
+
+# --- PERSISTENCIA DE LA SESIÓN (DIARIO + SNAPSHOT) ---
+# El diario y el snapshot están en persistencia.py; además de la auditoría se guardan las categorías ocultas y el
+# reporte de stock.
+def foto_de_sesion():
+    return {'cats_ocultas': sorted(st.session_state.cats_ocultas), 'stock_report_log': st.session_state.stock_report_log}
+
+def aplicar_foto(foto):
+    st.session_state.cats_ocultas = set(foto['cats_ocultas'])
+    st.session_state.stock_report_log = foto['stock_report_log']
+
+def aplicar_evento(evento):
+    tipo, args = evento[0], evento[1:]
+    if tipo == "ocultar": st.session_state.cats_ocultas.add(args[0])
+    elif tipo == "mostrar": st.session_state.cats_ocultas.difference_update(args[0])
+    elif tipo == "stock": st.session_state.stock_report_log.append(args[0])
+    elif tipo == "stock_quitar":
+        if st.session_state.stock_report_log: st.session_state.stock_report_log.pop()
+    elif tipo == "stock_vaciar": st.session_state.stock_report_log = []
+
+PERSISTENCIA = {'estados': ESTADOS_AUDITORIA, 'foto': foto_de_sesion, 'aplicar_foto': aplicar_foto, 'aplicar_evento': aplicar_evento}
+
 # --- UI PRINCIPAL ---
+iniciar_persistencia(PERSISTENCIA)
 # --- BUSCA ESTA LÍNEA Y REEMPLÁZALA POR ESTA NUEVA ---
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📄 Procesar", "➕ Sumar", "✅ Auditoría", "📊 Totales", "🆚 Comparar", "📦 Control Stock"])
 
@@ -331,107 +320,46 @@ tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📄 Procesar", "➕ Sumar", "✅
 with tab1:
     archivo = st.file_uploader("Subir PDF", type="pdf")
     if archivo:
-        df_res = procesar_pdf(archivo)
+        df_res = procesar_pdf_con_progreso(CATEGORIZADOR, archivo)
+        info = st.session_state.get('pdf_info') or {}
+        if info.get('formato') == 'caché': st.caption("⚡ Resultado desde caché")
+        elif info.get('formato'): st.caption(f"Formato: {info['formato']} · {info['filas']} filas · parseo {info['segundos'] * 1000:.0f} ms")
         if df_res is not None and not df_res.empty:
+            busqueda_pdf = st.text_input("🔎 Buscar en el PDF", key="pdf_busqueda", placeholder="Ej: aromatica uva")
+            if busqueda_pdf.strip():
+                encontradas = sorted(buscar_en_indice(st.session_state.pdf_indice, busqueda_pdf))
+                if encontradas: st.dataframe(df_res.iloc[encontradas], hide_index=True)
+                else: st.caption("Sin coincidencias.")
             msg = generar_mensaje_df(df_res)
             st.code(msg, language='text')
             if credentials['SID'] and st.button("Enviar WhatsApp"):
-                 if enviar_whatsapp(msg, credentials): st.success("Enviado")
+                 if enviar_whatsapp(msg, credentials): st.success("En cola")
+            mostrar_envios_whatsapp()
         else: st.error("Error al leer PDF.")
 
 # TAB 2 SUMAR
 with tab2:
     st.header("➕/➖ Operaciones con Listas")
-    l1 = st.text_area("Lista 1 (Base)", height=150, key="sum_l1")
-    l2 = st.text_area("Lista 2 (A sumar/restar)", height=150, key="sum_l2")
-    
-    col_b1, col_b2 = st.columns(2)
-    btn_sumar = col_b1.button("➕ Sumar Listas", use_container_width=True)
-    btn_restar = col_b2.button("➖ Restar Listas", use_container_width=True)
+    # La primera lista es la base; cada una de las demás (pegada o en .txt) elige si suma o resta
+    entradas = []
+    for i in range(st.session_state.sum_cantidad):
+        col_l, col_op = st.columns([5, 1])
+        etiqueta = "Lista 1 (Base)" if i == 0 else f"Lista {i + 1} (A sumar/restar)"
+        texto = col_l.text_area(etiqueta, height=150, key=f"sum_l{i + 1}")
+        op = col_op.radio("Op.", ["➕", "➖"], key=f"sum_op{i + 1}", disabled=i == 0)
+        entradas.append((texto, op))
+    if st.button("➕ Otra lista"):
+        st.session_state.sum_cantidad += 1
+        st.rerun()
+    archivos = st.file_uploader("Listas en .txt", type="txt", accept_multiple_files=True, key="sum_archivos")
+    for archivo in archivos or []:
+        op = st.radio(archivo.name, ["➕", "➖"], horizontal=True, key=f"sum_op_{archivo.file_id}")
+        entradas.append((archivo.getvalue().decode("utf-8", errors="replace"), op))
     
-    if btn_sumar or btn_restar:
-        es_suma = btn_sumar
-        
-        def parse_complex(txt):
-            d = {}
-            cat = "General"
-            titulo = ""
-            titulo_original = ""
-            lineas = txt.split('\n')
-            
-            # Intentar extraer el título de la primera línea no vacía
-            for linea in lineas:
-                if linea.strip():
-                    # Si no es categoría ni producto, asumimos que es título
-                    if not linea.strip().startswith("==") and " x " not in linea.lower():
-                        titulo = re.sub(r'[^\w\s]', '', linea).strip().upper()
-                        titulo_original = linea.strip()
-                    break
-            
-            if not titulo:
-                titulo = "SIN TITULO"
-                    
-            for linea in lineas:
-                linea = linea.strip()
-                if "==" in linea: 
-                    cat = linea.replace("==", "").strip()
-                elif " x " in linea.lower() or " X " in linea.upper():
-                    # Separar por la x sin importar mayúsculas
-                    if " x " in linea:
-                        p = linea.split(" x ", 1)
-                    else:
-                        p = linea.split(" X ", 1)
-                        
-                    if len(p) == 2:
-                        try:
-                            c = float(p[0])
-                            prod = p[1].strip()
-                            if cat not in d: d[cat] = {}
-                            d[cat][prod] = d[cat].get(prod, 0) + c
-                        except: pass
-            return d, titulo, titulo_original
-
-        d1, tit1, original_tit1 = parse_complex(l1)
-        d2, tit2, original_tit2 = parse_complex(l2)
-        
-        # Lógica para definir el título final
-        if tit1 and tit1 == tit2 and tit1 != "SIN TITULO":
-            # Si coinciden (ej. ambas son "PEDIDO WEB"), conserva el título con emojis y formato
-            titulo_final = original_tit1
-        else:
-            # Si son distintas o no tienen título claro, usamos uno genérico
-            titulo_final = "📋 *LISTA SUMADA*" if es_suma else "📋 *LISTA RESTADA*"
-            
-        total = {}
-        # Primero copiar L1 completa
-        for c, prods in d1.items():
-            total[c] = prods.copy()
-            
-        # Luego operar con L2
-        for c, prods in d2.items():
-            if c not in total: 
-                total[c] = {}
-            for p, qty in prods.items():
-                if es_suma:
-                    total[c][p] = total[c].get(p, 0) + qty
-                else:
-                    total[c][p] = total[c].get(p, 0) - qty
-        
-        # Generar texto final
-        txt_fin = f"{titulo_final}\n"
-        for c in sorted(total.keys()):
-            # IMPORTANTE: Filtrar para que solo queden productos con cantidad mayor a 0
-            items_validos = {p: q for p, q in total[c].items() if q > 0}
-            
-            # Solo agregar la categoría si le quedaron productos
-            if items_validos:
-                txt_fin += f"\n== {c} ==\n"
-                for p in sorted(items_validos.keys()):
-                    q = items_validos[p]
-                    q_fmt = int(q) if q.is_integer() else q
-                    txt_fin += f"{q_fmt} x {p}\n"
-                    
-        st.code(txt_fin)
+    if st.button("🧮 Calcular", use_container_width=True):
+        listas = [parsear_lista(texto) for texto, _ in entradas]
+        for lista in listas: mostrar_lineas_invalidas(lista)
+        st.code(operar_varias_listas(listas, [1 if op == "➕" else -1 for _, op in entradas]))
 # TAB 3: AUDITORÍA
 with tab3:
     st.header("🕵️ Auditoría")
@@ -440,90 +368,148 @@ with tab3:
         input_audit = st.text_area("Pega la lista aquí:", height=150)
         if st.button("🚀 Iniciar", type="primary"):
             if input_audit:
-                st.session_state.audit_data = preparar_datos_auditoria(input_audit)
+                st.session_state.audit_data = preparar_datos_auditoria(input_audit, ESTADOS_AUDITORIA)
+                st.session_state.audit_lista = parsear_lista(input_audit)
+                st.session_state.audit_started = True
+                guardar_snapshot(PERSISTENCIA)
+                st.rerun()
+
+        # Unirse a una auditoría que otro repositor ya compartió
+        codigo_unirse = st.text_input("🤝 Código de auditoría compartida", max_chars=6, placeholder="Ej: A1B2C3")
+        if st.button("Unirse") and codigo_unirse.strip():
+            aud_compartida = unirse_a_auditoria(codigo_unirse.strip().upper(), ESTADOS_AUDITORIA)
+            if aud_compartida is None: st.error("No hay ninguna auditoría compartida con ese código.")
+            else:
+                st.session_state.audit_data = aud_compartida
+                st.session_state.audit_lista = None
                 st.session_state.audit_started = True
+                guardar_snapshot(PERSISTENCIA)
                 st.rerun()
     else:
         col_act, col_reset = st.columns([3, 1])
         with col_reset:
             if st.button("🔄 Reiniciar Todo"):
                 st.session_state.audit_started = False
-                st.session_state.audit_data = []
+                st.session_state.audit_data = None
+                st.session_state.audit_lista = None
+                st.session_state.audit_vistas.clear()
                 st.session_state.cats_ocultas.clear()
+                guardar_snapshot(PERSISTENCIA)
+                st.rerun()
+
+        # Auditoría compartida: código para los demás y vigilancia de cambios ajenos
+        compartida = (st.session_state.audit_data or {}).get('compartida')
+        if compartida:
+            st.caption(f"🤝 Compartida · código **{compartida['codigo']}** · versión {compartida['version']}")
+            vigilar_auditoria_compartida()
+        elif st.session_state.audit_data and st.button("🤝 Compartir auditoría"):
+            if compartir_auditoria(st.session_state.audit_data):
+                guardar_snapshot(PERSISTENCIA)
                 st.rerun()
+            else: st.error("No se pudo compartir la auditoría.")
         
-        if st.session_state.audit_data:
-            df_full = pd.DataFrame(st.session_state.audit_data)
-            categorias = sorted(df_full['Categoría'].unique())
+        if st.session_state.get('audit_lista'): mostrar_lineas_invalidas(st.session_state.audit_lista)
+        
+        aud = st.session_state.audit_data
+        if aud and contar_auditoria(aud)[1]:
+            categorias = categorias_auditoria(aud)
             
             cats_visibles = 0
-            for cat in categorias:
-                if cat in st.session_state.cats_ocultas:
-                    continue
-                
-                cats_visibles += 1
-                df_cat = df_full[df_full['Categoría'] == cat].copy()
-                df_cat.reset_index(drop=True, inplace=True)
-                
-                # Inyectamos una columna temporal para los tildes
-                df_cat.insert(0, "Seleccionar", False)
-                
-                safe_key = f"ed_{re.sub(r'[^a-zA-Z0-9]', '', cat)}"
-                
-                with st.expander(f"📂 {cat} ({len(df_cat)})", expanded=False):
-                    # BARRA DE HERRAMIENTAS
-                    mc1, mc2, mc3, mc4 = st.columns([1, 1, 1, 1])
-                    if mc1.button("Todo Ped.", key=f"bp_{safe_key}"):
-                        actualizar_categoria_masiva(cat, "ped.")
-                    if mc2.button("Todo Rep.", key=f"br_{safe_key}"):
-                        actualizar_categoria_masiva(cat, "rep.")
-                    if mc3.button("Reset", key=f"brst_{safe_key}"):
-                        actualizar_categoria_masiva(cat, "pdte.")
-                    
-                    if mc4.button("🔒 Listo", key=f"hide_{safe_key}", help="Ocultar esta categoría"):
-                        ocultar_categoria(cat)
-                    
-                    # TABLA EDITABLE CON CHECKBOX
-                    edited_df_cat = st.data_editor(
-                        df_cat,
+            # Búsqueda en toda la auditoría (también en categorías ocultas): mientras tenga texto reemplaza a las categorías
+            busqueda = st.text_input("🔎 Buscar producto", key="audit_busqueda", placeholder="Ej: aromatica uva")
+            if busqueda.strip():
+                filas_encontradas = buscar_filas_auditoria(aud, busqueda)
+                if not len(filas_encontradas): st.caption("Sin coincidencias.")
+                else:
+                    if len(filas_encontradas) > BUSQUEDA_MAX_FILAS:
+                        st.caption(f"{len(filas_encontradas)} coincidencias, se muestran las primeras {BUSQUEDA_MAX_FILAS}: agregá otra palabra para acotar.")
+                    df_busqueda = df_de_filas(aud, filas_encontradas[:BUSQUEDA_MAX_FILAS])
+                    # La clave cambia con la búsqueda y con cualquier cambio del almacén, así el delta siempre es sobre esta vista
+                    firma = hashlib.sha1(repr((busqueda, sorted(aud['version'].items()))).encode()).hexdigest()[:12]
+                    clave_busqueda = f"ed_busqueda_{firma}"
+                    st.data_editor(
+                        df_busqueda,
                         column_config={
-                            "Seleccionar": st.column_config.CheckboxColumn("✔", width="small"),
                             "_index": None,
+                            "Categoría": st.column_config.TextColumn("Cat", disabled=True),
                             "Estado": st.column_config.SelectboxColumn("Est", options=["pdte.", "ped.", "rep."], required=True, width="small"),
                             "Cantidad": st.column_config.NumberColumn("Cant", min_value=0, width="small"),
                             "Producto": st.column_config.TextColumn("Producto"),
-                            "Categoría": None,
                             "id": None
                         },
                         hide_index=True,
                         use_container_width=True,
-                        num_rows="dynamic", 
-                        key=safe_key
+                        key=clave_busqueda
                     )
+                    if actualizar_datos_categoria(df_busqueda, st.session_state[clave_busqueda], None):
+                        st.rerun()
+            else:
+                for cat in categorias:
+                    if cat in st.session_state.cats_ocultas:
+                        continue
+                    
+                    cats_visibles += 1
+                    safe_key = f"ed_{re.sub(r'[^a-zA-Z0-9]', '', cat)}"
+                    
+                    # Solo se arma el contenido de las categorías abiertas: el expander avisa (rerun) al abrirse o cerrarse
+                    expander = st.expander(f"📂 {cat} ({len(filas_de_categoria(aud, cat))})", key=f"exp_{safe_key}", on_change="rerun")
+                    if not expander.open:
+                        continue
+                    
+                    # DataFrame con la columna temporal para los tildes, rearmado solo si la categoría cambió
+                    df_cat = vista_de_categoria(aud, cat)
                     
-                    # LÓGICA DE EDICIÓN MULTIPLE (Evita el teclado en el celular)
-                    filas_seleccionadas = edited_df_cat[edited_df_cat["Seleccionar"] == True]
-                    if not filas_seleccionadas.empty:
-                        st.caption("Acción para ítems seleccionados:")
-                        bc1, bc2, bc3 = st.columns([1, 1, 2])
-                        ids_seleccionados = filas_seleccionadas["id"].tolist()
+                    with expander:
+                        # BARRA DE HERRAMIENTAS
+                        mc1, mc2, mc3, mc4 = st.columns([1, 1, 1, 1])
+                        if mc1.button("Todo Ped.", key=f"bp_{safe_key}"):
+                            actualizar_categoria_masiva(cat, "ped.")
+                        if mc2.button("Todo Rep.", key=f"br_{safe_key}"):
+                            actualizar_categoria_masiva(cat, "rep.")
+                        if mc3.button("Reset", key=f"brst_{safe_key}"):
+                            actualizar_categoria_masiva(cat, "pdte.")
                         
-                        if bc1.button("📦 Ped.", key=f"mped_{safe_key}", type="primary"):
-                            for item in st.session_state.audit_data:
-                                if item["id"] in ids_seleccionados: item["Estado"] = "ped."
-                            st.rerun()
-                        if bc2.button("✅ Rep.", key=f"mrep_{safe_key}", type="primary"):
-                            for item in st.session_state.audit_data:
-                                if item["id"] in ids_seleccionados: item["Estado"] = "rep."
+                        if mc4.button("🔒 Listo", key=f"hide_{safe_key}", help="Ocultar esta categoría"):
+                            ocultar_categoria(cat)
+                        
+                        # TABLA EDITABLE CON CHECKBOX
+                        st.data_editor(
+                            df_cat,
+                            column_config={
+                                "Seleccionar": st.column_config.CheckboxColumn("✔", width="small"),
+                                "_index": None,
+                                "Estado": st.column_config.SelectboxColumn("Est", options=["pdte.", "ped.", "rep."], required=True, width="small"),
+                                "Cantidad": st.column_config.NumberColumn("Cant", min_value=0, width="small"),
+                                "Producto": st.column_config.TextColumn("Producto"),
+                                "Categoría": None,
+                                "id": None
+                            },
+                            hide_index=True,
+                            use_container_width=True,
+                            num_rows="dynamic", 
+                            key=safe_key
+                        )
+                        
+                        # Delta del editor: {edited_rows, added_rows, deleted_rows} con posiciones de df_cat
+                        cambios = st.session_state[safe_key]
+                        
+                        # LÓGICA DE EDICIÓN MULTIPLE (Evita el teclado en el celular)
+                        ids_seleccionados = [df_cat["id"].iat[p] for p, celdas in cambios["edited_rows"].items()
+                                             if celdas.get("Seleccionar") and p not in cambios["deleted_rows"]]
+                        if ids_seleccionados:
+                            st.caption("Acción para ítems seleccionados:")
+                            bc1, bc2, bc3 = st.columns([1, 1, 2])
+                            
+                            if bc1.button("📦 Ped.", key=f"mped_{safe_key}", type="primary"):
+                                marcar_estado(aud, filas_de_ids(aud, ids_seleccionados), "ped.")
+                                st.rerun()
+                            if bc2.button("✅ Rep.", key=f"mrep_{safe_key}", type="primary"):
+                                marcar_estado(aud, filas_de_ids(aud, ids_seleccionados), "rep.")
+                                st.rerun()
+
+                        # Los tildes de 'Seleccionar' no se guardan; el resto del delta va directo al almacén
+                        if actualizar_datos_categoria(df_cat, cambios, cat):
                             st.rerun()
-
-                    # Limpiamos la columna 'Seleccionar' antes de guardar los datos reales
-                    df_para_guardar = edited_df_cat.drop(columns=["Seleccionar"])
-                    df_original = df_cat.drop(columns=["Seleccionar"])
-                    
-                    if not df_original.equals(df_para_guardar):
-                        actualizar_datos_categoria(df_para_guardar, cat)
-                        st.rerun()
             
             # GESTIÓN SELECTIVA DE CATEGORÍAS OCULTAS
             if len(st.session_state.cats_ocultas) > 0:
@@ -539,13 +525,14 @@ with tab3:
                     if st.button("👁️ Restaurar") and cats_a_restaurar:
                         for c in cats_a_restaurar:
                             st.session_state.cats_ocultas.remove(c)
+                        registrar_evento("mostrar", cats_a_restaurar)
                         st.rerun()
             
-            if cats_visibles == 0 and len(categorias) > 0:
+            if not busqueda.strip() and cats_visibles == 0 and len(categorias) > 0:
                 st.success("🎉 ¡Todas las categorías han sido revisadas!")
 
         st.divider()
-        lp, lr, lpen = generar_listas_finales(st.session_state.audit_data)
+        lp, lr, lpen = generar_listas_finales(st.session_state.audit_data, ESTADOS_LISTAS_FINALES)
         ft1, ft2, ft3 = st.tabs(["📉 Pedido", "✅ Repuesto", "❌ Pendientes"])
         with ft1: st.code(formatear_lista_texto(lp, "Pedido Web"))
         with ft2: st.code(formatear_lista_texto(lr, "Repuesto Hoy"))
@@ -554,45 +541,38 @@ with tab3:
 with tab4:
     st.header("Totales")
     list_input_totales = st.text_area("Lista para sumar:", height=150, key="tot_input")
+    recategorizar = st.checkbox("Categorizar las líneas General", key="tot_recat")
     if st.button("Calcular"):
-        totales = {} 
-        cat = "General"
-        for line in list_input_totales.split('\n'):
-            line = line.strip()
-            if "==" in line: cat = line.replace("==", "").strip()
-            elif " x " in line:
-                try:
-                    p = line.split(" x ", 1); qty = float(p[0])
-                    totales[cat] = totales.get(cat, 0) + qty
-                except: pass
+        mostrar_lineas_invalidas(parsear_lista(list_input_totales))
+        totales = calcular_totales(CATEGORIZADOR, list_input_totales, recategorizar)
         txt = ""
-        for c, q in totales.items():
-            q_fmt = int(q) if q.is_integer() else q
-            txt += f"{c}: {q_fmt}\n"
+        for c, q in zip(totales['por_categoria']["Categoria"], totales['por_categoria']["Cantidad"].tolist()):
+            txt += f"{c}: {formatear_cantidad(q)}\n"
+        txt += f"TOTAL: {formatear_cantidad(totales['total'])}\n"
         st.code(txt)
+        with st.expander("Por producto"): st.dataframe(totales['por_producto'], hide_index=True)
+        st.download_button("Descargar CSV", csv_de_totales(totales), file_name="totales.csv", mime="text/csv")
 
 # TAB 5
 with tab5:
     st.header("Comparador")
     ca = st.text_area("Lista A", height=150, key="ca")
     cb = st.text_area("Lista B", height=150, key="cb")
+    por_categoria = st.checkbox("Separar por categoría", key="cp_cat")
     if st.button("Comparar"):
-        def parse_c(t):
-            d = {}
-            for l in t.split('\n'):
-                if " x " in l: p = l.split(" x ", 1); d[p[1].strip().upper()] = float(p[0])
-            return d
-        da = parse_c(ca); db = parse_c(cb)
-        falta = {k: v for k, v in da.items() if k not in db}
-        sobra = {k: v for k, v in db.items() if k not in da}
-        dif = {k: (v, db[k]) for k, v in da.items() if k in db and v != db[k]}
-        t1, t2, t3 = st.tabs([f"Faltan ({len(falta)})", f"Sobran ({len(sobra)})", f"Dif ({len(dif)})"])
-        with t1:
-             for k,v in falta.items(): st.write(f"- {v} x {k}")
-        with t2:
-             for k,v in sobra.items(): st.write(f"- {v} x {k}")
-        with t3:
-             for k,v in dif.items(): st.write(f"**{k}**: {v[0]} -> {v[1]}")
+        mostrar_lineas_invalidas(parsear_lista(ca))
+        mostrar_lineas_invalidas(parsear_lista(cb))
+        comparacion = comparar_listas(LIMPIEZA, ca, cb, por_categoria)
+        falta, sobra, dif = comparacion['faltan'], comparacion['sobran'], comparacion['diferencias']
+        parecidos = comparacion['parecidos']
+        if por_categoria: st.dataframe(comparacion['resumen'], hide_index=True)
+        t1, t2, t3, t4 = st.tabs([f"Faltan ({len(falta)})", f"Sobran ({len(sobra)})", f"Dif ({len(dif)})",
+                                  f"Parecidos ({len(parecidos)})"])
+        with t1: mostrar_comparacion(falta, "- {Cantidad} x {Producto}", por_categoria, st.write)
+        with t2: mostrar_comparacion(sobra, "- {Cantidad} x {Producto}", por_categoria, st.write)
+        with t3: mostrar_comparacion(dif, "**{Producto}**: {Esperado} -> {Llegó}", por_categoria, st.write)
+        with t4: mostrar_comparacion(parecidos, "- {Esperado} x {Producto} ≈ {Llegó} x {Parecido} ({Confianza:.0%})",
+                                     por_categoria, st.write)
 # --- TAB 6: CONTROL DE STOCK ---
 with tab6:
     st.header("Generador de Reporte de Stock")
@@ -636,12 +616,14 @@ with tab6:
                     "hora": pd.Timestamp.now().strftime("%H:%M")
                 }
                 st.session_state.stock_report_log.append(nuevo_item)
+                registrar_evento("stock", nuevo_item)
                 st.toast(f"Artículo '{nom_art}' agregado.")
 
         # Botón para limpiar si te equivocas
         if st.button("🗑️ Borrar último ingreso"):
             if st.session_state.stock_report_log:
                 st.session_state.stock_report_log.pop()
+                registrar_evento("stock_quitar")
                 st.rerun()
 
     with col_output:
@@ -684,9 +666,13 @@ with tab6:
             # Botón para limpiar todo al terminar el día
             if st.button("🔄 Reiniciar Reporte Diario"):
                 st.session_state.stock_report_log = []
+                registrar_evento("stock_vaciar")
                 st.rerun()
 st.caption("Modo Offline Seguro - v49")
 
+# Lo que cambió en esta corrida va al diario de la sesión
+guardar_diario(PERSISTENCIA)
+
 
 
 
@@ -1,10 +1,18 @@
 import streamlit as st
-import pandas as pd
-import re
-from pypdf import PdfReader
-from twilio.rest import Client
+import numpy as np
 import logging
-import uuid
+import hashlib
+from productos import compilar_clasificador, compilar_limpieza
+from lector_pdf import procesar_pdf_con_progreso
+from listas import (parsear_lista, mostrar_lineas_invalidas, formatear_lista_texto, generar_mensaje_df,
+                    combinar_listas, texto_de_combinacion, calcular_totales, csv_de_totales)
+from busqueda import buscar_en_indice
+from whatsapp import encolar_whatsapp, mostrar_envios_whatsapp
+from comparador import comparar_listas, mostrar_comparacion
+from persistencia import guardar_snapshot, guardar_diario, iniciar_persistencia
+from auditoria import (preparar_datos_auditoria, generar_listas_finales, filas_de_categoria, marcar_estado,
+                       fijar_cantidad, buscar_filas_auditoria, categorias_auditoria, contar_auditoria,
+                       formatear_cantidad, compartir_auditoria, unirse_a_auditoria, vigilar_auditoria_compartida)
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -108,9 +116,15 @@ st.markdown("""
 
 # --- GESTIÓN DE ESTADO ---
 if 'audit_data' not in st.session_state:
-    st.session_state.audit_data = [] 
+    st.session_state.audit_data = None
 if 'audit_started' not in st.session_state:
     st.session_state.audit_started = False
+if 'audit_paginas' not in st.session_state:
+    st.session_state.audit_paginas = {}
+if 'sum_cantidad' not in st.session_state:
+    st.session_state.sum_cantidad = 2
+if 'whatsapp_envios' not in st.session_state:
+    st.session_state.whatsapp_envios = []
 
 # --- CREDENCIALES ---
 def cargar_credenciales():
@@ -136,44 +150,41 @@ credentials = cargar_credenciales()
 
 # --- CATEGORIAS ---
 CATEGORIAS = {
-    'textil_disney': {'pattern': lambda p: "TEXTIL" in p and "DISNEY" in p, 'emoji': "🏰", 'nombre': "Textiles Disney", 'prioridad': 0.1},
-    'difusor_disney': {'pattern': lambda p: "DIFUSOR" in p and "DISNEY" in p, 'emoji': "🏰", 'nombre': "Difusores Disney", 'prioridad': 0.2},
-    'tarjeta': {'pattern': lambda p: "TARJETA" in p and "AROMATICA" in p, 'emoji': "💳", 'nombre': "Tarjetas Aromáticas", 'prioridad': 0.5},
-    'sahumerio_saphirus': {'pattern': lambda p: "SAHUMERIO" in p and "SAPHIRUS" in p and not any(x in p for x in ["AMBAR", "HIMALAYA", "HIERBAS"]), 'emoji': "🧘‍♂️", 'nombre': "Sahumerios Saphirus", 'prioridad': 14.5},
-    'touch_dispositivo': {'pattern': lambda p: "DISPOSITIVO" in p and "TOUCH" in p, 'emoji': "🖱️", 'nombre': "Dispositivos Touch", 'prioridad': 1},
-    'touch_repuesto': {'pattern': lambda p: ("REPUESTO" in p and "TOUCH" in p) or "GR/13" in p, 'emoji': "🔄", 'nombre': "Repuestos de Touch", 'prioridad': 2},
-    'perfume_mini': {'pattern': lambda p: "MINI MILANO" in p, 'emoji': "🧴", 'nombre': "Perfume Mini Milano", 'prioridad': 3},
-    'perfume_parfum': {'pattern': lambda p: "PARFUM" in p, 'emoji': "🧴", 'nombre': "Parfum / Perfumes", 'prioridad': 4},
-    'shiny_general': {'pattern': lambda p: "SHINY" in p and ("LIMPIAVIDRIOS" in p or "DESENGRASANTE" in p or "LUSTRAMUEBLE" in p), 'emoji': "✨", 'nombre': "Shiny General", 'prioridad': 5},
-    'ambar_aerosol': {'pattern': lambda p: "AMBAR" in p and "AEROSOL" in p, 'emoji': "🔸", 'nombre': "Aerosoles Ambar", 'prioridad': 6},
-    'ambar_textil': {'pattern': lambda p: "AMBAR" in p and ("TEXTIL" in p or "150 ML" in p), 'emoji': "🔸", 'nombre': "Textiles Ambar", 'prioridad': 7},
-    'ambar_sahumerio': {'pattern': lambda p: "AMBAR" in p and "SAHUMERIO" in p, 'emoji': "🔸", 'nombre': "Sahumerios Ambar", 'prioridad': 8},
-    'ambar_varios': {'pattern': lambda p: "AMBAR" in p, 'emoji': "🔸", 'nombre': "Línea Ambar Varios", 'prioridad': 9},
-    'home_spray': {'pattern': lambda p: "HOME SPRAY" in p or "500 ML" in p or "500ML" in p, 'emoji': "🏠", 'nombre': "Home Spray", 'prioridad': 10},
-    'aparatos': {'pattern': lambda p: "APARATO" in p or "HORNILLO" in p, 'emoji': "⚙️", 'nombre': "Aparatos", 'prioridad': 11},
-    'premium': {'pattern': lambda p: "PREMIUM" in p, 'emoji': "💎", 'nombre': "Difusores Premium", 'prioridad': 12},
-    'sahumerio_hierbas': {'pattern': lambda p: "SAHUMERIO" in p and "HIERBAS" in p, 'emoji': "🌿", 'nombre': "Sahumerios Hierbas", 'prioridad': 13},
-    'sahumerio_himalaya': {'pattern': lambda p: "SAHUMERIO" in p and "HIMALAYA" in p, 'emoji': "🏔️", 'nombre': "Sahumerios Himalaya", 'prioridad': 14},
-    'sahumerio_varios': {'pattern': lambda p: "SAHUMERIO" in p, 'emoji': "🧘", 'nombre': "Sahumerios Varios", 'prioridad': 15},
-    'auto_caritas': {'pattern': lambda p: "CARITAS" in p, 'emoji': "😎", 'nombre': "Autos - Caritas", 'prioridad': 16},
-    'auto_ruta': {'pattern': lambda p: "RUTA" in p or "RUTA 66" in p, 'emoji': "🛣️", 'nombre': "Autos - Ruta 66", 'prioridad': 17},
-    'auto_varios': {'pattern': lambda p: "AUTO" in p, 'emoji': "🚗", 'nombre': "Autos - Varios", 'prioridad': 18},
-    'textil_mini': {'pattern': lambda p: "TEXTIL" in p and "MINI" in p, 'emoji': "🤏", 'nombre': "Textiles Mini", 'prioridad': 19},
-    'textil': {'pattern': lambda p: "TEXTIL" in p, 'emoji': "👕", 'nombre': "Textiles Saphirus", 'prioridad': 20},
-    'aerosol': {'pattern': lambda p: "AEROSOL" in p, 'emoji': "💨", 'nombre': "Aerosoles Saphirus", 'prioridad': 21},
-    'difusor': {'pattern': lambda p: "DIFUSOR" in p or "VARILLA" in p, 'emoji': "🎍", 'nombre': "Difusores", 'prioridad': 22},
-    'vela': {'pattern': lambda p: "VELA" in p, 'emoji': "🕯️", 'nombre': "Velas", 'prioridad': 23},
-    'aceite': {'pattern': lambda p: "ACEITE" in p, 'emoji': "💧", 'nombre': "Aceites", 'prioridad': 24},
-    'antihumedad': {'pattern': lambda p: "ANTIHUMEDAD" in p, 'emoji': "💧", 'nombre': "Antihumedad", 'prioridad': 25},
-    'limpiador': {'pattern': lambda p: "LIMPIADOR" in p, 'emoji': "🧼", 'nombre': "Limpiadores Multisuperficies", 'prioridad': 26},
+    'textil_disney': {'claves': [("TEXTIL", "DISNEY")], 'emoji': "🏰", 'nombre': "Textiles Disney", 'prioridad': 0.1},
+    'difusor_disney': {'claves': [("DIFUSOR", "DISNEY")], 'emoji': "🏰", 'nombre': "Difusores Disney", 'prioridad': 0.2},
+    'tarjeta': {'claves': [("TARJETA", "AROMATICA")], 'emoji': "💳", 'nombre': "Tarjetas Aromáticas", 'prioridad': 0.5},
+    'sahumerio_saphirus': {'claves': [("SAHUMERIO", "SAPHIRUS")], 'excluye': ("AMBAR", "HIMALAYA", "HIERBAS"), 'emoji': "🧘‍♂️", 'nombre': "Sahumerios Saphirus", 'prioridad': 14.5},
+    'touch_dispositivo': {'claves': [("DISPOSITIVO", "TOUCH")], 'emoji': "🖱️", 'nombre': "Dispositivos Touch", 'prioridad': 1},
+    'touch_repuesto': {'claves': [("REPUESTO", "TOUCH"), ("GR/13",)], 'emoji': "🔄", 'nombre': "Repuestos de Touch", 'prioridad': 2},
+    'perfume_mini': {'claves': [("MINI MILANO",)], 'emoji': "🧴", 'nombre': "Perfume Mini Milano", 'prioridad': 3},
+    'perfume_parfum': {'claves': [("PARFUM",)], 'emoji': "🧴", 'nombre': "Parfum / Perfumes", 'prioridad': 4},
+    'shiny_general': {'claves': [("SHINY", "LIMPIAVIDRIOS"), ("SHINY", "DESENGRASANTE"), ("SHINY", "LUSTRAMUEBLE")], 'emoji': "✨", 'nombre': "Shiny General", 'prioridad': 5},
+    'ambar_aerosol': {'claves': [("AMBAR", "AEROSOL")], 'emoji': "🔸", 'nombre': "Aerosoles Ambar", 'prioridad': 6},
+    'ambar_textil': {'claves': [("AMBAR", "TEXTIL"), ("AMBAR", "150 ML")], 'emoji': "🔸", 'nombre': "Textiles Ambar", 'prioridad': 7},
+    'ambar_sahumerio': {'claves': [("AMBAR", "SAHUMERIO")], 'emoji': "🔸", 'nombre': "Sahumerios Ambar", 'prioridad': 8},
+    'ambar_varios': {'claves': [("AMBAR",)], 'emoji': "🔸", 'nombre': "Línea Ambar Varios", 'prioridad': 9},
+    'home_spray': {'claves': [("HOME SPRAY",), ("500 ML",), ("500ML",)], 'emoji': "🏠", 'nombre': "Home Spray", 'prioridad': 10},
+    'aparatos': {'claves': [("APARATO",), ("HORNILLO",)], 'emoji': "⚙️", 'nombre': "Aparatos", 'prioridad': 11},
+    'premium': {'claves': [("PREMIUM",)], 'emoji': "💎", 'nombre': "Difusores Premium", 'prioridad': 12},
+    'sahumerio_hierbas': {'claves': [("SAHUMERIO", "HIERBAS")], 'emoji': "🌿", 'nombre': "Sahumerios Hierbas", 'prioridad': 13},
+    'sahumerio_himalaya': {'claves': [("SAHUMERIO", "HIMALAYA")], 'emoji': "🏔️", 'nombre': "Sahumerios Himalaya", 'prioridad': 14},
+    'sahumerio_varios': {'claves': [("SAHUMERIO",)], 'emoji': "🧘", 'nombre': "Sahumerios Varios", 'prioridad': 15},
+    'auto_caritas': {'claves': [("CARITAS",)], 'emoji': "😎", 'nombre': "Autos - Caritas", 'prioridad': 16},
+    'auto_ruta': {'claves': [("RUTA",), ("RUTA 66",)], 'emoji': "🛣️", 'nombre': "Autos - Ruta 66", 'prioridad': 17},
+    'auto_varios': {'claves': [("AUTO",)], 'emoji': "🚗", 'nombre': "Autos - Varios", 'prioridad': 18},
+    'textil_mini': {'claves': [("TEXTIL", "MINI")], 'emoji': "🤏", 'nombre': "Textiles Mini", 'prioridad': 19},
+    'textil': {'claves': [("TEXTIL",)], 'emoji': "👕", 'nombre': "Textiles Saphirus", 'prioridad': 20},
+    'aerosol': {'claves': [("AEROSOL",)], 'emoji': "💨", 'nombre': "Aerosoles Saphirus", 'prioridad': 21},
+    'difusor': {'claves': [("DIFUSOR",), ("VARILLA",)], 'emoji': "🎍", 'nombre': "Difusores", 'prioridad': 22},
+    'vela': {'claves': [("VELA",)], 'emoji': "🕯️", 'nombre': "Velas", 'prioridad': 23},
+    'aceite': {'claves': [("ACEITE",)], 'emoji': "💧", 'nombre': "Aceites", 'prioridad': 24},
+    'antihumedad': {'claves': [("ANTIHUMEDAD",)], 'emoji': "💧", 'nombre': "Antihumedad", 'prioridad': 25},
+    'limpiador': {'claves': [("LIMPIADOR",)], 'emoji': "🧼", 'nombre': "Limpiadores Multisuperficies", 'prioridad': 26},
 }
 
-def detectar_categoria(producto):
-    p = producto.upper()
-    for key, config in sorted(CATEGORIAS.items(), key=lambda x: x[1]['prioridad']):
-        if config['pattern'](p):
-            return f"{config['emoji']} {config['nombre']}"
-    return "📦 Varios"
+# --- CLASIFICADOR COMPILADO ---
+CLASIFICADOR = compilar_clasificador(CATEGORIAS)
+
 
 # --- REGLAS DE LIMPIEZA ---
 REGLAS_LIMPIEZA = {
@@ -202,236 +213,176 @@ REGLAS_LIMPIEZA = {
     'difusor': [(r"^DIFUSOR AROMATICO\s*[-–]?\s*", ""), (r"^DIFUSOR\s*[-–]?\s*", ""), (r"\s*[-–]?\s*VARILLA.*$", "")],
 }
 
-def aplicar_reglas(texto, reglas):
-    resultado = texto.upper()
-    for patron, reemplazo in reglas:
-        resultado = re.sub(patron, reemplazo, resultado, flags=re.IGNORECASE)
-    return re.sub(r"\s+", " ", resultado).strip()
+MAPEO_LIMPIEZA = {
+    "Textiles Disney": 'textil_disney', "Difusores Disney": 'difusor_disney', "Tarjetas Aromáticas": 'tarjeta', 
+    "Sahumerios Saphirus": 'sahumerio_saphirus', "Shiny General": 'shiny_general', "Limpiadores": 'limpiadores', 
+    "Difusores Premium": 'premium', "Aceites": 'aceites', "Sahumerios Ambar": 'sahumerio_ambar', 
+    "Repuestos de Touch": 'repuesto_touch', "Dispositivos Touch": 'dispositivo_touch', "Antihumedad": 'antihumedad', 
+    "Perfume": 'perfumes', "Parfum": 'perfumes', "Aparatos": 'aparatos', "Sahumerios": 'sahumerio_tipo', 
+    "Home Spray": 'home_spray', "Textiles Mini": 'textil_mini', "Textiles": 'textil', "Autos": 'autos', 
+    "Aerosoles": 'aerosol', "Difusores": 'difusor', "Velas": 'velas',
+}
 
-def limpiar_producto_por_categoria(row):
-    cat = row["Categoria"]
-    nom = row["Producto"]
-    
-    mapeo = {
-        "Textiles Disney": 'textil_disney', "Difusores Disney": 'difusor_disney', "Tarjetas Aromáticas": 'tarjeta', 
-        "Sahumerios Saphirus": 'sahumerio_saphirus', "Shiny General": 'shiny_general', "Limpiadores": 'limpiadores', 
-        "Difusores Premium": 'premium', "Aceites": 'aceites', "Sahumerios Ambar": 'sahumerio_ambar', 
-        "Repuestos de Touch": 'repuesto_touch', "Dispositivos Touch": 'dispositivo_touch', "Antihumedad": 'antihumedad', 
-        "Perfume": 'perfumes', "Parfum": 'perfumes', "Aparatos": 'aparatos', "Sahumerios": 'sahumerio_tipo', 
-        "Home Spray": 'home_spray', "Textiles Mini": 'textil_mini', "Textiles": 'textil', "Autos": 'autos', 
-        "Aerosoles": 'aerosol', "Difusores": 'difusor', "Velas": 'velas',
-    }
-    
-    for key, regla in mapeo.items():
-        if key in cat:
-            if regla == 'shiny_general': return aplicar_reglas(nom, REGLAS_LIMPIEZA['shiny_general'])
-            if regla == 'aparatos':
-                 res = aplicar_reglas(nom, REGLAS_LIMPIEZA['aparatos'])
-                 if res == nom: res = res.replace("APARATO ANALOGICO DECO", "ANALOGICO")
-                 return res
-            
-            resultado = aplicar_reglas(nom, REGLAS_LIMPIEZA.get(regla, []))
-            resultado = aplicar_reglas(resultado, REGLAS_LIMPIEZA['general'])
-            if "Touch" in cat and "REPUESTO NEGRO" in resultado: resultado = resultado.replace("REPUESTO NEGRO", "NEGRO + REPUESTO")
-            return resultado if len(resultado) >= 2 else nom
-            
-    return aplicar_reglas(nom, REGLAS_LIMPIEZA['general'])
-
-# --- PROCESAMIENTO PDF ---
-def extraer_texto_pdf(archivo):
-    try:
-        reader = PdfReader(archivo)
-        texto = "".join([p.extract_text() for p in reader.pages if p.extract_text()])
-        return texto.replace("\n", " ")
-    except Exception: return None
-
-def parsear_datos(texto):
-    datos = []
-    matches = re.findall(r'"\s*(\d{8})\s*"\s*,\s*"\s*([-0-9,]+)\s+([^"]+)"', texto)
-    if not matches:
-        matches = re.findall(r'(\d{8})\s+([-0-9]+,\d{2})\s+(.*?)(?=\s\d{1,3}(?:\.\d{3})*,\d{2})', texto)
-    for m in matches:
-        datos.append({"ID": m[0], "Cantidad": m[1], "Producto": m[2].strip()})
-    return datos
-
-def limpiar_dataframe(df):
-    df["Cantidad"] = df["Cantidad"].apply(lambda x: float(x.replace(",", ".")) if isinstance(x, str) else x)
-    df["Producto"] = df["Producto"].apply(lambda x: re.sub(r'^\d{8}\s*', '', x.strip()))
-    df = df[df["Cantidad"] > 0]
-    df["Categoria"] = df["Producto"].apply(detectar_categoria)
-    df["Producto"] = df.apply(limpiar_producto_por_categoria, axis=1)
-    return df.groupby(["Categoria", "Producto"], as_index=False)["Cantidad"].sum()
-
-def procesar_pdf(archivo):
-    try:
-        texto = extraer_texto_pdf(archivo)
-        if not texto: return None
-        datos = parsear_datos(texto)
-        if not datos: return None
-        df = pd.DataFrame(datos)
-        return limpiar_dataframe(df)
-    except Exception as e:
-        logger.error(f"Error en procesar_pdf: {e}")
-        return None
+# --- MOTOR DE LIMPIEZA ---
+# Shiny General y Aparatos no pasan por la limpieza general
+LIMPIEZA = compilar_limpieza(REGLAS_LIMPIEZA, MAPEO_LIMPIEZA, sin_general=('shiny_general', 'aparatos'))
+
+# --- CATEGORIZADOR ---
+# Clasificador, limpieza y la huella de las reglas: si cambian CATEGORIAS o REGLAS_LIMPIEZA cambia la huella, y con ella
+# la caché de productos, el catálogo y la caché de PDFs que se usan.
+HUELLA_REGLAS = hashlib.sha1(repr((CATEGORIAS, REGLAS_LIMPIEZA, MAPEO_LIMPIEZA)).encode()).hexdigest()
+CATEGORIZADOR = {'clasificador': CLASIFICADOR, 'limpieza': LIMPIEZA, 'huella': HUELLA_REGLAS}
+
+# --- ESTADOS DE AUDITORÍA ---
+# Nombres de los estados (el almacén está en auditoria.py); el primero es el de arranque.
+ESTADOS_AUDITORIA = (None, 'pedido', 'repuesto', 'pendiente')
+# Estados que van a las listas finales (pedido web, repuesto hoy, pendientes); los sin marcar no van a ninguna
+ESTADOS_LISTAS_FINALES = ('pedido', 'repuesto', 'pendiente')
 
 # --- FUNCIONES AUDITORIA ---
-def preparar_datos_auditoria(texto_lista):
-    items = []
-    categoria_actual = "General"
-    lineas = texto_lista.split('\n')
-    for linea in lineas:
-        linea = linea.strip()
-        if not linea: continue
-        if linea.startswith("==") and linea.endswith("=="):
-            categoria_actual = linea.replace("==", "").strip()
-        elif " x " in linea:
-            try:
-                partes = linea.split(" x ", 1)
-                cant_str = partes[0].strip()
-                prod = partes[1].strip()
-                cant = float(cant_str) if '.' in cant_str else int(cant_str)
-                items.append({
-                    "id": str(uuid.uuid4()),
-                    "categoria": categoria_actual,
-                    "producto": prod,
-                    "cantidad": cant,
-                    "status": None 
-                })
-            except: continue
-    return items
+# Ítems por página en cada categoría: cada ítem son 5 columnas, 4 botones y un popover, y en el celular
+# lo que pesa es la cantidad de widgets, no el tamaño de la lista
+AUDIT_POR_PAGINA = 25
+ICONOS_ESTADO = {'pedido': "📦 ", 'repuesto': "✅ ", 'pendiente': "❌ "}
+
+def filas_pendientes(aud, categoria):
+    filas = filas_de_categoria(aud, categoria)
+    return filas[aud['estado'][filas] == 0]
+
+def items_de_filas(aud, filas):
+    return [{"id": int(aud['ids'][f]), "categoria": aud['categorias'][aud['categoria'][f]], "producto": aud['productos'][f],
+             "cantidad": formatear_cantidad(aud['cantidad'][f]), "status": ESTADOS_AUDITORIA[aud['estado'][f]]}
+            for f in np.asarray(filas).tolist()]
+
+def items_de_categoria(aud, categoria, solo_pendientes=False):
+    return items_de_filas(aud, filas_pendientes(aud, categoria) if solo_pendientes else filas_de_categoria(aud, categoria))
+
+def pagina_de_auditoria(aud, categoria, pagina):
+    # Solo los pendientes de la página pedida; la página se ajusta si los pendientes se achicaron
+    filas = filas_pendientes(aud, categoria)
+    paginas = max(1, -(-len(filas) // AUDIT_POR_PAGINA))
+    pagina = min(max(pagina, 0), paginas - 1)
+    inicio = pagina * AUDIT_POR_PAGINA
+    return items_de_filas(aud, filas[inicio:inicio + AUDIT_POR_PAGINA]), pagina, paginas, len(filas)
+
+def buscar_en_auditoria(aud, categoria, texto):
+    # Página del primer pendiente de la categoría que coincide con la búsqueda (None si no hay ninguno)
+    coincide = np.isin(filas_pendientes(aud, categoria), buscar_filas_auditoria(aud, texto))
+    return int(coincide.argmax()) // AUDIT_POR_PAGINA if coincide.any() else None
 
 def actualizar_estado(item_id, nuevo_estado):
-    for item in st.session_state.audit_data:
-        if item['id'] == item_id:
-            item['status'] = nuevo_estado
-            break
+    aud = st.session_state.audit_data
+    if item_id in aud['indice']: marcar_estado(aud, [aud['indice'][item_id]], nuevo_estado)
 
 def actualizar_categoria_completa(categoria, nuevo_estado):
-    for item in st.session_state.audit_data:
-        if item['categoria'] == categoria and item['status'] is None:
-            item['status'] = nuevo_estado
+    aud = st.session_state.audit_data
+    marcar_estado(aud, filas_de_categoria(aud, categoria), nuevo_estado, solo_pendientes=True)
 
 def actualizar_cantidad(item_id, nueva_cantidad):
-    for item in st.session_state.audit_data:
-        if item['id'] == item_id:
-            item['cantidad'] = nueva_cantidad
-            break
-
-def generar_listas_finales(data):
-    pedido_web = {} 
-    reponido = {}
-    pendiente = {}
-    for item in data:
-        cat = item['categoria']
-        linea = f"{item['cantidad']} x {item['producto']}"
-        if item['status'] == 'pedido':
-            if cat not in pedido_web: pedido_web[cat] = []
-            pedido_web[cat].append(linea)
-        elif item['status'] == 'repuesto':
-            if cat not in reponido: reponido[cat] = []
-            reponido[cat].append(linea)
-        elif item['status'] == 'pendiente':
-            if cat not in pendiente: pendiente[cat] = []
-            pendiente[cat].append(linea)
-    return pedido_web, reponido, pendiente
-
-def formatear_lista_texto(diccionario, titulo):
-    if not diccionario: return ""
-    txt = f"📋 *{titulo.upper()}*\n"
-    for cat in sorted(diccionario.keys()):
-        txt += f"\n== {cat} ==\n"
-        for prod in diccionario[cat]:
-            txt += f"{prod}\n"
-    return txt
-
-def generar_mensaje_df(df):
-    txt = "📋 *LISTA DE REPOSICIÓN*\n"
-    for c in sorted(df["Categoria"].unique()):
-        txt += f"\n== {c.upper()} ==\n"
-        for _, r in df[df["Categoria"] == c].sort_values("Producto").iterrows():
-            cant = int(r['Cantidad']) if r['Cantidad'].is_integer() else r['Cantidad']
-            txt += f"{cant} x {r['Producto']}\n"
-    return txt
+    aud = st.session_state.audit_data
+    if item_id in aud['indice']: fijar_cantidad(aud, aud['indice'][item_id], nueva_cantidad)
+
+def mostrar_item_auditoria(item, marca=""):
+    # 5 Columnas: Texto | Edit | Stock | Repuesto | Pendiente
+    c1, c2, c3, c4, c5 = st.columns([1, 1, 1, 1, 1])
+    
+    with c1:
+        st.markdown(f"<span style='font-weight:500;'>{marca}{item['cantidad']} x {item['producto']}</span>", unsafe_allow_html=True)
+    
+    # Botón de Edición (Popover)
+    with c2:
+        with st.popover("✏️"):
+            st.write(f"Editar: {item['producto']}")
+            new_qty = st.number_input("Cantidad", value=int(item['cantidad']), min_value=1, key=f"qty_{item['id']}")
+            if st.button("Guardar", key=f"save_{item['id']}"):
+                actualizar_cantidad(item['id'], new_qty)
+                st.rerun()
+    
+    # Botones de Acción
+    with c3:
+        if st.button("📦", key=f"p_{item['id']}"):
+            actualizar_estado(item['id'], 'pedido')
+            st.rerun()
+    with c4:
+        if st.button("✅", key=f"r_{item['id']}"):
+            actualizar_estado(item['id'], 'repuesto')
+            st.rerun()
+    with c5:
+        if st.button("❌", key=f"n_{item['id']}"):
+            actualizar_estado(item['id'], 'pendiente')
+            st.rerun()
 
+# --- WHATSAPP ---
+# La cola de envíos está en whatsapp.py; acá solo se validan las credenciales.
 def enviar_whatsapp(mensaje, creds):
     if not all([creds['SID'], creds['TOK'], creds['FROM'], creds['TO']]):
         st.error("Faltan credenciales")
         return False
-    try:
-        Client(creds['SID'], creds['TOK']).messages.create(body=mensaje, from_=creds['FROM'], to=creds['TO'])
-        return True
-    except Exception as e:
-        st.error(f"Error: {e}")
-        return False
+    st.session_state.whatsapp_envios.append(encolar_whatsapp(mensaje, creds))
+    return True
+
+# --- SUMA DE LISTAS ---
+def sumar_varias_listas(listas, signos):
+    # Si alguna resta, quedan solo los productos con cantidad mayor a 0
+    resta = any(signo < 0 for signo in signos)
+    encabezado = "📋 *LISTA RESTADA*" if resta else "📋 *LISTA SUMADA*"
+    return texto_de_combinacion(*combinar_listas(listas, signos), encabezado, solo_positivos=resta)
+
+def sumar_listas(l1, l2):
+    return sumar_varias_listas([parsear_lista(l1), parsear_lista(l2)], [1, 1])
 
-# --- PARSEADORES COMPARADOR ---
-def parsear_lista_para_comparar(texto):
-    items = {}
-    if not texto: return items
-    for line in texto.split('\n'):
-        if " x " in line:
-            try:
-                parts = line.split(" x ", 1)
-                qty = float(parts[0].strip())
-                prod = parts[1].strip().upper() 
-                items[prod] = items.get(prod, 0) + qty
-            except: continue
-    return items
+# --- PERSISTENCIA DE LA SESIÓN (DIARIO + SNAPSHOT) ---
+# El diario y el snapshot están en persistencia.py; esta app solo guarda la auditoría.
+PERSISTENCIA = {'estados': ESTADOS_AUDITORIA}
 
 # --- UI PRINCIPAL ---
+iniciar_persistencia(PERSISTENCIA)
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["📄 Procesar PDF", "➕ Sumar Listas", "✅ Auditoría", "📊 Totales", "🆚 Comparador"])
 
 # TAB 1: PDF
 with tab1:
     archivo = st.file_uploader("Subir PDF", type="pdf")
     if archivo:
-        df_res = procesar_pdf(archivo)
+        df_res = procesar_pdf_con_progreso(CATEGORIZADOR, archivo)
+        info = st.session_state.get('pdf_info') or {}
+        if info.get('formato') == 'caché': st.caption("⚡ Resultado desde caché")
+        elif info.get('formato'): st.caption(f"Formato: {info['formato']} · {info['filas']} filas · parseo {info['segundos'] * 1000:.0f} ms")
         if df_res is not None and not df_res.empty:
+            busqueda_pdf = st.text_input("🔎 Buscar en el PDF", key="pdf_busqueda", placeholder="Ej: aromatica uva")
+            if busqueda_pdf.strip():
+                encontradas = sorted(buscar_en_indice(st.session_state.pdf_indice, busqueda_pdf))
+                if encontradas: st.dataframe(df_res.iloc[encontradas], hide_index=True)
+                else: st.caption("Sin coincidencias.")
             msg = generar_mensaje_df(df_res)
             st.code(msg, language='text')
             if len(msg) > 1500: st.warning("⚠️ Mensaje muy largo para WhatsApp directo.")
             else:
                 if st.button("Enviar PDF a WhatsApp"):
-                    if enviar_whatsapp(msg, credentials): st.success("Enviado")
+                    if enviar_whatsapp(msg, credentials): st.success("📨 En cola para enviar")
+            mostrar_envios_whatsapp()
         else: st.error("No se pudieron extraer datos.")
 
 # TAB 2: SUMA
 with tab2:
-    st.info("Pega dos listas para sumarlas.")
-    l1 = st.text_area("Lista 1", height=200, placeholder="1 x UVA...", key="sum_l1")
-    l2 = st.text_area("Lista 2", height=200, placeholder="1 x UVA...", key="sum_l2")
+    st.info("Pega o sube las listas a unificar. Cada una suma (➕) o resta (➖) sobre la primera.")
+    entradas = []
+    for i in range(st.session_state.sum_cantidad):
+        col_l, col_op = st.columns([5, 1])
+        texto = col_l.text_area(f"Lista {i + 1}", height=200, placeholder="1 x UVA...", key=f"sum_l{i + 1}")
+        op = col_op.radio("Op.", ["➕", "➖"], key=f"sum_op{i + 1}", disabled=i == 0)
+        entradas.append((texto, op))
+    if st.button("➕ Otra lista"):
+        st.session_state.sum_cantidad += 1
+        st.rerun()
+    archivos = st.file_uploader("Listas en .txt", type="txt", accept_multiple_files=True, key="sum_archivos")
+    for archivo in archivos or []:
+        op = st.radio(archivo.name, ["➕", "➖"], horizontal=True, key=f"sum_op_{archivo.file_id}")
+        entradas.append((archivo.getvalue().decode("utf-8", errors="replace"), op))
     
     if st.button("Unificar"):
-        def parse_simple(txt):
-            d = {}
-            cat = "General"
-            for line in txt.split('\n'):
-                line = line.strip()
-                if "==" in line: cat = line.replace("==", "").strip()
-                elif " x " in line:
-                    p = line.split(" x ", 1)
-                    try:
-                        c = float(p[0])
-                        prod = p[1]
-                        if cat not in d: d[cat] = {}
-                        d[cat][prod] = d[cat].get(prod, 0) + c
-                    except: pass
-            return d
-        d1 = parse_simple(l1)
-        d2 = parse_simple(l2)
-        total = d1.copy()
-        for c, prods in d2.items():
-            if c not in total: total[c] = {}
-            for p, qty in prods.items():
-                total[c][p] = total[c].get(p, 0) + qty
-        txt_fin = "📋 *LISTA SUMADA*\n"
-        for c in sorted(total.keys()):
-            txt_fin += f"\n== {c} ==\n"
-            for p in sorted(total[c].keys()):
-                q = total[c][p]
-                q_fmt = int(q) if q.is_integer() else q
-                txt_fin += f"{q_fmt} x {p}\n"
-        st.code(txt_fin, language='text')
+        listas = [parsear_lista(texto) for texto, _ in entradas]
+        for lista in listas: mostrar_lineas_invalidas(lista)
+        st.code(sumar_varias_listas(listas, [1 if op == "➕" else -1 for _, op in entradas]), language='text')
 
 # TAB 3: AUDITORÍA
 with tab3:
@@ -441,90 +392,132 @@ with tab3:
         input_audit = st.text_area("Pega la lista generada aquí:", height=200, placeholder="== CATEGORIA ==\n1 x PRODUCTO")
         if st.button("🚀 Comenzar Auditoría", type="primary"):
             if input_audit:
-                st.session_state.audit_data = preparar_datos_auditoria(input_audit)
+                st.session_state.audit_data = preparar_datos_auditoria(input_audit, ESTADOS_AUDITORIA)
+                st.session_state.audit_lista = parsear_lista(input_audit)
                 st.session_state.audit_started = True
+                guardar_snapshot(PERSISTENCIA)
                 st.rerun()
             else: st.warning("Pega una lista primero")
+
+        # Unirse a una auditoría que otro repositor ya compartió
+        codigo_unirse = st.text_input("🤝 Código de auditoría compartida", max_chars=6, placeholder="Ej: A1B2C3")
+        if st.button("Unirse") and codigo_unirse.strip():
+            aud_compartida = unirse_a_auditoria(codigo_unirse.strip().upper(), ESTADOS_AUDITORIA)
+            if aud_compartida is None: st.error("No hay ninguna auditoría compartida con ese código.")
+            else:
+                st.session_state.audit_data = aud_compartida
+                st.session_state.audit_lista = None
+                st.session_state.audit_started = True
+                guardar_snapshot(PERSISTENCIA)
+                st.rerun()
     else:
         if st.button("🔄 Reiniciar Auditoría", type="secondary"):
             st.session_state.audit_started = False
-            st.session_state.audit_data = []
+            st.session_state.audit_data = None
+            st.session_state.audit_lista = None
+            st.session_state.audit_paginas.clear()
+            guardar_snapshot(PERSISTENCIA)
             st.rerun()
+
+        # Auditoría compartida: código para los demás y vigilancia de cambios ajenos
+        compartida = (st.session_state.audit_data or {}).get('compartida')
+        if compartida:
+            st.caption(f"🤝 Compartida · código **{compartida['codigo']}** · versión {compartida['version']}")
+            vigilar_auditoria_compartida()
+        elif st.session_state.audit_data and st.button("🤝 Compartir auditoría"):
+            if compartir_auditoria(st.session_state.audit_data):
+                guardar_snapshot(PERSISTENCIA)
+                st.rerun()
+            else: st.error("No se pudo compartir la auditoría.")
+        
+        if st.session_state.get('audit_lista'): mostrar_lineas_invalidas(st.session_state.audit_lista)
             
-        completed_count = len([x for x in st.session_state.audit_data if x['status']])
-        total_items = len(st.session_state.audit_data)
+        aud = st.session_state.audit_data
+        completed_count, total_items = contar_auditoria(aud)
         if total_items > 0: st.progress(completed_count / total_items)
         
         st.markdown("---")
         
-        all_cats = sorted(list(set([x['categoria'] for x in st.session_state.audit_data])))
-        cats_pendientes = []
-        for c in all_cats:
-            if any(x['categoria'] == c and x['status'] is None for x in st.session_state.audit_data):
-                cats_pendientes.append(c)
+        all_cats = categorias_auditoria(aud)
+        cats_pendientes = [c for c in all_cats if (aud['estado'][filas_de_categoria(aud, c)] == 0).any()]
 
         if not cats_pendientes and total_items > 0:
              st.success("🎉 ¡Auditoría Completada! Revisa los resultados abajo.")
 
-        for cat in cats_pendientes:
-            with st.expander(f"📂 {cat}", expanded=False):
-                # Barra de Acción Masiva (Ajustada para 5 columnas simulando la estructura de abajo)
-                st.markdown(f"<div style='background-color:#f9f9f9; padding: 5px 0; border-radius:5px; margin-bottom:5px; border-bottom: 1px solid #ddd;'>", unsafe_allow_html=True)
-                
-                # Usamos 5 columnas para alinear
-                cb_info, cb_blank, cb1, cb2, cb3 = st.columns([1, 1, 1, 1, 1]) 
-                
-                with cb_info:
-                    st.markdown(f"<small style='color:#666; padding-left: 4px; line-height: 50px;'><b>{cat}</b></small>", unsafe_allow_html=True)
-                # cb_blank se deja vacía para alinear con el botón de editar
-                with cb1:
-                    if st.button("📦📉", key=f"all_ped_{cat}", help="Todos Sin Stock"):
-                        actualizar_categoria_completa(cat, 'pedido')
-                        st.rerun()
-                with cb2:
-                    if st.button("✅", key=f"all_rep_{cat}", help="Todos Repuestos"):
-                        actualizar_categoria_completa(cat, 'repuesto')
-                        st.rerun()
-                with cb3:
-                    if st.button("❌", key=f"all_pen_{cat}", help="Todos Pendientes"):
-                        actualizar_categoria_completa(cat, 'pendiente')
-                        st.rerun()
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-                items_visibles = [x for x in st.session_state.audit_data if x['categoria'] == cat and x['status'] is None]
-                
-                for item in items_visibles:
-                    # 5 Columnas: Texto | Edit | Stock | Repuesto | Pendiente
-                    c1, c2, c3, c4, c5 = st.columns([1, 1, 1, 1, 1])
-                    
-                    with c1:
-                        st.markdown(f"<span style='font-weight:500;'>{item['cantidad']} x {item['producto']}</span>", unsafe_allow_html=True)
+        # Búsqueda en toda la auditoría (cualquier categoría y estado): mientras tenga texto reemplaza a las categorías
+        busqueda_global = st.text_input("🔎 Buscar producto", key="audit_busqueda", placeholder="Ej: aromatica uva")
+        if busqueda_global.strip():
+            filas_encontradas = buscar_filas_auditoria(aud, busqueda_global)
+            if not len(filas_encontradas): st.caption("Sin coincidencias.")
+            elif len(filas_encontradas) > AUDIT_POR_PAGINA:
+                st.caption(f"{len(filas_encontradas)} coincidencias, se muestran las primeras {AUDIT_POR_PAGINA}: agregá otra palabra para acotar.")
+            cat_actual = None
+            for item in sorted(items_de_filas(aud, filas_encontradas[:AUDIT_POR_PAGINA]), key=lambda it: it['categoria']):
+                if item['categoria'] != cat_actual:
+                    cat_actual = item['categoria']
+                    st.caption(f"📂 {cat_actual}")
+                mostrar_item_auditoria(item, ICONOS_ESTADO.get(item['status'], ""))
+        else:
+            for cat in cats_pendientes:
+                # Solo se arman los widgets de las categorías abiertas: el expander avisa (rerun) al abrirse o cerrarse
+                expander = st.expander(f"📂 {cat}", key=f"exp_{cat}", on_change="rerun")
+                if not expander.open:
+                    continue
+                with expander:
+                    # Barra de Acción Masiva (Ajustada para 5 columnas simulando la estructura de abajo)
+                    st.markdown(f"<div style='background-color:#f9f9f9; padding: 5px 0; border-radius:5px; margin-bottom:5px; border-bottom: 1px solid #ddd;'>", unsafe_allow_html=True)
                     
-                    # Botón de Edición (Popover)
-                    with c2:
-                        with st.popover("✏️"):
-                            st.write(f"Editar: {item['producto']}")
-                            new_qty = st.number_input("Cantidad", value=int(item['cantidad']), min_value=1, key=f"qty_{item['id']}")
-                            if st.button("Guardar", key=f"save_{item['id']}"):
-                                actualizar_cantidad(item['id'], new_qty)
-                                st.rerun()
+                    # Usamos 5 columnas para alinear
+                    cb_info, cb_blank, cb1, cb2, cb3 = st.columns([1, 1, 1, 1, 1]) 
                     
-                    # Botones de Acción
-                    with c3:
-                        if st.button("📦", key=f"p_{item['id']}"):
-                            actualizar_estado(item['id'], 'pedido')
+                    with cb_info:
+                        st.markdown(f"<small style='color:#666; padding-left: 4px; line-height: 50px;'><b>{cat}</b></small>", unsafe_allow_html=True)
+                    # cb_blank se deja vacía para alinear con el botón de editar
+                    with cb1:
+                        if st.button("📦📉", key=f"all_ped_{cat}", help="Todos Sin Stock"):
+                            actualizar_categoria_completa(cat, 'pedido')
                             st.rerun()
-                    with c4:
-                        if st.button("✅", key=f"r_{item['id']}"):
-                            actualizar_estado(item['id'], 'repuesto')
+                    with cb2:
+                        if st.button("✅", key=f"all_rep_{cat}", help="Todos Repuestos"):
+                            actualizar_categoria_completa(cat, 'repuesto')
                             st.rerun()
-                    with c5:
-                        if st.button("❌", key=f"n_{item['id']}"):
-                            actualizar_estado(item['id'], 'pendiente')
+                    with cb3:
+                        if st.button("❌", key=f"all_pen_{cat}", help="Todos Pendientes"):
+                            actualizar_categoria_completa(cat, 'pendiente')
                             st.rerun()
+                    st.markdown("</div>", unsafe_allow_html=True)
+                    
+                    # Los botones de arriba actúan sobre toda la categoría; abajo solo se dibuja la página actual
+                    paginacion = st.session_state.audit_paginas.setdefault(cat, {'pagina': 0, 'busqueda': "", 'encontrado': True})
+                    busqueda = st.text_input("🔎 Ir a producto", key=f"buscar_{cat}", placeholder="Parte del nombre...")
+                    if busqueda != paginacion['busqueda']:
+                        # Solo se busca cuando cambia el texto: salta a la página del primer pendiente que coincide
+                        pagina_encontrada = buscar_en_auditoria(aud, cat, busqueda)
+                        paginacion['busqueda'], paginacion['encontrado'] = busqueda, pagina_encontrada is not None or not busqueda.strip()
+                        if pagina_encontrada is not None: paginacion['pagina'] = pagina_encontrada
+                    if not paginacion['encontrado']: st.caption("Sin coincidencias entre los pendientes.")
+                    
+                    items_visibles, paginacion['pagina'], total_paginas, n_pendientes = pagina_de_auditoria(aud, cat, paginacion['pagina'])
+                    
+                    if total_paginas > 1:
+                        pg_ant, pg_info, pg_sig = st.columns([1, 2, 1])
+                        with pg_ant:
+                            if st.button("◀️", key=f"pag_ant_{cat}", disabled=paginacion['pagina'] == 0):
+                                paginacion['pagina'] -= 1
+                                st.rerun()
+                        with pg_info:
+                            st.caption(f"Página {paginacion['pagina'] + 1} de {total_paginas} · {n_pendientes} pendientes")
+                        with pg_sig:
+                            if st.button("▶️", key=f"pag_sig_{cat}", disabled=paginacion['pagina'] == total_paginas - 1):
+                                paginacion['pagina'] += 1
+                                st.rerun()
+                    
+                    marcadas = set(buscar_filas_auditoria(aud, busqueda).tolist()) if busqueda.strip() else set()
+                    for item in items_visibles:
+                        mostrar_item_auditoria(item, "🔎 " if aud['indice'][item['id']] in marcadas else "")
 
         st.header("📊 Listas Finales")
-        lp, lr, lpen = generar_listas_finales(st.session_state.audit_data)
+        lp, lr, lpen = generar_listas_finales(aud, ESTADOS_LISTAS_FINALES)
         
         ft1, ft2, ft3 = st.tabs(["📉 Pedido", "✅ Repuesto", "❌ Pendiente"])
         
@@ -542,44 +535,26 @@ with tab4:
     
     list_input_totales = st.text_area("Pega la lista aquí:", height=300, placeholder="== CATEGORIA ==\n1 x PRODUCTO...")
     
+    recategorizar = st.checkbox("Categorizar líneas sin categoría", value=True, key="tot_recategorizar",
+                                help="Las líneas sin encabezado (== CATEGORIA ==) se clasifican por el nombre del producto")
+    
     if st.button("🔢 Calcular Totales", type="primary", use_container_width=True):
         if list_input_totales:
-            totales = {} 
-            categoria_actual = None 
-            lines = list_input_totales.split('\n')
-            
-            for line in lines:
-                line = line.strip()
-                if not line: continue
-                
-                if line.startswith("==") and line.endswith("=="):
-                    categoria_actual = line.replace("==", "").strip()
-                    continue
-                
-                if " x " in line:
-                    try:
-                        parts = line.split(" x ", 1)
-                        qty = float(parts[0].strip())
-                        prod_name = parts[1].strip()
-                        
-                        if categoria_actual:
-                            cat = categoria_actual
-                        else:
-                            cat = detectar_categoria(prod_name)
-                        
-                        totales[cat] = totales.get(cat, 0) + qty
-                    except:
-                        continue
+            mostrar_lineas_invalidas(parsear_lista(list_input_totales))
+            totales = calcular_totales(CATEGORIZADOR, list_input_totales, recategorizar)
             
-            if totales:
+            if totales['lineas']:
                 st.subheader("📋 Detalle por Categoría")
                 texto_reporte = ""
-                for cat in sorted(totales.keys()):
-                    q = totales[cat]
-                    q_fmt = int(q) if q.is_integer() else q
-                    texto_reporte += f"{cat}: {q_fmt}\n\n"
+                for cat, q in zip(totales['por_categoria']["Categoria"], totales['por_categoria']["Cantidad"].tolist()):
+                    texto_reporte += f"{cat}: {formatear_cantidad(q)}\n\n"
+                texto_reporte += f"TOTAL: {formatear_cantidad(totales['total'])}"
                 
                 st.code(texto_reporte, language='text')
+                with st.expander(f"🔎 Detalle por producto ({len(totales['por_producto'])})"):
+                    st.dataframe(totales['por_producto'], hide_index=True, use_container_width=True)
+                st.download_button("⬇️ Descargar CSV", csv_de_totales(totales), file_name="totales.csv",
+                                   mime="text/csv", use_container_width=True)
             else:
                 st.warning("⚠️ No se encontraron productos válidos.")
         else:
@@ -591,50 +566,51 @@ with tab5:
     
     txt_a = st.text_area("Lista A (Referencia)", height=200, placeholder="1 x UVA...", key="comp_a")
     txt_b = st.text_area("Lista B (A Comparar)", height=200, placeholder="1 x UVA...", key="comp_b")
+    por_categoria = st.checkbox("Separar por categoría", key="comp_por_categoria",
+                                help="Compara categoría + producto: el mismo producto en dos categorías cuenta aparte")
         
     if st.button("🔍 Comparar", type="primary", use_container_width=True):
         if txt_a and txt_b:
-            dict_a = parsear_lista_para_comparar(txt_a)
-            dict_b = parsear_lista_para_comparar(txt_b)
-            
-            faltantes = {}
-            sobrantes = {}
-            diferencias = {}
-            
-            for prod, cant_a in dict_a.items():
-                if prod not in dict_b:
-                    faltantes[prod] = cant_a
-                elif dict_b[prod] != cant_a:
-                    diferencias[prod] = (cant_a, dict_b[prod])
+            mostrar_lineas_invalidas(parsear_lista(txt_a))
+            mostrar_lineas_invalidas(parsear_lista(txt_b))
+            comparacion = comparar_listas(LIMPIEZA, txt_a, txt_b, por_categoria)
+            faltantes = comparacion['faltan']
+            sobrantes = comparacion['sobran']
+            diferencias = comparacion['diferencias']
+            parecidos = comparacion['parecidos']
+            if por_categoria: st.dataframe(comparacion['resumen'], hide_index=True)
             
-            for prod, cant_b in dict_b.items():
-                if prod not in dict_a:
-                    sobrantes[prod] = cant_b
-            
-            c1, c2, c3 = st.tabs(["❌ Faltantes", "➕ Sobrantes", "⚠️ Diferencias"])
+            c1, c2, c3, c4 = st.tabs(["❌ Faltantes", "➕ Sobrantes", "⚠️ Diferencias", "🔗 Parecidos"])
             
             with c1:
-                if faltantes:
+                if len(faltantes):
                     st.error(f"Faltan {len(faltantes)} productos")
-                    for p, c in faltantes.items():
-                        st.markdown(f"- {c} x {p}")
+                    mostrar_comparacion(faltantes, "- {Cantidad} x {Producto}", por_categoria)
                 else: st.success("No hay faltantes")
                 
             with c2:
-                if sobrantes:
+                if len(sobrantes):
                     st.warning(f"Sobran {len(sobrantes)} productos")
-                    for p, c in sobrantes.items():
-                        st.markdown(f"- {c} x {p}")
+                    mostrar_comparacion(sobrantes, "- {Cantidad} x {Producto}", por_categoria)
                 else: st.success("No hay sobrantes")
                 
             with c3:
-                if diferencias:
+                if len(diferencias):
                     st.info(f"Diferencias en {len(diferencias)} productos")
-                    for p, (es, re) in diferencias.items():
-                        st.markdown(f"**{p}**: Esperado {es} ➡️ Llegó {re}")
+                    mostrar_comparacion(diferencias, "**{Producto}**: Esperado {Esperado} ➡️ Llegó {Llegó}", por_categoria)
                 else: st.success("Cantidades coinciden")
+                
+            with c4:
+                if len(parecidos):
+                    st.info(f"{len(parecidos)} productos con nombre parecido (se tomaron como el mismo)")
+                    mostrar_comparacion(parecidos, "- {Esperado} x {Producto} ≈ {Llegó} x {Parecido} · confianza {Confianza:.0%}",
+                                        por_categoria)
+                else: st.success("No hubo nombres parecidos")
         else:
             st.warning("Pega ambas listas para comparar")
 
 st.markdown("---")
 st.caption("Repositor Saphirus 40.0")
+
+# Lo que cambió en esta corrida va al diario de la sesión
+guardar_diario(PERSISTENCIA)
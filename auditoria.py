@@ -0,0 +1,383 @@
+# --- AUDITORÍA ---
+# Compartido por app.py y app-saphirus.py: el almacén es el mismo, cada app pasa sus propios nombres de estados.
+import streamlit as st
+import numpy as np
+import uuid
+import sqlite3
+import threading
+import logging
+import os
+
+from productos import DATOS_DIR
+from busqueda import crear_indice, indexar, desindexar, buscar_en_indice
+from listas import parsear_lista, categorias_de_lista
+
+logger = logging.getLogger(__name__)
+
+# --- ALMACÉN DE AUDITORÍA ---
+# La auditoría vive en session_state como columnas: estado (int8, índice en 'estados'), cantidad (float64) y
+# código de categoría en arrays, más un índice id -> fila y categoría -> filas. Al crearla las filas de cada categoría
+# quedan contiguas (en el orden de la lista), así un cambio suelto es O(1) y los cambios por categoría o por conjunto
+# de ids son una sola asignación vectorizada. Las filas borradas solo se marcan; los arrays crecen al doble si hace falta.
+# Los ids son enteros (int64): al crearla el id de cada fila es su número de fila, y las filas agregadas llevan
+# 'prefijo' + fila (0 en una auditoría local, bits altos al azar por operador en una compartida, para no chocar).
+# 'version' sube por categoría con cada cambio, para saber qué hay que volver a dibujar. 'busqueda' es el índice de
+# búsqueda por fila y se mantiene al agregar, borrar o renombrar. Cada operación deja su evento en 'diario' (pendientes
+# de escribir en el diario de la sesión) para poder reconstruir la auditoría después de un corte. 'listas' guarda las
+# líneas de las listas finales por categoría y versión. 'estados' son los nombres de los estados de cada app (el
+# primero es el de arranque); no va en la foto, se pasa al importar.
+
+def crear_auditoria(categorias, productos, cantidades, estados):
+    nombres = list(dict.fromkeys(categorias))
+    codigo = {c: i for i, c in enumerate(nombres)}
+    cods = np.fromiter((codigo[c] for c in categorias), dtype=np.int32, count=len(categorias))
+    orden = np.argsort(cods, kind="stable")
+    cods = cods[orden]
+    limites = np.searchsorted(cods, np.arange(len(nombres) + 1)).tolist()
+    n = len(cods)
+    productos = [productos[i] for i in orden.tolist()]
+    return {
+        'base': uuid.uuid4().hex[:12],
+        'prefijo': 0,
+        'n': n,
+        'ids': np.arange(n, dtype=np.int64),
+        'productos': productos,
+        'categoria': cods,
+        'cantidad': np.asarray(cantidades, dtype=np.float64)[orden],
+        'estado': np.zeros(n, dtype=np.int8),
+        'viva': np.ones(n, dtype=bool),
+        'categorias': nombres,
+        'codigo': codigo,
+        'indice': {i: i for i in range(n)},
+        'filas_categoria': {c: np.arange(limites[i], limites[i + 1]) for i, c in enumerate(nombres)},
+        'version': {c: 0 for c in nombres},
+        'busqueda': crear_indice(range(n), productos),
+        'diario': [],
+        'listas': {},
+        'estados': estados,
+    }
+
+def _tocar_categorias(aud, filas):
+    for c in np.unique(aud['categoria'][filas]).tolist():
+        aud['version'][aud['categorias'][c]] += 1
+
+def filas_de_ids(aud, ids):
+    indice = aud['indice']
+    return np.fromiter((indice[i] for i in ids if i in indice), dtype=np.intp)
+
+def filas_de_categoria(aud, categoria):
+    return aud['filas_categoria'].get(categoria, np.empty(0, dtype=np.intp))
+
+def marcar_estado(aud, filas, estado, solo_pendientes=False):
+    filas = np.asarray(filas, dtype=np.intp)
+    if solo_pendientes: filas = filas[aud['estado'][filas] == 0]
+    if not len(filas): return
+    aud['estado'][filas] = aud['estados'].index(estado)
+    _tocar_categorias(aud, filas)
+    aud['diario'].append(["estado", filas.tolist(), estado])
+
+def fijar_cantidad(aud, fila, cantidad):
+    aud['cantidad'][fila] = cantidad
+    _tocar_categorias(aud, [fila])
+    aud['diario'].append(["cantidad", int(fila), float(cantidad)])
+
+def fijar_producto(aud, fila, producto):
+    aud['productos'][fila] = producto
+    indexar(aud['busqueda'], fila, producto)
+    _tocar_categorias(aud, [fila])
+    aud['diario'].append(["producto", int(fila), producto])
+
+def _asegurar_capacidad(aud, extra):
+    capacidad = len(aud['estado'])
+    if aud['n'] + extra <= capacidad: return
+    nueva = max(2 * capacidad, aud['n'] + extra, 16)
+    for col in ('ids', 'categoria', 'cantidad', 'estado', 'viva'):
+        arr = np.zeros(nueva, dtype=aud[col].dtype)
+        arr[:aud['n']] = aud[col][:aud['n']]
+        aud[col] = arr
+
+def agregar_filas(aud, categoria, productos, cantidades, estados, ids=None):
+    k = len(productos)
+    if categoria not in aud['codigo']:
+        aud['codigo'][categoria] = len(aud['categorias'])
+        aud['categorias'].append(categoria)
+        aud['filas_categoria'][categoria] = np.empty(0, dtype=np.intp)
+        aud['version'][categoria] = 0
+    _asegurar_capacidad(aud, k)
+    inicio = aud['n']
+    filas = np.arange(inicio, inicio + k)
+    # Las filas nunca se reutilizan, así que prefijo + fila no choca con ningún id anterior
+    ids = [aud['prefijo'] + f if i is None else i for i, f in zip(ids or [None] * k, filas.tolist())]
+    aud['ids'][filas] = ids
+    aud['categoria'][filas] = aud['codigo'][categoria]
+    aud['cantidad'][filas] = cantidades
+    aud['estado'][filas] = [aud['estados'].index(e) for e in estados]
+    aud['viva'][filas] = True
+    aud['productos'].extend(productos)
+    aud['indice'].update(zip(ids, filas.tolist()))
+    for f, prod in zip(filas.tolist(), productos): indexar(aud['busqueda'], f, prod)
+    aud['filas_categoria'][categoria] = np.concatenate((aud['filas_categoria'][categoria], filas))
+    aud['n'] += k
+    aud['version'][categoria] += 1
+    aud['diario'].append(["agregar", categoria, list(productos), [float(q) for q in cantidades], list(estados), ids])
+    return ids
+
+def borrar_filas(aud, filas):
+    filas = np.asarray(filas, dtype=np.intp)
+    if not len(filas): return
+    aud['viva'][filas] = False
+    for f, id_art in zip(filas.tolist(), aud['ids'][filas].tolist()):
+        aud['indice'].pop(id_art, None)
+        desindexar(aud['busqueda'], f)
+    for c in np.unique(aud['categoria'][filas]).tolist():
+        nombre = aud['categorias'][c]
+        actuales = aud['filas_categoria'][nombre]
+        aud['filas_categoria'][nombre] = actuales[aud['viva'][actuales]]
+        aud['version'][nombre] += 1
+    aud['diario'].append(["borrar", filas.tolist()])
+
+def exportar_auditoria(aud):
+    # Foto completa para el snapshot (JSON): solo las columnas, los índices se rearman al importar
+    n = aud['n']
+    return {'base': aud['base'], 'prefijo': aud['prefijo'], 'ids': aud['ids'][:n].tolist(), 'productos': aud['productos'],
+            'categorias': aud['categorias'],
+            'categoria': aud['categoria'][:n].tolist(), 'cantidad': aud['cantidad'][:n].tolist(),
+            'estado': aud['estado'][:n].tolist(), 'viva': aud['viva'][:n].tolist()}
+
+def importar_auditoria(foto, estados):
+    n = len(foto['ids'])
+    categoria = np.asarray(foto['categoria'], dtype=np.int32)
+    viva = np.asarray(foto['viva'], dtype=bool)
+    vivas = np.flatnonzero(viva)
+    ids = foto['ids']
+    # Las fotos viejas tenían ids de texto ("base-fila"): se renumeran por fila
+    ids = np.arange(n, dtype=np.int64) if ids and isinstance(ids[0], str) else np.asarray(ids, dtype=np.int64)
+    return {
+        'base': foto['base'],
+        'prefijo': foto.get('prefijo', 0),
+        'n': n,
+        'ids': ids,
+        'productos': foto['productos'],
+        'categoria': categoria,
+        'cantidad': np.asarray(foto['cantidad'], dtype=np.float64),
+        'estado': np.asarray(foto['estado'], dtype=np.int8),
+        'viva': viva,
+        'categorias': foto['categorias'],
+        'codigo': {c: i for i, c in enumerate(foto['categorias'])},
+        'indice': dict(zip(ids[vivas].tolist(), vivas.tolist())),
+        # Las filas de cada categoría están siempre en orden creciente (las agregadas van al final)
+        'filas_categoria': {c: vivas[categoria[vivas] == i] for i, c in enumerate(foto['categorias'])},
+        'version': {c: 0 for c in foto['categorias']},
+        'busqueda': crear_indice(vivas.tolist(), [foto['productos'][f] for f in vivas.tolist()]),
+        'diario': [],
+        'listas': {},
+        'estados': estados,
+    }
+
+def buscar_filas_auditoria(aud, consulta):
+    # Filas que coinciden, de cualquier categoría; ordenadas por fila, que dentro de cada categoría es su orden
+    return np.sort(np.fromiter(buscar_en_indice(aud['busqueda'], consulta), dtype=np.intp))
+
+def categorias_auditoria(aud):
+    return sorted(c for c, filas in aud['filas_categoria'].items() if len(filas))
+
+def contar_auditoria(aud):
+    vivas = aud['viva'][:aud['n']]
+    return int((aud['estado'][:aud['n']][vivas] != 0).sum()), int(vivas.sum())
+
+def formatear_cantidad(q):
+    # Las cantidades se guardan como número, no como el texto de la lista: una entera sale sin decimales ("2 x", también
+    # si la lista decía "2.0") en las dos apps, igual que en totales, sumas y el mensaje del PDF. Las apps originales
+    # repetían el texto ("2.0 x") en la auditoría.
+    return int(q) if float(q).is_integer() else float(q)
+
+def _lineas_de_categoria(aud, categoria):
+    # Líneas "cant x producto" de la categoría por estado, guardadas por versión: en cada rerun solo se rearman las
+    # categorías que cambiaron
+    version = aud['version'][categoria]
+    guardada = aud['listas'].get(categoria)
+    if guardada is not None and guardada[0] == version: return guardada[1]
+    filas = aud['filas_categoria'][categoria]
+    lineas = {}
+    for f, estado in zip(filas.tolist(), aud['estado'][filas].tolist()):
+        lineas.setdefault(estado, []).append(f"{formatear_cantidad(aud['cantidad'][f])} x {aud['productos'][f]}")
+    aud['listas'][categoria] = (version, lineas)
+    return lineas
+
+def generar_listas_finales(aud, destinos):
+    # Un dict {categoría: líneas} por cada estado de destinos, en ese orden; los demás estados no van a ninguna lista
+    listas = tuple({} for _ in destinos)
+    if not aud: return listas
+    indices = {aud['estados'].index(e): lista for e, lista in zip(destinos, listas)}
+    for cat in aud['filas_categoria']:
+        for estado, lineas in _lineas_de_categoria(aud, cat).items():
+            if estado in indices: indices[estado][cat] = lineas
+    return listas
+
+def preparar_datos_auditoria(texto_lista, estados):
+    # Todo arranca en el primer estado
+    lista = parsear_lista(texto_lista)
+    return crear_auditoria(categorias_de_lista(lista), lista['productos'], lista['cantidades'], estados)
+
+# --- AUDITORÍA COMPARTIDA (SQLite WAL) ---
+# Varios repositores trabajan la misma auditoría desde distintos teléfonos: las filas viven en SQLite (modo WAL, sirve
+# entre sesiones y procesos) con un código corto para unirse. Cada escritura sube la versión de la auditoría y estampa
+# esa versión en las filas que tocó. Los cambios locales salen de aud['diario'] y se suben con UPDATE ... WHERE
+# version = la que vimos: si otro la cambió antes, el cambio local pierde (conflicto) y queda el valor remoto. Cada
+# corrida baja solo las filas con versión mayor a la última vista. Al compartir o unirse cada operador usa su propio
+# prefijo de ids, así las filas que agrega no chocan con las de los demás. El estado se guarda por nombre (el de
+# aud['estados']; uno que la app no conoce vuelve al de arranque).
+AUDITORIAS_DB = os.path.join(DATOS_DIR, "auditorias.sqlite3")
+COMPARTIDAS_MAX_DIAS = 7
+SINCRONIZACION_SEGUNDOS = 5
+
+@st.cache_resource
+def obtener_auditorias_compartidas():
+    os.makedirs(DATOS_DIR, exist_ok=True)
+    con = sqlite3.connect(AUDITORIAS_DB, check_same_thread=False, timeout=10)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""CREATE TABLE IF NOT EXISTS auditorias (
+        codigo TEXT PRIMARY KEY, version INTEGER NOT NULL, creada TEXT DEFAULT CURRENT_TIMESTAMP)""")
+    con.execute("""CREATE TABLE IF NOT EXISTS filas (
+        codigo TEXT NOT NULL, id INTEGER NOT NULL, orden INTEGER NOT NULL, categoria TEXT NOT NULL, producto TEXT NOT NULL,
+        cantidad REAL NOT NULL, estado TEXT, viva INTEGER NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (codigo, id))""")
+    con.execute("CREATE INDEX IF NOT EXISTS filas_por_version ON filas (codigo, version)")
+    con.commit()
+    return {'con': con, 'lock': threading.Lock()}
+
+def _estado_de_nombre(estados, nombre):
+    return nombre if nombre in estados else estados[0]
+
+def _prefijo_de_operador():
+    # Bits altos al azar: las filas que agrega cada operador (prefijo + fila) no chocan con las de los demás
+    return (uuid.uuid4().int % (1 << 30) + 1) << 32
+
+def compartir_auditoria(aud):
+    try:
+        base = obtener_auditorias_compartidas()
+        vivas = np.flatnonzero(aud['viva'][:aud['n']]).tolist()
+        with base['lock'], base['con'] as con:
+            con.execute("DELETE FROM filas WHERE codigo IN (SELECT codigo FROM auditorias WHERE creada < datetime('now', ?))",
+                        (f"-{COMPARTIDAS_MAX_DIAS} days",))
+            con.execute("DELETE FROM auditorias WHERE creada < datetime('now', ?)", (f"-{COMPARTIDAS_MAX_DIAS} days",))
+            codigo = uuid.uuid4().hex[:6].upper()
+            while con.execute("SELECT 1 FROM auditorias WHERE codigo = ?", (codigo,)).fetchone():
+                codigo = uuid.uuid4().hex[:6].upper()
+            con.execute("INSERT INTO auditorias (codigo, version) VALUES (?, 1)", (codigo,))
+            con.executemany("INSERT INTO filas VALUES (?, ?, ?, ?, ?, ?, ?, 1, 1)",
+                            [(codigo, int(aud['ids'][f]), f, aud['categorias'][aud['categoria'][f]], aud['productos'][f],
+                              float(aud['cantidad'][f]), aud['estados'][aud['estado'][f]]) for f in vivas])
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"No se pudo compartir la auditoría: {e}")
+        return None
+    aud['compartida'] = {'codigo': codigo, 'version': 1, 'versiones': dict.fromkeys(aud['ids'][vivas].tolist(), 1)}
+    aud['prefijo'] = _prefijo_de_operador()
+    aud['diario'].clear()
+    return codigo
+
+def unirse_a_auditoria(codigo, estados):
+    try:
+        base = obtener_auditorias_compartidas()
+        with base['lock']:
+            fila = base['con'].execute("SELECT version FROM auditorias WHERE codigo = ?", (codigo,)).fetchone()
+            if fila is None: return None
+            filas = base['con'].execute("SELECT id, categoria, producto, cantidad, estado, version FROM filas "
+                                        "WHERE codigo = ? AND viva = 1 ORDER BY orden", (codigo,)).fetchall()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"No se pudo abrir la auditoría compartida {codigo}: {e}")
+        return None
+    categorias = list(dict.fromkeys(f[1] for f in filas))
+    codigo_cat = {c: i for i, c in enumerate(categorias)}
+    aud = importar_auditoria({
+        'base': uuid.uuid4().hex[:12], 'prefijo': _prefijo_de_operador(), 'ids': [f[0] for f in filas], 'productos': [f[2] for f in filas],
+        'categorias': categorias, 'categoria': [codigo_cat[f[1]] for f in filas], 'cantidad': [f[3] for f in filas],
+        'estado': [estados.index(_estado_de_nombre(estados, f[4])) for f in filas], 'viva': [True] * len(filas),
+    }, estados)
+    aud['compartida'] = {'codigo': codigo, 'version': fila[0], 'versiones': {f[0]: f[5] for f in filas}}
+    return aud
+
+def _subir_evento(con, aud, evento, version):
+    # Devuelve cuántas filas no se pudieron escribir porque otro las cambió antes (conflictos)
+    comp, tipo, args = aud['compartida'], evento[0], evento[1:]
+    if tipo == "agregar":
+        categoria, productos, cantidades, estados, ids = args
+        orden = con.execute("SELECT COALESCE(MAX(orden), -1) + 1 FROM filas WHERE codigo = ?", (comp['codigo'],)).fetchone()[0]
+        con.executemany("INSERT OR IGNORE INTO filas VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)",
+                        [(comp['codigo'], i, orden + k, categoria, p, q, e, version)
+                         for k, (i, p, q, e) in enumerate(zip(ids, productos, cantidades, estados))])
+        comp['versiones'].update((i, version) for i in ids)
+        return 0
+    if tipo == "estado": filas, columna, valor = args[0], "estado", args[1]
+    elif tipo == "cantidad": filas, columna, valor = [args[0]], "cantidad", args[1]
+    elif tipo == "producto": filas, columna, valor = [args[0]], "producto", args[1]
+    elif tipo == "borrar": filas, columna, valor = args[0], "viva", 0
+    else: return 0
+    conflictos = 0
+    for f in filas:
+        id_art = int(aud['ids'][f])
+        cursor = con.execute(f"UPDATE filas SET {columna} = ?, version = ? WHERE codigo = ? AND id = ? AND version = ? AND viva = 1",
+                             (valor, version, comp['codigo'], id_art, comp['versiones'].get(id_art, 0)))
+        if cursor.rowcount: comp['versiones'][id_art] = version
+        else: conflictos += 1
+    return conflictos
+
+def _aplicar_cambios_remotos(aud, cambios):
+    # Se aplican con las operaciones del almacén, pero sus eventos no son cambios locales: se descartan
+    inicio = len(aud['diario'])
+    for id_art, categoria, producto, cantidad, estado, viva, version in cambios:
+        aud['compartida']['versiones'][id_art] = version
+        estado = _estado_de_nombre(aud['estados'], estado)
+        fila = aud['indice'].get(id_art)
+        if fila is None:
+            if viva: agregar_filas(aud, categoria, [producto], [cantidad], [estado], ids=[id_art])
+            continue
+        if not viva:
+            borrar_filas(aud, [fila])
+            continue
+        if aud['productos'][fila] != producto: fijar_producto(aud, fila, producto)
+        if aud['cantidad'][fila] != cantidad: fijar_cantidad(aud, fila, cantidad)
+        if aud['estados'][aud['estado'][fila]] != estado: marcar_estado(aud, [fila], estado)
+    del aud['diario'][inicio:]
+
+def sincronizar_auditoria(aud):
+    # Sube los cambios locales pendientes y baja los de los demás; devuelve la cantidad de conflictos
+    comp = aud['compartida']
+    eventos, aud['diario'] = aud['diario'], []
+    conflictos = 0
+    try:
+        base = obtener_auditorias_compartidas()
+        with base['lock'], base['con'] as con:
+            if eventos:
+                con.execute("BEGIN IMMEDIATE")
+                version = con.execute("SELECT version FROM auditorias WHERE codigo = ?", (comp['codigo'],)).fetchone()[0] + 1
+                for evento in eventos: conflictos += _subir_evento(con, aud, evento, version)
+                con.execute("UPDATE auditorias SET version = ? WHERE codigo = ?", (version, comp['codigo']))
+            ultima = con.execute("SELECT version FROM auditorias WHERE codigo = ?", (comp['codigo'],)).fetchone()[0]
+            cambios = con.execute("SELECT id, categoria, producto, cantidad, estado, viva, version FROM filas "
+                                  "WHERE codigo = ? AND version > ? ORDER BY orden", (comp['codigo'], comp['version'])).fetchall()
+    except (sqlite3.Error, OSError, TypeError) as e:
+        # Sin base (o auditoría borrada): los cambios quedan pendientes para la próxima corrida
+        logger.warning(f"No se pudo sincronizar la auditoría compartida {comp['codigo']}: {e}")
+        aud['diario'] = eventos + aud['diario']
+        return 0
+    _aplicar_cambios_remotos(aud, cambios)
+    comp['version'] = ultima
+    return conflictos
+
+def version_auditoria_compartida(codigo):
+    try:
+        base = obtener_auditorias_compartidas()
+        with base['lock']:
+            fila = base['con'].execute("SELECT version FROM auditorias WHERE codigo = ?", (codigo,)).fetchone()
+        return fila[0] if fila else None
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"No se pudo consultar la auditoría compartida {codigo}: {e}")
+        return None
+
+@st.fragment(run_every=SINCRONIZACION_SEGUNDOS)
+def vigilar_auditoria_compartida():
+    # Consulta barata (una fila) cada pocos segundos; si otro operador cambió algo se vuelve a correr la app
+    aud = st.session_state.audit_data
+    if not aud or not aud.get('compartida'): return
+    version = version_auditoria_compartida(aud['compartida']['codigo'])
+    if version is not None and version > aud['compartida']['version']: st.rerun()
@@ -0,0 +1,257 @@
+# --- BENCHMARK DE LOS CAMINOS CALIENTES ---
+# Corre las etapas pesadas de las apps con entradas sintéticas (PDF de proveedor y listas "N x PRODUCTO") a varias
+# escalas, sin servidor de Streamlit ni Twilio: los motores se llaman desde sus módulos (lector_pdf, listas,
+# auditoria) con la configuración de cada app (CATEGORIZADOR, estados), que se toma del script importado en modo "bare".
+# Guarda tiempos y pico de memoria en JSON para poder comparar corridas.
+#
+#   python benchmark.py                                  # las dos apps, 100 / 10k / 100k filas
+#   python benchmark.py --apps app.py --escalas 100 10000
+#   python benchmark.py --comparar datos/benchmark/anterior.json
+#
+# Todos los datos (catálogo SQLite, caché de PDFs, auditorías compartidas y sesiones) van a un directorio temporal:
+# DATOS_DIR se fija antes de importar los módulos y los scripts, así no se toca datos/ aunque el script arranque la
+# persistencia. Entre escalas el directorio y las cachés de proceso se vacían: la primera repetición de cada etapa es
+# "fría" y las siguientes ya usan las cachés.
+import argparse
+import atexit
+import importlib.util
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+# Antes de importar cualquier módulo de las apps (arman sus rutas al importarse). Los procesos del pool de PDFs vuelven
+# a importar el script principal (y con él este archivo): heredan DATOS_DIR del padre y no crean otro directorio.
+if multiprocessing.current_process().name == "MainProcess":
+    os.environ["DATOS_DIR"] = tempfile.mkdtemp(prefix="bench_")
+    atexit.register(shutil.rmtree, os.environ["DATOS_DIR"], True)
+DATOS_TEMPORAL = os.environ["DATOS_DIR"]
+
+import pandas as pd
+
+import auditoria
+import lector_pdf
+import listas
+import productos
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+APPS = ["app.py", "app-saphirus.py"]
+ESCALAS = [100, 10000, 100000]
+REPETICIONES = 3
+FILAS_POR_PAGINA = 60
+SEMILLA = 2024
+SALIDA_DIR = os.path.join(RAIZ, "datos", "benchmark")
+
+FRAGANCIAS = ["UVA", "COCO", "VAINILLA", "LAVANDA", "JAZMIN", "FLORES BLANCAS", "MANGO", "ROSA", "BEBE", "KIWI",
+              "SANDIA", "CITRUS", "PITANGA", "FRUTOS ROJOS", "LIMON", "ALGODON", "MAR", "CANELA", "MUSGO", "NARANJA"]
+PRESENTACIONES = ["", "250 ML", "60 ML", "100 ML", "200ML", "X 2", "12 UNIDADES", "9 GR", "REPUESTO"]
+
+# --- CARGA DE LAS APPS ---
+def cargar_app(nombre):
+    # Importa el script en modo "bare": los widgets devuelven sus valores por defecto y la UI no hace nada
+    ruta = os.path.join(RAIZ, nombre)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(nombre)[0].replace("-", "_"), ruta)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+def vaciar_datos():
+    # Cachés de proceso y directorio de datos vacíos, como en un servidor recién levantado
+    for funcion in (productos.obtener_catalogo, productos.obtener_cache_productos, lector_pdf.obtener_stats_cache_pdf):
+        funcion.clear()
+    for nombre in os.listdir(DATOS_TEMPORAL):
+        ruta = os.path.join(DATOS_TEMPORAL, nombre)
+        if os.path.isdir(ruta): shutil.rmtree(ruta, ignore_errors=True)
+        else: os.remove(ruta)
+
+# --- DATOS SINTÉTICOS ---
+def nombres_sinteticos(categorias, n, rnd):
+    # Nombres armados con las mismas palabras clave que usa el clasificador, más fragancia y presentación.
+    # Un 5% no tiene ninguna palabra clave (cae en "otros").
+    alternativas = [alt for c in categorias.values() for alt in c['claves']]
+    nombres = []
+    for _ in range(n):
+        frag, pres = rnd.choice(FRAGANCIAS), rnd.choice(PRESENTACIONES)
+        if rnd.random() < 0.05:
+            nombres.append(f"PRODUCTO VARIOS {frag} {pres}".strip())
+            continue
+        palabras = list(rnd.choice(alternativas))
+        rnd.shuffle(palabras)
+        if rnd.random() < 0.5: nombres.append(f"{' '.join(palabras)} - {frag} {pres}".strip())
+        else: nombres.append(f"{palabras[0]} {pres} - {frag} {' '.join(palabras[1:])}".strip())
+    return nombres
+
+def precio(rnd):
+    entero = rnd.randint(500, 45000)
+    return f"{entero:,}".replace(",", ".") + f",{rnd.randint(0, 99):02d}"
+
+def filas_pdf_sinteticas(categorias, n, rnd):
+    # Mismo formato de texto que los PDFs de proveedor: ID, cantidad, producto, precio unitario y total
+    return [f"{10000000 + i:08d} {rnd.randint(1, 12)},00 {nombre} {precio(rnd)} {precio(rnd)}"
+            for i, nombre in enumerate(nombres_sinteticos(categorias, n, rnd))]
+
+def pdf_sintetico(lineas, por_pagina=FILAS_POR_PAGINA):
+    # PDF mínimo (una fuente estándar, una línea de texto por fila), suficiente para que pypdf extraiga el texto
+    paginas = [lineas[i:i + por_pagina] for i in range(0, len(lineas), por_pagina)] or [[]]
+    objetos = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    id_paginas = 2 + 2 * len(paginas)
+    hijos = []
+    for pagina in paginas:
+        texto = b" ".join(b"(" + l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1", "replace") + b") '"
+                          for l in pagina)
+        flujo = b"BT /F1 7 Tf 20 820 Td 9 TL " + texto + b" ET"
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(flujo), flujo))
+        objetos.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R /Resources << /Font << /F1 1 0 R >> >> >>"
+                       % (id_paginas, len(objetos)))
+        hijos.append(len(objetos))
+    objetos.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % h for h in hijos), len(hijos)))
+    objetos.append(b"<< /Type /Catalog /Pages %d 0 R >>" % id_paginas)
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objetos, 1):
+        offsets.append(len(salida))
+        salida += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    salida += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, len(objetos), xref)
+    return bytes(salida)
+
+def lista_sintetica(categorias, n, rnd):
+    # Lista "== CATEGORIA ==" / "N x PRODUCTO" como la que generan y reciben las pestañas de listas
+    secciones = {}
+    for i, nombre in enumerate(nombres_sinteticos(categorias, n, rnd)):
+        cat = rnd.choice(list(categorias.values()))['nombre'].upper()
+        secciones.setdefault(cat, []).append(f"{rnd.randint(1, 12)} x {nombre} {i}")
+    lineas = ["📋 *LISTA DE REPOSICIÓN*"]
+    for cat in sorted(secciones):
+        lineas += ["", f"== {cat} =="] + secciones[cat]
+    return "\n".join(lineas) + "\n"
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones):
+    tiempos, resultado = [], None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    # El pico de memoria se mide aparte: tracemalloc hace más lenta la ejecución (no ve los procesos hijos)
+    tracemalloc.start()
+    try:
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'frio_s': tiempos[0], 'min_s': min(tiempos), 'mediana_s': statistics.median(tiempos),
+            'pico_memoria_bytes': pico}, resultado
+
+def tamano(resultado):
+    if resultado is None: return 0
+    if isinstance(resultado, dict) and 'n' in resultado: return resultado['n']  # almacén de auditoría
+    if isinstance(resultado, (str, list, dict, pd.DataFrame)): return len(resultado)
+    return 1
+
+def etapas_de_app(app, escala, rnd):
+    # Cada etapa recibe la salida de la anterior, como en la app. La suma de listas usa la función de cada app (el
+    # título del resultado es distinto en cada una).
+    lineas = filas_pdf_sinteticas(app.CATEGORIAS, escala, rnd)
+    pdf = pdf_sintetico(lineas)
+    lista_a = lista_sintetica(app.CATEGORIAS, escala, rnd)
+    lista_b = lista_sintetica(app.CATEGORIAS, escala, rnd)
+    if hasattr(app, "sumar_listas"): sumar = lambda: app.sumar_listas(lista_a, lista_b)
+    else: sumar = lambda: app.operar_listas(lista_a, lista_b, True)
+    entradas = {}
+    return [
+        ("extraer_texto_pdf", lambda: lector_pdf.extraer_texto_pdf(io.BytesIO(pdf)), 'texto'),
+        ("parsear_datos", lambda: lector_pdf.parsear_datos(entradas['texto']), 'datos'),
+        ("limpiar_dataframe", lambda: lector_pdf.limpiar_dataframe(app.CATEGORIZADOR, pd.DataFrame(entradas['datos'])), 'df'),
+        ("generar_mensaje_df", lambda: listas.generar_mensaje_df(entradas['df']), 'mensaje'),
+        ("preparar_datos_auditoria", lambda: auditoria.preparar_datos_auditoria(lista_a, app.ESTADOS_AUDITORIA), None),
+        ("sumar_listas", sumar, None),
+        ("procesar_pdf", lambda: lector_pdf.procesar_pdf(app.CATEGORIZADOR, io.BytesIO(pdf)), None),
+    ], entradas, len(pdf)
+
+def correr(apps, escalas, repeticiones):
+    resultados = []
+    for nombre in apps:
+        app = cargar_app(nombre)
+        for escala in escalas:
+            vaciar_datos()
+            etapas, entradas, bytes_pdf = etapas_de_app(app, escala, random.Random(SEMILLA + escala))
+            for etapa, funcion, guardar_como in etapas:
+                medida, resultado = medir(funcion, repeticiones)
+                if guardar_como: entradas[guardar_como] = resultado
+                medida.update({'app': nombre, 'escala': escala, 'etapa': etapa, 'salida': tamano(resultado)})
+                if etapa in ("extraer_texto_pdf", "procesar_pdf"): medida['bytes_pdf'] = bytes_pdf
+                resultados.append(medida)
+                print(f"{nombre:16} {escala:>7} {etapa:26} frío {medida['frio_s'] * 1000:9.1f} ms  "
+                      f"mediana {medida['mediana_s'] * 1000:9.1f} ms  pico {medida['pico_memoria_bytes'] / 2**20:7.1f} MB",
+                      flush=True)
+    return resultados
+
+# --- RESULTADOS ---
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def guardar_resultados(resultados, ruta, repeticiones):
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    informe = {
+        'fecha': datetime.now().isoformat(timespec="seconds"),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeticiones': repeticiones,
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'resultados': resultados,
+    }
+    with open(ruta, "w", encoding="utf-8") as fh:
+        json.dump(informe, fh, ensure_ascii=False, indent=2)
+    return informe
+
+def comparar(resultados, ruta_anterior):
+    with open(ruta_anterior, encoding="utf-8") as fh:
+        anterior = {(r['app'], r['escala'], r['etapa']): r for r in json.load(fh)['resultados']}
+    print(f"\nComparación con {ruta_anterior} (mediana; < 1 es más rápido):")
+    for r in resultados:
+        previo = anterior.get((r['app'], r['escala'], r['etapa']))
+        if not previo or not previo['mediana_s']: continue
+        print(f"{r['app']:16} {r['escala']:>7} {r['etapa']:26} {previo['mediana_s'] * 1000:9.1f} ms -> "
+              f"{r['mediana_s'] * 1000:9.1f} ms  x{r['mediana_s'] / previo['mediana_s']:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las etapas pesadas de las apps (sin Streamlit ni Twilio).")
+    parser.add_argument("--apps", nargs="+", default=APPS, choices=APPS)
+    parser.add_argument("--escalas", nargs="+", type=int, default=ESCALAS)
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--salida", default=None, help="JSON de resultados (por defecto datos/benchmark/<fecha>.json)")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+    resultados = correr(args.apps, args.escalas, max(1, args.repeticiones))
+    ruta = args.salida or os.path.join(SALIDA_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    guardar_resultados(resultados, ruta, args.repeticiones)
+    print(f"\nResultados en {ruta}")
+    if args.comparar: comparar(resultados, args.comparar)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# --- BÚSQUEDA DE PRODUCTOS ---
+# Compartido por app.py y app-saphirus.py: índice de palabras para buscar en la auditoría y en los PDFs procesados.
+import pandas as pd
+import numpy as np
+import re
+import bisect
+import unicodedata
+
+# --- ÍNDICE DE BÚSQUEDA ---
+# Palabra normalizada (mayúsculas, sin acentos) -> claves (filas de la auditoría o del PDF). Cada palabra de la consulta
+# es un prefijo ("arom" encuentra AROMÁTICA) y tienen que estar todas; los prefijos se buscan con bisect sobre la lista
+# ordenada de palabras. La base se arma de una vez con numpy (arrays de claves por palabra); los cambios posteriores
+# van aparte: las claves tocadas quedan 'fuera' de la base y sus palabras nuevas se guardan en sets.
+RE_PALABRA = re.compile(r'[A-Z0-9]+')
+RE_PALABRA_O_CORTE = re.compile(r'[A-Z0-9]+|\x1e')
+
+def normalizar_palabras(texto):
+    texto = unicodedata.normalize('NFKD', str(texto).upper()).encode('ascii', 'ignore').decode()
+    return RE_PALABRA.findall(texto)
+
+def crear_indice(claves=(), textos=()):
+    claves = np.asarray(list(claves))
+    # Todos los textos se normalizan juntos, separados por \x1e, y cada palabra se asigna a la clave de su texto
+    todo = unicodedata.normalize('NFKD', "\x1e".join(map(str, textos)).upper()).encode('ascii', 'ignore').decode()
+    palabras = np.array(RE_PALABRA_O_CORTE.findall(todo + "\x1e"), dtype=object)
+    corte = palabras == "\x1e"
+    de_clave = claves[np.cumsum(corte)[~corte]] if len(claves) else claves
+    cods, unicas = pd.factorize(palabras[~corte])
+    limites = np.concatenate(([0], np.cumsum(np.bincount(cods, minlength=len(unicas))))).tolist()
+    de_clave = de_clave[np.argsort(cods, kind="stable")]
+    base = {p: de_clave[limites[i]:limites[i + 1]] for i, p in enumerate(unicas.tolist())}
+    return {'base': base, 'fuera': set(), 'claves': {}, 'palabras_de': {}, 'ordenadas': sorted(base)}
+
+def desindexar(indice, clave):
+    indice['fuera'].add(clave)
+    for p in indice['palabras_de'].pop(clave, ()):
+        indice['claves'][p].discard(clave)
+
+def indexar(indice, clave, texto):
+    desindexar(indice, clave)
+    palabras = frozenset(normalizar_palabras(texto))
+    indice['palabras_de'][clave] = palabras
+    for p in palabras:
+        if p not in indice['claves']:
+            indice['claves'][p] = set()
+            if p not in indice['base']: bisect.insort(indice['ordenadas'], p)
+        indice['claves'][p].add(clave)
+
+def buscar_en_indice(indice, consulta):
+    ordenadas = indice['ordenadas']
+    resultado = None
+    for palabra in set(normalizar_palabras(consulta)):
+        de_base, claves = [], set()
+        i = bisect.bisect_left(ordenadas, palabra)
+        while i < len(ordenadas) and ordenadas[i].startswith(palabra):
+            if ordenadas[i] in indice['base']: de_base.append(indice['base'][ordenadas[i]])
+            claves |= indice['claves'].get(ordenadas[i], set())
+            i += 1
+        if de_base: claves |= set(np.concatenate(de_base).tolist()) - indice['fuera']
+        resultado = claves if resultado is None else resultado & claves
+        if not resultado: break
+    return resultado or set()
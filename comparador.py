@@ -0,0 +1,134 @@
+# --- COMPARADOR DE LISTAS ---
+# Compartido por app.py y app-saphirus.py: cada app pasa su limpieza (la misma que usa con los PDFs).
+import streamlit as st
+import pandas as pd
+import difflib
+from collections import Counter
+
+from productos import limpiar_nombre
+from busqueda import normalizar_palabras
+from listas import parsear_lista, categorias_de_lista
+
+# --- COMPARADOR (NOMBRES NORMALIZADOS + TRIGRAMAS) ---
+# Cada producto se compara por su nombre limpio (las mismas reglas que el PDF, según la categoría de la lista) y
+# normalizado (mayúsculas, sin acentos ni signos); los repetidos se suman. Lo que queda sin pareja de cada lado se
+# empareja por trigramas: un índice trigrama -> sobrantes propone candidatos (los trigramas que aparecen en muchos
+# sobrantes no proponen) y la similitud (Dice) se calcula solo con esos. Si los números del nombre (medidas, modelos)
+# no son los mismos no se emparejan, y las palabras que no comparten tienen que parecerse entre sí (un error de tipeo
+# como ACEIT/ACEITE, no otra variante como JAZMIN/MANGO). Separando por categoría la clave es (categoría, nombre): el
+# mismo producto en dos categorías cuenta aparte y solo se emparejan parecidos de la misma categoría.
+UMBRAL_PARECIDO = 0.75
+CANDIDATOS_POR_PRODUCTO = 5
+TRIGRAMA_FRECUENTE = 0.2  # fracción de los sobrantes
+UMBRAL_PALABRAS_DISTINTAS = 0.6
+COMPARADOR_MAX_LINEAS = 30  # con más filas el resultado se muestra en una tabla
+
+def clave_de_comparacion(limpieza, producto, categoria):
+    return " ".join(normalizar_palabras(limpiar_nombre(limpieza, producto, categoria))) or producto.upper()
+
+def trigramas(clave):
+    return {f" {p} "[i:i + 3] for p in clave.split() for i in range(len(p))}
+
+def numeros_de(clave):
+    return frozenset(p for p in clave.split() if any(ch.isdigit() for ch in p))
+
+def diferencia_de_tipeo(clave_a, clave_b):
+    solo_a, solo_b = Counter(clave_a.split()), Counter(clave_b.split())
+    solo_a, solo_b = " ".join((solo_a - solo_b).elements()), " ".join((solo_b - solo_a).elements())
+    if not solo_a or not solo_b: return False  # una palabra de más o de menos es otra variante
+    return difflib.SequenceMatcher(None, solo_a, solo_b).ratio() >= UMBRAL_PALABRAS_DISTINTAS
+
+def emparejar_parecidos(faltan, sobran, umbral=UMBRAL_PARECIDO):
+    # Devuelve [(clave_falta, clave_sobra, similitud)], cada clave en una sola pareja
+    if not faltan or not sobran: return []
+    grams_b = [trigramas(c) for c in sobran]
+    numeros_b = [numeros_de(c) for c in sobran]
+    indice = {}
+    for j, grams in enumerate(grams_b):
+        for g in grams: indice.setdefault(g, []).append(j)
+    frecuente = max(CANDIDATOS_POR_PRODUCTO, int(len(sobran) * TRIGRAMA_FRECUENTE))
+    pares = []
+    for i, clave in enumerate(faltan):
+        grams, numeros = trigramas(clave), numeros_de(clave)
+        votos = Counter()
+        for g in grams:
+            candidatos = indice.get(g)
+            if candidatos and len(candidatos) <= frecuente: votos.update(candidatos)
+        for j, _ in votos.most_common(CANDIDATOS_POR_PRODUCTO):
+            if numeros_b[j] != numeros: continue
+            similitud = 2 * len(grams & grams_b[j]) / (len(grams) + len(grams_b[j]))
+            if similitud >= umbral and diferencia_de_tipeo(clave, sobran[j]): pares.append((similitud, i, j))
+    # De la pareja más parecida a la menos
+    usados_a, usados_b, parejas = set(), set(), []
+    for similitud, i, j in sorted(pares, reverse=True):
+        if i in usados_a or j in usados_b: continue
+        usados_a.add(i)
+        usados_b.add(j)
+        parejas.append((faltan[i], sobran[j], similitud))
+    return parejas
+
+def tabla_para_comparar(limpieza, texto, por_categoria=False):
+    # Una fila por (categoría, clave) con el primer nombre con que apareció y la cantidad sumada. Sin separar por
+    # categoría todas quedan en la categoría "". Cada nombre distinto se limpia una sola vez.
+    lista = parsear_lista(texto)
+    categorias = categorias_de_lista(lista)
+    pares = list(zip(lista['productos'], categorias))
+    claves = {par: clave_de_comparacion(limpieza, *par) for par in set(pares)}
+    df = pd.DataFrame({
+        "Categoria": categorias if por_categoria else [""] * len(pares),
+        "Clave": [claves[par] for par in pares],
+        "Producto": [p.upper() for p in lista['productos']],
+        "Cantidad": lista['cantidades'],
+    })
+    return df.groupby(["Categoria", "Clave"], sort=False, as_index=False).agg(Producto=("Producto", "first"),
+                                                                              Cantidad=("Cantidad", "sum"))
+
+def comparar_listas(limpieza, texto_a, texto_b, por_categoria=False):
+    # Un solo merge (outer) entre las dos tablas; las filas que quedaron de un solo lado se emparejan por nombre
+    # parecido dentro de la misma categoría. Todo sale como DataFrames, más un resumen de unidades por categoría.
+    a = tabla_para_comparar(limpieza, texto_a, por_categoria)
+    b = tabla_para_comparar(limpieza, texto_b, por_categoria)
+    unidas = a.merge(b, on=["Categoria", "Clave"], how="outer", suffixes=("", "_b"), indicator=True)
+    solo_a = (unidas["_merge"] == "left_only").to_numpy(copy=True)
+    solo_b = (unidas["_merge"] == "right_only").to_numpy(copy=True)
+    grupos_b = dict(tuple(unidas[solo_b].groupby("Categoria", sort=False)))
+    filas_a, filas_b, confianzas = [], [], []
+    for cat, grupo_a in unidas[solo_a].groupby("Categoria", sort=False):
+        if cat not in grupos_b: continue
+        fila_a = dict(zip(grupo_a["Clave"], grupo_a.index))
+        fila_b = dict(zip(grupos_b[cat]["Clave"], grupos_b[cat].index))
+        for clave_a, clave_b, similitud in emparejar_parecidos(list(fila_a), list(fila_b)):
+            filas_a.append(fila_a[clave_a])
+            filas_b.append(fila_b[clave_b])
+            confianzas.append(similitud)
+    pa, pb = unidas.loc[filas_a], unidas.loc[filas_b]
+    parecidos = pd.DataFrame({"Categoria": pa["Categoria"].to_numpy(), "Producto": pa["Producto"].to_numpy(),
+                              "Parecido": pb["Producto_b"].to_numpy(), "Confianza": confianzas,
+                              "Esperado": pa["Cantidad"].to_numpy(), "Llegó": pb["Cantidad_b"].to_numpy()})
+    distintas = unidas[(unidas["_merge"] == "both") & (unidas["Cantidad"] != unidas["Cantidad_b"])]
+    diferencias = pd.concat([
+        pd.DataFrame({"Categoria": distintas["Categoria"], "Producto": distintas["Producto"],
+                      "Esperado": distintas["Cantidad"], "Llegó": distintas["Cantidad_b"]}),
+        parecidos.loc[parecidos["Esperado"] != parecidos["Llegó"], ["Categoria", "Producto", "Esperado", "Llegó"]],
+    ], ignore_index=True)
+    solo_a[filas_a] = False
+    solo_b[filas_b] = False
+    faltan = unidas.loc[solo_a, ["Categoria", "Producto", "Cantidad"]].reset_index(drop=True)
+    sobran = unidas.loc[solo_b, ["Categoria", "Producto_b", "Cantidad_b"]].reset_index(drop=True)
+    sobran.columns = ["Categoria", "Producto", "Cantidad"]
+    # Unidades por categoría: las que faltan (productos que no llegaron + lo que llegó de menos) y las que sobran
+    delta = diferencias["Llegó"] - diferencias["Esperado"]
+    resumen = pd.concat([
+        pd.DataFrame({"Categoria": faltan["Categoria"], "Faltan": faltan["Cantidad"], "Sobran": 0.0}),
+        pd.DataFrame({"Categoria": sobran["Categoria"], "Faltan": 0.0, "Sobran": sobran["Cantidad"]}),
+        pd.DataFrame({"Categoria": diferencias["Categoria"], "Faltan": (-delta).clip(lower=0), "Sobran": delta.clip(lower=0)}),
+    ]).groupby("Categoria", as_index=False).sum()
+    return {'faltan': faltan, 'sobran': sobran, 'diferencias': diferencias, 'parecidos': parecidos, 'resumen': resumen}
+
+def mostrar_comparacion(df, formato, por_categoria, escribir=st.markdown):
+    # Pocas filas: una línea por producto; muchas: una sola tabla (miles de líneas tardan más que la comparación)
+    if len(df) > COMPARADOR_MAX_LINEAS:
+        st.dataframe(df if por_categoria else df.drop(columns="Categoria"), hide_index=True)
+        return
+    if por_categoria: formato += " · _{Categoria}_"
+    for fila in df.to_dict("records"): escribir(formato.format(**fila))
@@ -0,0 +1,366 @@
+# --- LECTURA DE PDFs DE PROVEEDOR ---
+# Compartido por app.py y app-saphirus.py. Este módulo se importa también en los procesos del pool de extracción,
+# así que al importarlo no se hace nada más que definir funciones.
+import streamlit as st
+import pandas as pd
+from pypdf import PdfReader
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import hashlib
+import logging
+import os
+import io
+import re
+import itertools
+import bisect
+import time
+from productos import DATOS_DIR, categorizar_por_id
+from busqueda import crear_indice
+
+logger = logging.getLogger(__name__)
+
+# --- EXTRACCIÓN DE TEXTO (PARALELA POR PÁGINA) ---
+# Cada página se extrae una sola vez. Con muchas páginas se reparten en bloques contiguos entre los procesos de un
+# pool que vive lo que el servidor: cada tarea recibe los bytes del PDF y su rango de páginas, abre su propio
+# PdfReader y devuelve los textos. Los procesos salen de un forkserver (o spawn donde no hay), nunca de un fork del
+# servidor de Streamlit, que tiene hilos corriendo. pypdf es Python puro: con hilos no se gana nada por el GIL.
+PDF_WORKERS = min(os.cpu_count() or 1, 8)
+PDF_PAGINAS_MIN_PARALELO = 8
+
+def bytes_de_archivo(archivo):
+    if hasattr(archivo, "getvalue"): return archivo.getvalue()
+    if hasattr(archivo, "read"):
+        contenido = archivo.read()
+        archivo.seek(0)
+        return contenido
+    with open(archivo, "rb") as fh:
+        return fh.read()
+
+@st.cache_resource
+def obtener_pool_pdf():
+    metodos = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+    # El forkserver importa este módulo una vez y cada proceso nuevo ya lo tiene cargado
+    if ctx.get_start_method() == "forkserver": ctx.set_forkserver_preload([__name__])
+    return {'pool': ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=ctx)}
+
+def _descartar_pool_pdf():
+    # Un proceso que muere deja el pool roto para siempre: se cierra y la próxima extracción arma otro
+    try:
+        obtener_pool_pdf()['pool'].shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+    obtener_pool_pdf.clear()
+
+def _extraer_paginas(reader, indices):
+    return [reader.pages[i].extract_text() or "" for i in indices]
+
+def _extraer_bloque(contenido, desde, hasta):
+    # Corre en un proceso del pool
+    return _extraer_paginas(PdfReader(io.BytesIO(contenido)), range(desde, hasta))
+
+def _iterar_en_paralelo(reader, contenido, workers):
+    total = len(reader.pages)
+    limites = [i * total // workers for i in range(workers + 1)]
+    bloques = list(zip(limites, limites[1:]))
+    try:
+        pool = obtener_pool_pdf()['pool']
+        futuros = [pool.submit(_extraer_bloque, contenido, desde, hasta) for desde, hasta in bloques]
+    except Exception as e:
+        logger.warning(f"Pool de extracción no disponible, se extrae en este proceso: {e}")
+        if isinstance(e, BrokenProcessPool): _descartar_pool_pdf()
+        yield from _extraer_paginas(reader, range(total))
+        return
+    try:
+        # Los bloques se entregan en orden a medida que llegan, así el que consume puede ir procesando
+        for futuro, (desde, hasta) in zip(futuros, bloques):
+            try:
+                textos = futuro.result()
+            except Exception as e:
+                logger.warning(f"Falló la extracción de las páginas {desde}-{hasta} en el pool, se extraen acá: {e}")
+                if isinstance(e, BrokenProcessPool): _descartar_pool_pdf()
+                textos = _extraer_paginas(reader, range(desde, hasta))
+            yield from textos
+    finally:
+        for futuro in futuros: futuro.cancel()
+
+def iterar_paginas_pdf(reader, contenido, workers=None):
+    total = len(reader.pages)
+    workers = min(workers or PDF_WORKERS, total)
+    if workers > 1 and total >= PDF_PAGINAS_MIN_PARALELO:
+        yield from _iterar_en_paralelo(reader, contenido, workers)
+    else:
+        for i in range(total):
+            yield reader.pages[i].extract_text() or ""
+
+def extraer_paginas_pdf(archivo, workers=None):
+    contenido = bytes_de_archivo(archivo)
+    return list(iterar_paginas_pdf(PdfReader(io.BytesIO(contenido)), contenido, workers))
+
+def extraer_texto_pdf(archivo, workers=None):
+    try:
+        texto = "".join(extraer_paginas_pdf(archivo, workers))
+        return texto.replace("\n", " ")
+    except Exception: return None
+
+# --- MOTOR DE PARSEO ---
+# Etapa 1: se detecta el formato del PDF por ventanas acotadas del texto. Etapa 2: se recorre solo con el escáner de ese
+# formato. RE_FILA_CSV ya es lineal. El de texto no usa el lookahead perezoso de RE_FILA_TEXTO (cada fila sin precio
+# después recorría el resto del texto antes de fallar, cuadrático en textos largos de una sola línea): busca los
+# "ID cantidad" con un regex sin lookahead y a cada uno le asigna el primer precio que viene después, con las posiciones
+# de los precios ya calculadas. Las filas que devuelve son las mismas que las del regex.
+# RE_FILA_TEXTO queda solo como respaldo: si los escáneres no encuentran ninguna fila (o fallan) se corren los regex
+# originales sobre todo el texto. El de texto se corta donde termina el último precio: las filas que quedarían después
+# no tienen precio y fallan igual, pero cada una recorrería el resto del texto antes de fallar.
+RE_FILA_CSV = re.compile(r'"\s*(\d{8})\s*"\s*,\s*"\s*([-0-9,]+)\s+([^"]+)"')
+RE_FILA_TEXTO = re.compile(r'(\d{8})\s+([-0-9]+,\d{2})\s+(.*?)(?=\s\d{1,3}(?:\.\d{3})*,\d{2})')
+RE_CABEZA_TEXTO = re.compile(r'(\d{8})\s+([-0-9]+,\d{2})(\s+)')
+RE_PRECIO = re.compile(r'\s\d{1,3}(?:\.\d{3})*,\d{2}')
+MUESTRA_FORMATO = 4000
+
+def detectar_formato(texto):
+    # La misma detección para el texto entero (parsear_datos_con_info) y para cada página del streaming. Se mira por
+    # ventanas de 2 * MUESTRA_FORMATO caracteres que avanzan MUESTRA_FORMATO (una fila partida entre dos queda entera en
+    # alguna) y decide la primera que tenga alguna fila, CSV primero como antes. En un PDF normal alcanza la primera.
+    # None si no hay filas de ningún formato.
+    for desde in range(0, len(texto), MUESTRA_FORMATO):
+        muestra = texto[desde:desde + 2 * MUESTRA_FORMATO]
+        if RE_FILA_CSV.search(muestra): return 'csv'
+        if next(escanear_filas_texto(muestra), None) is not None: return 'texto'
+    return None
+
+def fin_ultimo_precio(texto):
+    # Busca el último precio desde el final con ventanas cada vez más grandes (casi siempre alcanza la primera)
+    ventana = 4096
+    while True:
+        desde = max(0, len(texto) - ventana)
+        ultimo = None
+        for ultimo in RE_PRECIO.finditer(texto, desde): pass
+        if ultimo is not None: return ultimo.end()
+        if desde == 0: return 0
+        ventana *= 8
+
+def escanear_filas_texto(texto):
+    # Devuelve (id, cantidad, producto, fin) igual que RE_FILA_TEXTO.finditer. Cada fila termina en el primer precio
+    # después de su cantidad, si está en la misma línea (el "." del regex no cruza saltos de línea); si no hay, el
+    # regex todavía acepta el producto vacío cuando el precio viene tras dos o más espacios pegado a la cantidad.
+    precios = [m.start() for m in RE_PRECIO.finditer(texto)]
+    saltos = [m.start() for m in re.finditer("\n", texto)]
+    pos = 0
+    while True:
+        m = RE_CABEZA_TEXTO.search(texto, pos)
+        if m is None: return
+        inicio = m.end()
+        i = bisect.bisect_left(precios, inicio)
+        j = bisect.bisect_left(saltos, inicio)
+        fin_linea = saltos[j] if j < len(saltos) else len(texto)
+        if i < len(precios) and precios[i] <= fin_linea:
+            yield m.group(1), m.group(2), texto[inicio:precios[i]], precios[i]
+            pos = precios[i]
+        elif len(m.group(3)) > 1 and i and precios[i - 1] == inicio - 1:
+            yield m.group(1), m.group(2), "", inicio - 1
+            pos = inicio - 1
+        else:
+            pos = m.start() + 1
+
+def escanear_filas(texto, formato):
+    if formato == 'csv':
+        for m in RE_FILA_CSV.finditer(texto):
+            yield m.group(1), m.group(2), m.group(3), m.end()
+    else:
+        yield from escanear_filas_texto(texto)
+
+def parsear_datos_con_info(texto):
+    inicio = time.perf_counter()
+    formato = detectar_formato(texto) or 'texto'
+    try:
+        matches = [(id_art, cant, prod) for id_art, cant, prod, _ in escanear_filas(texto, formato)]
+    except Exception as e:
+        logger.warning(f"Escáner {formato} falló, uso los regex: {e}")
+        matches = []
+    if not matches:
+        matches = RE_FILA_CSV.findall(texto) or RE_FILA_TEXTO.findall(texto, 0, fin_ultimo_precio(texto))
+        if matches: formato = 'regex'
+    datos = [{"ID": m[0], "Cantidad": m[1], "Producto": m[2].strip()} for m in matches]
+    info = {'formato': formato, 'filas': len(datos), 'segundos': time.perf_counter() - inicio}
+    logger.info(f"parsear_datos: formato={formato} filas={len(datos)} en {info['segundos']:.4f}s")
+    return datos, info
+
+def parsear_datos(texto):
+    return parsear_datos_con_info(texto)[0]
+
+# --- PIPELINE EN STREAMING (PÁGINA A PÁGINA) ---
+# Las filas salen a medida que se lee cada página. Lo que queda después de la última fila completa se arrastra a la
+# página siguiente (filas partidas entre páginas), y las filas que terminan muy cerca del final del texto leído se
+# posponen hasta tener más texto, para que el lookahead de precios vea lo mismo que vería con el PDF entero.
+# El formato sale de detectar_formato, la misma que usa parsear_datos_con_info: lo fija la primera página con filas, y
+# una página que no da ninguna fila con ese formato pero sí con el otro (PDF mixto) lo cambia desde ahí. En info queda
+# la secuencia de formatos ("csv+texto").
+MARGEN_CORTE = 64
+
+def filas_del_buffer(buffer, formato, margen):
+    # Filas completas y dónde termina la última; las que terminan a menos de `margen` del final se posponen
+    filas, corte = [], 0
+    for id_art, cant, prod, fin in escanear_filas(buffer, formato):
+        if fin > len(buffer) - margen: break
+        filas.append({"ID": id_art, "Cantidad": cant, "Producto": prod.strip()})
+        corte = fin
+    return filas, corte
+
+def iterar_filas_pdf(paginas, info=None):
+    info = {} if info is None else info
+    info.update({'formato': None, 'filas': 0, 'segundos': 0.0})
+    formato = None
+    buffer = ""
+    # Una vuelta por página y una más al final (texto None) para lo que quedó en el buffer, ya sin margen
+    for texto in itertools.chain(paginas, [None]):
+        inicio = time.perf_counter()
+        if texto is not None: buffer += texto.replace("\n", " ")
+        margen = MARGEN_CORTE if texto is not None else 0
+        filas, corte = filas_del_buffer(buffer, formato, margen) if formato else ([], 0)
+        if not filas:
+            detectado = detectar_formato(buffer)
+            if detectado is not None and detectado != formato:
+                formato = detectado
+                info['formato'] = formato if info['formato'] is None else f"{info['formato']}+{formato}"
+                filas, corte = filas_del_buffer(buffer, formato, margen)
+        buffer = buffer[corte:]
+        info['filas'] += len(filas)
+        info['segundos'] += time.perf_counter() - inicio
+        yield filas
+
+def limpiar_filas(categorizador, df):
+    df["Cantidad"] = df["Cantidad"].apply(lambda x: float(x.replace(",", ".")) if isinstance(x, str) else x)
+    df["Producto"] = df["Producto"].apply(lambda x: re.sub(r'^\d{8}\s*', '', x.strip()))
+    df = df[df["Cantidad"] > 0]
+    df["Categoria"], df["Producto"] = categorizar_por_id(categorizador, df["ID"], df["Producto"])
+    return df
+
+def agrupar_filas(df):
+    # Categoria como Categorical: pocos valores repetidos en miles de filas (códigos + una tabla de nombres)
+    df = df.groupby(["Categoria", "Producto"], as_index=False)["Cantidad"].sum()
+    df["Categoria"] = df["Categoria"].astype("category")
+    return df
+
+def limpiar_dataframe(categorizador, df):
+    return agrupar_filas(limpiar_filas(categorizador, df))
+
+def procesar_pdf_incremental(categorizador, archivo, cada=5, workers=None, info=None):
+    # Devuelve (paginas_leidas, total_paginas, df_agrupado_hasta_ahora) cada `cada` páginas y al terminar.
+    # Las filas limpias se guardan por tramos y se agrupan siempre en el orden original, así el total final es idéntico.
+    # Si se pasa `info` queda con el formato detectado, la cantidad de filas y el tiempo de parseo.
+    # Reagrupar todo en cada vista previa es cuadrático: en PDFs largos se espacian (unas 20 por PDF) y con cada=None
+    # se agrupa una sola vez al final.
+    contenido = bytes_de_archivo(archivo)
+    reader = PdfReader(io.BytesIO(contenido))
+    total = len(reader.pages)
+    if cada: cada = max(cada, total // 20)
+    tramos, pendientes, leidas = [], [], 0
+    for filas in iterar_filas_pdf(iterar_paginas_pdf(reader, contenido, workers), info):
+        leidas = min(leidas + 1, total)
+        pendientes.extend(filas)
+        if cada and pendientes and leidas % cada == 0:
+            tramos.append(limpiar_filas(categorizador, pd.DataFrame(pendientes)))
+            pendientes = []
+            yield leidas, total, agrupar_filas(pd.concat(tramos))
+    if pendientes: tramos.append(limpiar_filas(categorizador, pd.DataFrame(pendientes)))
+    yield total, total, agrupar_filas(pd.concat(tramos)) if tramos else None
+
+# --- CACHÉ DE PDFs EN DISCO (SHA-256 -> Parquet) ---
+# El resultado agrupado de cada PDF se guarda por el hash de su contenido (más la huella de las reglas, porque cada app
+# arma categorías distintas). Sobrevive reinicios y lo comparten las dos apps; al pasar el tope se borran los menos usados.
+PDF_CACHE_DIR = os.path.join(DATOS_DIR, "pdf_cache")
+PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+@st.cache_resource
+def obtener_stats_cache_pdf():
+    return {'lock': threading.Lock(), 'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _contar_cache_pdf(campo, n=1):
+    stats = obtener_stats_cache_pdf()
+    with stats['lock']:
+        stats[campo] += n
+
+def estadisticas_cache_pdf():
+    stats = obtener_stats_cache_pdf()
+    with stats['lock']:
+        return {'hits': stats['hits'], 'misses': stats['misses'], 'evictions': stats['evictions']}
+
+def _ruta_cache_pdf(huella, contenido):
+    return os.path.join(PDF_CACHE_DIR, f"{hashlib.sha256(contenido).hexdigest()}_{huella[:12]}.parquet")
+
+def leer_cache_pdf(huella, contenido):
+    ruta = _ruta_cache_pdf(huella, contenido)
+    try:
+        df = pd.read_parquet(ruta)
+        os.utime(ruta)  # Marca de uso para el desalojo LRU
+    except Exception:
+        _contar_cache_pdf('misses')
+        return None
+    _contar_cache_pdf('hits')
+    return df
+
+def _recortar_cache_pdf():
+    archivos = []
+    for entrada in os.scandir(PDF_CACHE_DIR):
+        if entrada.name.endswith(".parquet"):
+            info = entrada.stat()
+            archivos.append((info.st_mtime, info.st_size, entrada.path))
+    total = sum(tam for _, tam, _ in archivos)
+    for _, tam, ruta in sorted(archivos):
+        if total <= PDF_CACHE_MAX_BYTES: break
+        os.remove(ruta)
+        total -= tam
+        _contar_cache_pdf('evictions')
+
+def guardar_cache_pdf(huella, contenido, df):
+    ruta = _ruta_cache_pdf(huella, contenido)
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+        _recortar_cache_pdf()
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el PDF en caché: {e}")
+
+def procesar_pdf_con_progreso(categorizador, archivo):
+    # Para la UI: barra de progreso y vista previa mientras se lee. El resultado queda en la sesión por archivo subido.
+    if st.session_state.get('pdf_id') == archivo.file_id:
+        return st.session_state.pdf_resultado
+    contenido = bytes_de_archivo(archivo)
+    df_res = leer_cache_pdf(categorizador['huella'], contenido)
+    info = {'formato': 'caché', 'filas': None, 'segundos': 0.0}
+    if df_res is None:
+        barra = st.progress(0.0, text="Leyendo PDF...")
+        vista = st.empty()
+        try:
+            for leidas, total, df_res in procesar_pdf_incremental(categorizador, io.BytesIO(contenido), info=info):
+                barra.progress(leidas / total if total else 1.0, text=f"Página {leidas} de {total}")
+                if df_res is not None and leidas < total: vista.dataframe(df_res, hide_index=True)
+        except Exception as e:
+            logger.error(f"Error en procesar_pdf: {e}")
+            df_res = None
+        barra.empty()
+        vista.empty()
+        if df_res is not None: guardar_cache_pdf(categorizador['huella'], contenido, df_res)
+    st.session_state.pdf_id = archivo.file_id
+    st.session_state.pdf_resultado = df_res
+    # Índice de búsqueda sobre las filas del resultado (se arma una vez por archivo subido)
+    st.session_state.pdf_indice = crear_indice(range(len(df_res)), df_res["Producto"]) if df_res is not None else None
+    st.session_state.pdf_info = info
+    return df_res
+
+def procesar_pdf(categorizador, archivo):
+    try:
+        contenido = bytes_de_archivo(archivo)
+        df_res = leer_cache_pdf(categorizador['huella'], contenido)
+        if df_res is not None: return df_res
+        for _, _, df_res in procesar_pdf_incremental(categorizador, io.BytesIO(contenido), cada=None): pass
+        if df_res is not None: guardar_cache_pdf(categorizador['huella'], contenido, df_res)
+        return df_res
+    except Exception as e:
+        logger.error(f"Error en procesar_pdf: {e}")
+        return None
@@ -0,0 +1,197 @@
+# --- LISTAS "== CATEGORIA ==" / "N x PRODUCTO" ---
+# Compartido por app.py y app-saphirus.py: el formato de las listas es el mismo en las dos apps.
+import streamlit as st
+import pandas as pd
+import numpy as np
+import re
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+from productos import categorizar_serie
+
+logger = logging.getLogger(__name__)
+
+# --- PARSEO DE LISTAS ("== CATEGORIA ==" / "N x PRODUCTO") ---
+# Un solo regex recorre todo el texto: encabezados, productos, y líneas con " x " que no se pudieron leer (se informan
+# en vez de descartarse en silencio). El resultado es columnar: código de categoría por producto (-1 = antes del primer
+# encabezado), productos y cantidades en float64. Se guarda por hash del texto, así las pestañas que reciben la misma
+# lista (y los reruns) no la vuelven a parsear; los arrays son de solo lectura porque el resultado es compartido.
+RE_LINEA_LISTA = re.compile(
+    r'^[ \t]*(?:==([^\n]*)'
+    r'|([-+]?\d+(?:\.\d+)?)[ \t]+[xX][ \t]+(\S(?:[^\n]*\S)?)'
+    r'|([^\n]*?[ \t][xX][ \t][^\n]*))[ \t\r]*$', re.M)
+RE_PRIMERA_LINEA = re.compile(r'^[ \t]*(\S[^\n]*?)[ \t\r]*$', re.M)
+LISTAS_CACHE_MAX = 16
+
+@st.cache_resource
+def obtener_cache_listas():
+    return {'datos': OrderedDict(), 'lock': threading.Lock()}
+
+def _escanear_lista(texto):
+    categorias, indices = [], {}
+    codigos, productos, cantidades, invalidas = [], [], [], []
+    actual = -1
+    # findall (tuplas) es bastante más rápido que finditer; el número de línea de las inválidas se busca aparte
+    for cat, cant, prod, mala in RE_LINEA_LISTA.findall(texto):
+        if cant:
+            codigos.append(actual)
+            productos.append(prod)
+            cantidades.append(cant)
+        elif mala:
+            invalidas.append(mala.strip())
+        else:
+            nombre = cat.replace("==", "").strip()
+            actual = indices.get(nombre)
+            if actual is None:
+                actual = indices[nombre] = len(categorias)
+                categorias.append(nombre)
+    if invalidas:
+        invalidas = [(texto.count("\n", 0, m.start()) + 1, m.group(4).strip())
+                     for m in RE_LINEA_LISTA.finditer(texto) if m.group(4)]
+    # Título: la primera línea con texto, si no es encabezado ni producto
+    primera = RE_PRIMERA_LINEA.search(texto)
+    titulo = primera.group(1) if primera and not RE_LINEA_LISTA.fullmatch(primera.group(0)) else ""
+    lista = {
+        'categorias': categorias,
+        'codigos': np.array(codigos, dtype=np.int32),
+        'productos': productos,
+        'cantidades': np.array(cantidades, dtype=np.float64),
+        'invalidas': invalidas,
+        'titulo': titulo,
+    }
+    lista['codigos'].flags.writeable = False
+    lista['cantidades'].flags.writeable = False
+    return lista
+
+def parsear_lista(texto):
+    texto = texto or ""
+    clave = hashlib.sha1(texto.encode("utf-8", "surrogatepass")).hexdigest()
+    cache = obtener_cache_listas()
+    with cache['lock']:
+        if clave in cache['datos']:
+            cache['datos'].move_to_end(clave)
+            return cache['datos'][clave]
+    lista = _escanear_lista(texto)
+    if lista['invalidas']: logger.info(f"parsear_lista: {len(lista['invalidas'])} líneas inválidas")
+    with cache['lock']:
+        cache['datos'][clave] = lista
+        while len(cache['datos']) > LISTAS_CACHE_MAX: cache['datos'].popitem(last=False)
+    return lista
+
+def categorias_de_lista(lista, defecto="General"):
+    nombres = lista['categorias']
+    return [nombres[c] if c >= 0 else defecto for c in lista['codigos'].tolist()]
+
+def agrupar_lista(lista, defecto="General"):
+    # {categoria: {producto: cantidad}} sumando repetidos, en el orden de la lista
+    d = {}
+    for cat, prod, q in zip(categorias_de_lista(lista, defecto), lista['productos'], lista['cantidades'].tolist()):
+        prods = d.setdefault(cat, {})
+        prods[prod] = prods.get(prod, 0) + q
+    return d
+
+def mostrar_lineas_invalidas(lista, maximo=5):
+    invalidas = lista['invalidas']
+    if not invalidas: return
+    detalle = "\n".join(f"línea {n}: {linea}" for n, linea in invalidas[:maximo])
+    if len(invalidas) > maximo: detalle += f"\n… y {len(invalidas) - maximo} más"
+    st.warning(f"⚠️ {len(invalidas)} líneas no se pudieron leer:\n\n```\n{detalle}\n```")
+
+# --- REPORTES ---
+# Texto "== CATEGORIA ==" / "cant x producto" para copiar o mandar por WhatsApp.
+def renderizar_reporte(encabezado, grupos):
+    # grupos: (categoría, líneas) ya ordenados. Se arma con un solo join, sin txt += por línea
+    partes = [f"{encabezado}\n"]
+    for cat, lineas in grupos:
+        partes.append(f"\n== {cat} ==\n")
+        if lineas: partes.append("\n".join(lineas) + "\n")
+    return "".join(partes)
+
+def formatear_lista_texto(diccionario, titulo):
+    if not diccionario: return ""
+    return renderizar_reporte(f"📋 *{titulo.upper()}*", ((cat, diccionario[cat]) for cat in sorted(diccionario)))
+
+def generar_mensaje_df(df):
+    # Se agrupa en una pasada; dentro de cada categoría se ordena con el argsort de la propia columna, que es el que usa
+    # sort_values("Producto"), así los productos repetidos quedan en el mismo orden que antes
+    columna = df["Producto"].array
+    productos = df["Producto"].tolist()
+    cantidades = df["Cantidad"].tolist()
+    grupos = {}
+    for i, c in enumerate(df["Categoria"].tolist()): grupos.setdefault(c, []).append(i)
+    def lineas(filas):
+        filas = np.asarray(filas)[columna.take(filas).argsort(kind="quicksort")].tolist()
+        return [f"{int(cantidades[i]) if cantidades[i].is_integer() else cantidades[i]} x {productos[i]}" for i in filas]
+    return renderizar_reporte("📋 *LISTA DE REPOSICIÓN*", ((c.upper(), lineas(grupos[c])) for c in sorted(grupos)))
+
+# --- SUMA / RESTA DE LISTAS ---
+def combinar_listas(listas, signos):
+    # Cualquier cantidad de listas ya parseadas, cada una con su signo (1 suma, -1 resta). Cada (categoría, producto)
+    # recibe una posición en un dict la primera vez que aparece; cada lista se suma con un bincount sobre esas
+    # posiciones y los totales se acumulan lista por lista, en el mismo orden de sumas que antes (mismos decimales).
+    claves, posiciones = {}, []
+    for lista in listas:
+        pares = zip(categorias_de_lista(lista), lista['productos'])
+        posiciones.append(np.fromiter((claves.setdefault(k, len(claves)) for k in pares), dtype=np.intp,
+                                      count=len(lista['productos'])))
+    total = np.zeros(len(claves))
+    for lista, pos, signo in zip(listas, posiciones, signos):
+        total += signo * np.bincount(pos, weights=lista['cantidades'], minlength=len(claves))
+    return list(claves), total
+
+def texto_de_combinacion(claves, total, encabezado, solo_positivos=False):
+    grupos = {}
+    for (cat, prod), q in zip(claves, total.tolist()):
+        if solo_positivos and not q > 0: continue
+        grupos.setdefault(cat, []).append((prod, q))
+    return renderizar_reporte(encabezado, ((c, [f"{int(q) if q.is_integer() else q} x {p}" for p, q in sorted(grupos[c])])
+                                           for c in sorted(grupos)))
+
+# --- TOTALES (UN SOLO GROUPBY) ---
+# La lista parseada ya es columnar: un solo groupby por (categoría, producto) da el desglose por producto, y los totales
+# por categoría y el total general salen de sumar ese desglose. Las líneas "General" (sin encabezado) se pueden
+# recategorizar por nombre con la caché de productos, que solo corre el clasificador sobre nombres que nunca vio. El
+# resultado se guarda en su propia caché (no dentro de la lista parseada, que comparten todas las sesiones) por hash
+# del texto, recategorizar y huella de las reglas, así los reruns con el mismo texto no recalculan nada.
+TOTALES_CACHE_MAX = 16
+
+@st.cache_resource
+def obtener_cache_totales():
+    return {'datos': OrderedDict(), 'lock': threading.Lock()}
+
+def calcular_totales(categorizador, texto, recategorizar=False):
+    texto = texto or ""
+    clave = (hashlib.sha1(texto.encode("utf-8", "surrogatepass")).hexdigest(), bool(recategorizar), categorizador['huella'])
+    cache = obtener_cache_totales()
+    with cache['lock']:
+        if clave in cache['datos']:
+            cache['datos'].move_to_end(clave)
+            return cache['datos'][clave]
+    lista = parsear_lista(texto)
+    categorias = np.array(categorias_de_lista(lista), dtype=object)
+    productos = pd.Series(lista['productos'], dtype=object)
+    if recategorizar:
+        # Solo los productos sin encabezado; un "== General ==" escrito en la lista se respeta
+        sin_encabezado = lista['codigos'] == -1
+        if sin_encabezado.any():
+            categorias[sin_encabezado] = categorizar_serie(categorizador, productos[sin_encabezado])[0].to_numpy()
+    df = pd.DataFrame({"Categoria": categorias, "Producto": productos, "Cantidad": lista['cantidades']})
+    por_producto = df.groupby(["Categoria", "Producto"], as_index=False)["Cantidad"].sum()
+    por_categoria = por_producto.groupby("Categoria", as_index=False).agg(Productos=("Producto", "size"),
+                                                                          Cantidad=("Cantidad", "sum"))
+    totales = {'por_categoria': por_categoria, 'por_producto': por_producto,
+               'total': float(por_categoria["Cantidad"].sum()), 'lineas': len(df)}
+    with cache['lock']:
+        cache['datos'][clave] = totales
+        while len(cache['datos']) > TOTALES_CACHE_MAX: cache['datos'].popitem(last=False)
+    return totales
+
+def csv_de_totales(totales):
+    # Desglose por producto con el total de su categoría y una última fila con el total general
+    df = totales['por_producto'].merge(totales['por_categoria'][["Categoria", "Cantidad"]], on="Categoria",
+                                       suffixes=("", " Categoria"))
+    total = pd.DataFrame({"Categoria": ["TOTAL"], "Producto": [""], "Cantidad": [totales['total']],
+                          "Cantidad Categoria": [totales['total']]})
+    return pd.concat([df, total], ignore_index=True).to_csv(index=False).encode("utf-8")
@@ -0,0 +1,163 @@
+# --- PERSISTENCIA DE LA SESIÓN ---
+# Compartido por app.py y app-saphirus.py: diario y snapshot de la sesión del navegador.
+import streamlit as st
+import threading
+import logging
+import uuid
+import json
+import time
+import os
+import re
+
+from productos import DATOS_DIR
+from auditoria import (importar_auditoria, exportar_auditoria, unirse_a_auditoria, sincronizar_auditoria, marcar_estado,
+                       fijar_cantidad, fijar_producto, agregar_filas, borrar_filas)
+
+logger = logging.getLogger(__name__)
+
+# --- PERSISTENCIA DE LA SESIÓN (DIARIO + SNAPSHOT) ---
+# Cada sesión del navegador tiene un id en la URL (?sesion=...), así una recarga o un reinicio del servidor la encuentra.
+# Los cambios se anotan como eventos y al final de cada corrida (o al principio de la siguiente, si hubo st.rerun) se
+# agregan todos juntos al diario, una línea JSON por evento y un solo fsync. Cada tanto (y al empezar o reiniciar la
+# auditoría) se escribe un snapshot completo y el diario vuelve a empezar. Las líneas llevan la generación del snapshot:
+# si el corte fue justo entre el snapshot y el vaciado del diario, las líneas viejas se ignoran.
+# Cada app pasa un dict con sus 'estados' de auditoría y, si guarda algo más que la auditoría, sus propias partes:
+# 'foto' (claves extra de la foto), 'aplicar_foto' y 'aplicar_evento' (los eventos que no son de la auditoría).
+SESIONES_DIR = os.path.join(DATOS_DIR, "sesiones")
+DIARIO_MAX_EVENTOS = 500
+SESIONES_MAX_DIAS = 7
+RE_SESION = re.compile(r'[0-9a-f]{32}')
+
+def rutas_sesion(sesion):
+    return os.path.join(SESIONES_DIR, f"{sesion}.snapshot.json"), os.path.join(SESIONES_DIR, f"{sesion}.diario.jsonl")
+
+def registrar_evento(*evento):
+    st.session_state.diario_pendiente.append(list(evento))
+
+def _limpiar_sesiones_viejas():
+    if not os.path.isdir(SESIONES_DIR): return
+    try:
+        limite = time.time() - SESIONES_MAX_DIAS * 86400
+        for nombre in os.listdir(SESIONES_DIR):
+            ruta = os.path.join(SESIONES_DIR, nombre)
+            if os.path.getmtime(ruta) < limite: os.remove(ruta)
+    except Exception as e:
+        logger.warning(f"No se pudieron limpiar sesiones viejas: {e}")
+
+def foto_de_sesion(persistencia):
+    aud = st.session_state.audit_data
+    lista = st.session_state.get('audit_lista')
+    foto = {
+        'audit_started': st.session_state.audit_started,
+        # Una auditoría compartida se vuelve a bajar de la base: alcanza con el código
+        'audit': exportar_auditoria(aud) if aud and not aud.get('compartida') else None,
+        'compartida': aud['compartida']['codigo'] if aud and aud.get('compartida') else None,
+        'invalidas': lista['invalidas'] if lista else [],
+    }
+    if 'foto' in persistencia: foto.update(persistencia['foto']())
+    return foto
+
+def aplicar_foto(persistencia, foto):
+    st.session_state.audit_started = foto['audit_started']
+    if foto.get('compartida'): st.session_state.audit_data = unirse_a_auditoria(foto['compartida'], persistencia['estados'])
+    else: st.session_state.audit_data = importar_auditoria(foto['audit'], persistencia['estados']) if foto['audit'] else None
+    st.session_state.audit_started = st.session_state.audit_started and st.session_state.audit_data is not None
+    st.session_state.audit_lista = {'invalidas': foto['invalidas']}
+    if 'aplicar_foto' in persistencia: persistencia['aplicar_foto'](foto)
+
+def aplicar_evento(persistencia, evento):
+    tipo, args = evento[0], evento[1:]
+    aud = st.session_state.audit_data
+    if tipo == "estado": marcar_estado(aud, *args)
+    elif tipo == "cantidad": fijar_cantidad(aud, *args)
+    elif tipo == "producto": fijar_producto(aud, *args)
+    elif tipo == "agregar": agregar_filas(aud, *args[:4], ids=[i if isinstance(i, int) else None for i in args[4]])
+    elif tipo == "borrar": borrar_filas(aud, *args)
+    elif 'aplicar_evento' in persistencia: persistencia['aplicar_evento'](evento)
+
+def guardar_snapshot(persistencia):
+    # Compactación: la foto completa reemplaza al diario (escritura atómica con os.replace)
+    try:
+        os.makedirs(SESIONES_DIR, exist_ok=True)
+        ruta_foto, ruta_diario = rutas_sesion(st.session_state.sesion_id)
+        generacion = st.session_state.sesion_generacion + 1
+        foto = foto_de_sesion(persistencia)
+        foto['generacion'] = generacion
+        temporal = f"{ruta_foto}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(foto, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta_foto)
+        open(ruta_diario, "w").close()
+        st.session_state.sesion_generacion = generacion
+        st.session_state.sesion_eventos = 0
+        # Lo pendiente ya quedó dentro de la foto
+        st.session_state.diario_pendiente = []
+        if st.session_state.audit_data: st.session_state.audit_data['diario'].clear()
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el snapshot de la sesión: {e}")
+
+def guardar_diario(persistencia):
+    aud = st.session_state.audit_data
+    # Los cambios de una auditoría compartida van a la base (no al diario) y de paso se bajan los de los demás
+    # (si la base no responde quedan en aud['diario'] para la próxima corrida)
+    locales = aud['diario'] if aud and not aud.get('compartida') else []
+    if aud and aud.get('compartida'):
+        conflictos = sincronizar_auditoria(aud)
+        if conflictos: st.toast(f"⚠️ {conflictos} cambios no se guardaron: otro repositor modificó esos ítems antes.")
+    eventos = locales + st.session_state.diario_pendiente
+    if not eventos: return
+    if locales: aud['diario'].clear()
+    st.session_state.diario_pendiente = []
+    try:
+        os.makedirs(SESIONES_DIR, exist_ok=True)
+        generacion = st.session_state.sesion_generacion
+        lineas = "".join(json.dumps({"g": generacion, "e": e}, ensure_ascii=False) + "\n" for e in eventos)
+        with open(rutas_sesion(st.session_state.sesion_id)[1], "a", encoding="utf-8") as f:
+            f.write(lineas)
+            f.flush()
+            os.fsync(f.fileno())
+        st.session_state.sesion_eventos += len(eventos)
+        if st.session_state.sesion_eventos >= DIARIO_MAX_EVENTOS: guardar_snapshot(persistencia)
+    except Exception as e:
+        logger.warning(f"No se pudo escribir el diario de la sesión: {e}")
+
+def restaurar_sesion(persistencia, sesion):
+    ruta_foto, ruta_diario = rutas_sesion(sesion)
+    generacion = eventos = 0
+    if os.path.exists(ruta_foto):
+        with open(ruta_foto, encoding="utf-8") as f: foto = json.load(f)
+        aplicar_foto(persistencia, foto)
+        generacion = foto['generacion']
+    if os.path.exists(ruta_diario):
+        with open(ruta_diario, encoding="utf-8") as f:
+            for linea in f:
+                try: registro = json.loads(linea)
+                except ValueError: continue  # Última línea cortada por un corte a mitad de escritura
+                if registro.get("g") != generacion: continue
+                aplicar_evento(persistencia, registro["e"])
+                eventos += 1
+    # Lo reaplicado ya está en el diario
+    if st.session_state.audit_data: st.session_state.audit_data['diario'].clear()
+    st.session_state.sesion_generacion = generacion
+    st.session_state.sesion_eventos = eventos
+
+def iniciar_persistencia(persistencia):
+    # Primera corrida de la sesión del navegador: tomar (o crear) el id de la URL y restaurar lo guardado
+    if 'sesion_id' not in st.session_state:
+        sesion = st.query_params.get("sesion", "")
+        nueva = not RE_SESION.fullmatch(sesion)
+        if nueva:
+            sesion = uuid.uuid4().hex
+            st.query_params["sesion"] = sesion
+        st.session_state.sesion_id = sesion
+        st.session_state.sesion_generacion = 0
+        st.session_state.sesion_eventos = 0
+        st.session_state.diario_pendiente = []
+        if nueva: _limpiar_sesiones_viejas()
+        else:
+            try: restaurar_sesion(persistencia, sesion)
+            except Exception as e: logger.warning(f"No se pudo restaurar la sesión {sesion}: {e}")
+    # Eventos que quedaron sin escribir porque la corrida anterior terminó con st.rerun()
+    guardar_diario(persistencia)
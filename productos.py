@@ -0,0 +1,265 @@
+# --- CLASIFICACIÓN Y LIMPIEZA DE PRODUCTOS ---
+# Compartido por app.py y app-saphirus.py: cada app arma sus estructuras con sus propias CATEGORIAS y reglas de
+# limpieza, y las pasa a estas funciones.
+import streamlit as st
+import pandas as pd
+import numpy as np
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+import threading
+import sqlite3
+import os
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- CLASIFICADOR COMPILADO ---
+# 'claves' es una lista de alternativas (OR) y cada alternativa es una tupla de palabras que deben aparecer todas (AND).
+# Se arma una sola vez: todas las palabras clave en un único regex, cada una con un bit, y las reglas como máscaras ordenadas por prioridad.
+def compilar_clasificador(categorias):
+    palabras = {k for c in categorias.values() for alt in c['claves'] for k in alt}
+    palabras |= {k for c in categorias.values() for k in c.get('excluye', ())}
+    palabras = sorted(palabras, key=len, reverse=True)
+    bits = {k: 1 << i for i, k in enumerate(palabras)}
+    # En cada posición el regex devuelve la clave más larga; las claves contenidas en ella (ej. RUTA en RUTA 66) se encienden también
+    cierre = {k: sum(bits[o] for o in palabras if o in k) for k in palabras}
+    regex = re.compile("(?=(" + "|".join(re.escape(k) for k in palabras) + "))")
+    reglas = []
+    reglas_claves = []
+    for config in sorted(categorias.values(), key=lambda c: c['prioridad']):
+        prefix = f"{config['emoji']} " if config['emoji'] else ""
+        alternativas = tuple(sum(bits[k] for k in alt) for alt in config['claves'])
+        excluye = sum(bits[k] for k in config.get('excluye', ()))
+        reglas.append((f"{prefix}{config['nombre']}", alternativas, excluye))
+        reglas_claves.append((f"{prefix}{config['nombre']}", tuple(config['claves']), tuple(config.get('excluye', ()))))
+    # 'palabras' y 'reglas_claves' son la misma tabla en forma de texto, para la categorización vectorizada
+    return {'regex': regex, 'cierre': cierre, 'reglas': tuple(reglas), 'palabras': tuple(palabras), 'reglas_claves': tuple(reglas_claves)}
+
+def detectar_categoria(clasificador, producto):
+    mascara = 0
+    cierre = clasificador['cierre']
+    for clave in clasificador['regex'].findall(producto.upper()):
+        mascara |= cierre[clave]
+    if mascara:
+        for etiqueta, alternativas, excluye in clasificador['reglas']:
+            if mascara & excluye: continue
+            for req in alternativas:
+                if (mascara & req) == req: return etiqueta
+    return "📦 Varios"
+
+# --- MOTOR DE LIMPIEZA ---
+# Cada regla se compila una sola vez junto con su literal obligatorio (la corrida de letras fija más larga del patrón):
+# si ese literal no está en el nombre, la regla no puede matchear y se saltea sin pasar por el regex. Los patrones
+# pueden venir como texto (se compilan sin distinguir mayúsculas) o ya compilados, y solos (se borra lo que matchea)
+# o en tupla con su reemplazo.
+def regla_de_categoria(mapeo, cat):
+    for key, regla in mapeo.items():
+        if key in cat: return regla
+    return None
+
+def literal_obligatorio(patron):
+    mejor, actual = "", ""
+    for op, valor in sre_parse.parse(patron.pattern, patron.flags):
+        if op is sre_parse.LITERAL:
+            actual += chr(valor)
+            if len(actual) > len(mejor): mejor = actual
+        else:
+            actual = ""
+    return mejor if mejor == mejor.upper() else ""
+
+def compilar_pasos(reglas):
+    pasos = []
+    for regla in reglas:
+        patron, reemplazo = regla if isinstance(regla, tuple) else (regla, "")
+        if isinstance(patron, str): patron = re.compile(patron, re.IGNORECASE)
+        pasos.append((patron, reemplazo, literal_obligatorio(patron)))
+    return tuple(pasos)
+
+def ejecutar_pasos(texto, pasos):
+    resultado = texto.upper()
+    # Fuera de ASCII el IGNORECASE de Unicode puede matchear sin el literal exacto, así que no se saltea nada
+    saltear = resultado.isascii()
+    for regex, reemplazo, literal in pasos:
+        if saltear and literal not in resultado: continue
+        resultado = regex.sub(reemplazo, resultado)
+    # Equivale a re.sub(r"\s+", " ", resultado).strip()
+    return " ".join(resultado.split())
+
+def compilar_limpieza(reglas, mapeo, sin_general=('aparatos',)):
+    general = compilar_pasos(reglas['general'])
+    # 'general' es la segunda etapa (None si la regla está en 'sin_general', como Aparatos)
+    motores = {None: {'pasos': general, 'general': None}}
+    for regla in set(mapeo.values()):
+        if regla in sin_general:
+            motores[regla] = {'pasos': compilar_pasos(reglas[regla]), 'general': None}
+        else:
+            motores[regla] = {'pasos': compilar_pasos(reglas.get(regla, [])), 'general': general}
+    # 'por_categoria': nombre de categoría -> (motor, es Touch), se completa a medida que aparecen categorías
+    return {'motores': motores, 'mapeo': mapeo, 'por_categoria': {}}
+
+def motor_de_categoria(limpieza, cat):
+    por_categoria = limpieza['por_categoria']
+    if cat not in por_categoria:
+        por_categoria[cat] = (limpieza['motores'][regla_de_categoria(limpieza['mapeo'], cat)], "Touch" in cat)
+    return por_categoria[cat]
+
+def limpiar_nombre(limpieza, nom, cat):
+    motor, es_touch = motor_de_categoria(limpieza, cat)
+    resultado = ejecutar_pasos(nom, motor['pasos'])
+    if motor['general'] is None: return resultado
+    resultado = ejecutar_pasos(resultado, motor['general'])
+    if es_touch and "REPUESTO NEGRO" in resultado: resultado = resultado.replace("REPUESTO NEGRO", "NEGRO + REPUESTO")
+    return resultado if len(resultado) >= 2 else nom
+
+# --- CATEGORIZACIÓN MASIVA (VECTORIZADA) ---
+# Misma lógica que detectar_categoria / limpiar_nombre pero sobre una Series entera: la categoría sale de
+# máscaras por palabra clave y la limpieza se hace por grupo de categoría, buscando el motor una sola vez por grupo.
+def detectar_categoria_serie(clasificador, productos):
+    p = productos.str.upper()
+    presentes = {k: p.str.contains(k, regex=False).to_numpy(dtype=bool) for k in clasificador['palabras']}
+    categorias = np.full(len(p), "📦 Varios", dtype=object)
+    sin_asignar = np.ones(len(p), dtype=bool)
+    for etiqueta, alternativas, excluye in clasificador['reglas_claves']:
+        if not sin_asignar.any(): break
+        cumple = np.zeros(len(p), dtype=bool)
+        for alt in alternativas:
+            cumple |= np.logical_and.reduce([presentes[k] for k in alt])
+        for k in excluye:
+            cumple &= ~presentes[k]
+        cumple &= sin_asignar
+        categorias[cumple] = etiqueta
+        sin_asignar &= ~cumple
+    return pd.Series(categorias, index=productos.index, dtype=object)
+
+def limpiar_serie_por_categoria(limpieza, productos, categorias):
+    limpios = productos.astype(object)
+    for cat in categorias.unique():
+        filas = (categorias == cat).to_numpy()
+        limpios[filas] = [limpiar_nombre(limpieza, nom, cat) for nom in productos[filas]]
+    return limpios
+
+# --- CACHÉ DE PRODUCTOS (LRU) ---
+# Compartida por todas las sesiones del servidor: nombre crudo -> (categoria, producto_limpio). El categorizador de
+# cada app es {'clasificador', 'limpieza', 'huella'}; la huella sale de sus reglas y hay una caché por huella, así las
+# dos apps no se mezclan y si cambian las reglas se arma una caché nueva.
+CACHE_PRODUCTOS_MAX = 50000
+
+@st.cache_resource(max_entries=4)
+def obtener_cache_productos(huella):
+    return {'datos': OrderedDict(), 'lock': threading.Lock(), 'hits': 0, 'misses': 0, 'evictions': 0}
+
+def buscar_en_cache(cache, nombres):
+    encontrados = {}
+    with cache['lock']:
+        datos = cache['datos']
+        for nombre in nombres:
+            if nombre in datos:
+                datos.move_to_end(nombre)
+                encontrados[nombre] = datos[nombre]
+        cache['hits'] += len(encontrados)
+        cache['misses'] += len(nombres) - len(encontrados)
+    return encontrados
+
+def guardar_en_cache(cache, resultados):
+    with cache['lock']:
+        datos = cache['datos']
+        datos.update(resultados)
+        while len(datos) > CACHE_PRODUCTOS_MAX:
+            datos.popitem(last=False)
+            cache['evictions'] += 1
+
+def estadisticas_cache_productos(categorizador):
+    cache = obtener_cache_productos(categorizador['huella'])
+    with cache['lock']:
+        return {'tamaño': len(cache['datos']), 'hits': cache['hits'], 'misses': cache['misses'], 'evictions': cache['evictions']}
+
+def categorizar_producto(categorizador, nombre):
+    cache = obtener_cache_productos(categorizador['huella'])
+    encontrado = buscar_en_cache(cache, [nombre])
+    if nombre in encontrado: return encontrado[nombre]
+    cat = detectar_categoria(categorizador['clasificador'], nombre)
+    resultado = (cat, limpiar_nombre(categorizador['limpieza'], nombre, cat))
+    guardar_en_cache(cache, {nombre: resultado})
+    return resultado
+
+def categorizar_serie(categorizador, productos):
+    cache = obtener_cache_productos(categorizador['huella'])
+    unicos = list(productos.unique())
+    conocidos = buscar_en_cache(cache, unicos)
+    faltan = [n for n in unicos if n not in conocidos]
+    if faltan:
+        nuevos = pd.Series(faltan, dtype=object)
+        categorias = detectar_categoria_serie(categorizador['clasificador'], nuevos)
+        limpios = limpiar_serie_por_categoria(categorizador['limpieza'], nuevos, categorias)
+        resultados = dict(zip(faltan, zip(categorias, limpios)))
+        guardar_en_cache(cache, resultados)
+        conocidos.update(resultados)
+    categorias = productos.map({n: r[0] for n, r in conocidos.items()}).astype(object)
+    limpios = productos.map({n: r[1] for n, r in conocidos.items()}).astype(object)
+    return categorias, limpios
+
+# --- CATÁLOGO PERSISTENTE (SQLite) ---
+# ID de artículo (8 dígitos) -> categoría y nombre limpio, aprendido de los PDFs ya procesados. Sobrevive reinicios y
+# se comparte entre las dos apps: la huella de las reglas es parte de la clave, así cada app (y cada versión de las
+# reglas) ve solo lo que ella misma clasificó. Se guarda también el nombre con que llegó el artículo: si el mismo ID
+# llega con otro nombre (el proveedor lo renombró o reusó el código) se vuelve a clasificar y se reemplaza.
+# DATOS_DIR (variable de entorno) cambia el directorio de datos de todos los módulos (catálogo, caché de PDFs,
+# auditorías compartidas y sesiones); las rutas se arman al importar, así que tiene que fijarse antes.
+DATOS_DIR = os.environ.get("DATOS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos")
+CATALOGO_DB = os.path.join(DATOS_DIR, "catalogo.sqlite3")
+
+@st.cache_resource
+def obtener_catalogo():
+    os.makedirs(DATOS_DIR, exist_ok=True)
+    con = sqlite3.connect(CATALOGO_DB, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""CREATE TABLE IF NOT EXISTS productos (
+        id TEXT NOT NULL, huella TEXT NOT NULL, producto_original TEXT, categoria TEXT NOT NULL,
+        producto TEXT NOT NULL, visto TEXT DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (id, huella))""")
+    con.commit()
+    return {'con': con, 'lock': threading.Lock()}
+
+def buscar_en_catalogo(huella, ids):
+    encontrados = {}
+    ids = list(ids)
+    try:
+        catalogo = obtener_catalogo()
+        with catalogo['lock']:
+            for i in range(0, len(ids), 500):
+                lote = ids[i:i + 500]
+                filas = catalogo['con'].execute(
+                    f"SELECT id, producto_original, categoria, producto FROM productos WHERE huella = ? AND id IN ({','.join('?' * len(lote))})",
+                    [huella, *lote])
+                for id_art, original, cat, prod in filas:
+                    encontrados[id_art] = (original, cat, prod)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Catálogo no disponible: {e}")
+    return encontrados
+
+def guardar_en_catalogo(huella, filas):
+    try:
+        catalogo = obtener_catalogo()
+        with catalogo['lock'], catalogo['con']:
+            catalogo['con'].executemany(
+                "INSERT OR REPLACE INTO productos (id, huella, producto_original, categoria, producto) VALUES (?, ?, ?, ?, ?)",
+                [(id_art, huella, original, cat, prod) for id_art, original, cat, prod in filas])
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"No se pudo guardar en el catálogo: {e}")
+
+def categorizar_por_id(categorizador, ids, productos):
+    catalogo = buscar_en_catalogo(categorizador['huella'], ids.unique())
+    # Solo cuenta como conocido si el ID llega con el mismo nombre que se guardó
+    conocidos = (ids.map({k: v[0] for k, v in catalogo.items()}) == productos).to_numpy()
+    categorias = ids.map({k: v[1] for k, v in catalogo.items()}).astype(object)
+    limpios = ids.map({k: v[2] for k, v in catalogo.items()}).astype(object)
+    if not conocidos.all():
+        nuevos_ids, nuevos_prod = ids[~conocidos], productos[~conocidos]
+        cats, limps = categorizar_serie(categorizador, nuevos_prod)
+        categorias[~conocidos] = cats.to_numpy(dtype=object)
+        limpios[~conocidos] = limps.to_numpy(dtype=object)
+        guardar_en_catalogo(categorizador['huella'], zip(nuevos_ids, nuevos_prod, cats, limps))
+    return categorias, limpios
@@ -0,0 +1,132 @@
+# --- PRUEBA DE LA COLA DE WHATSAPP ---
+# Levanta un servidor HTTP local que imita la API de Twilio y manda mensajes por la cola de whatsapp.py, sin tocar
+# Twilio. Según el destino el stub responde 201, 429, 500/503 o 400, y se revisa que:
+#   - 429 y 5xx se reintentan con espera exponencial y terminan "enviado" (o "falló" si se agotan los intentos),
+#   - un 400 falla enseguida, sin reintentos,
+#   - a un mismo destino no se manda más de un mensaje cada WHATSAPP_INTERVALO_DESTINO segundos.
+# Las esperas se achican para que corra en pocos segundos. Sale con código 1 si algo no se cumple.
+#
+#   python prueba_whatsapp.py
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import whatsapp
+
+ESPERA_INICIAL = 0.4
+INTERVALO_DESTINO = 0.2
+TIMEOUT = 15
+
+# Destino -> códigos que devuelve en cada intento (el último se repite)
+RESPUESTAS = {
+    "whatsapp:+5491100000001": [201],
+    "whatsapp:+5491100000429": [429, 429, 201],
+    "whatsapp:+5491100000500": [500, 500, 201],
+    "whatsapp:+5491100000503": [503],
+    "whatsapp:+5491100000400": [400],
+}
+
+# --- STUB DE TWILIO ---
+llegadas = {}  # destino -> [(momento, texto)]
+lock = threading.Lock()
+
+class StubTwilio(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        datos = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        destino = datos["To"][0]
+        with lock:
+            recibidos = llegadas.setdefault(destino, [])
+            recibidos.append((time.monotonic(), datos["Body"][0]))
+            codigos = RESPUESTAS.get(destino, [201])
+            codigo = codigos[min(len(recibidos), len(codigos)) - 1]
+        if codigo == 201: cuerpo = {"sid": f"SM{len(recibidos)}", "status": "queued", "to": destino}
+        else: cuerpo = {"code": 20000 + codigo, "message": f"respuesta {codigo} del stub", "status": codigo}
+        cuerpo = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+def levantar_stub():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), StubTwilio)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="stub-twilio").start()
+    return servidor
+
+# --- PRUEBA ---
+def esperar_fin(ids):
+    limite = time.monotonic() + TIMEOUT
+    while time.monotonic() < limite:
+        estados = whatsapp.estado_whatsapp(ids)
+        if all(e['estado'] != 'en cola' for e in estados.values()): return estados
+        time.sleep(0.05)
+    return whatsapp.estado_whatsapp(ids)
+
+def separaciones(destino):
+    momentos = [m for m, _ in llegadas.get(destino, [])]
+    return [b - a for a, b in zip(momentos, momentos[1:])]
+
+def redondear(gaps):
+    return [round(gap, 3) for gap in gaps]
+
+def main():
+    servidor = levantar_stub()
+    whatsapp.TWILIO_API_URL = f"http://127.0.0.1:{servidor.server_address[1]}"
+    whatsapp.WHATSAPP_ESPERA_INICIAL = ESPERA_INICIAL
+    whatsapp.WHATSAPP_INTERVALO_DESTINO = INTERVALO_DESTINO
+    creds = lambda destino: {'SID': "AC" + "0" * 32, 'TOK': "token", 'FROM': "whatsapp:+14155238886", 'TO': destino}
+
+    ok = "whatsapp:+5491100000001"
+    ids = {f"201 #{i}": whatsapp.encolar_whatsapp(f"mensaje {i}", creds(ok)) for i in range(1, 4)}
+    for destino in list(RESPUESTAS)[1:]:
+        ids[destino[-3:]] = whatsapp.encolar_whatsapp(f"mensaje {destino[-3:]}", creds(destino))
+    estados = esperar_fin(list(ids.values()))
+
+    # (estado final, intentos) esperados
+    esperado = {"201 #1": ('enviado', 1), "201 #2": ('enviado', 1), "201 #3": ('enviado', 1), "429": ('enviado', 3),
+                "500": ('enviado', 3), "503": ('falló', whatsapp.WHATSAPP_REINTENTOS), "400": ('falló', 1)}
+    errores = []
+    for clave, (estado, intentos) in esperado.items():
+        e = estados.get(ids[clave])
+        obtenido = (e['estado'], e['intentos']) if e else None
+        print(f"{clave:8} {obtenido}  {(e or {}).get('error') or ''}"[:140])
+        if obtenido != (estado, intentos): errores.append(f"{clave}: se esperaba {(estado, intentos)}, quedó {obtenido}")
+
+    # Un solo pedido para el 400; los reintentos llegan al stub
+    for destino in RESPUESTAS:
+        _, intentos = esperado["201 #1" if destino == ok else destino[-3:]]
+        cantidad = 3 if destino == ok else intentos
+        if len(llegadas.get(destino, [])) != cantidad:
+            errores.append(f"{destino}: el stub recibió {len(llegadas.get(destino, []))} pedidos, se esperaban {cantidad}")
+
+    # Espera exponencial entre reintentos: ESPERA_INICIAL, 2x, 4x...
+    for destino in ("whatsapp:+5491100000429", "whatsapp:+5491100000500", "whatsapp:+5491100000503"):
+        gaps = separaciones(destino)
+        print(f"espera entre intentos {destino[-3:]}: {redondear(gaps)}")
+        for i, gap in enumerate(gaps):
+            if not gap >= ESPERA_INICIAL * 2 ** i:
+                errores.append(f"{destino}: intento {i + 2} llegó a los {gap}s, antes de la espera {ESPERA_INICIAL * 2 ** i}s")
+
+    # Límite por destino y orden de llegada
+    gaps = separaciones(ok)
+    print(f"separación mismo destino: {redondear(gaps)}")
+    if not all(gap >= INTERVALO_DESTINO for gap in gaps):
+        errores.append(f"{ok}: mensajes separados por menos de {INTERVALO_DESTINO}s: {gaps}")
+    if [texto for _, texto in llegadas.get(ok, [])] != ["mensaje 1", "mensaje 2", "mensaje 3"]:
+        errores.append(f"{ok}: llegaron fuera de orden")
+
+    servidor.shutdown()
+    for error in errores: print("ERROR", error)
+    print("OK" if not errores else f"{len(errores)} errores")
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# --- EQUIVALENCIA CON LAS APPS ORIGINALES ---
+# Casos fijos con el resultado que daban las funciones originales de cada app, antes de los motores compartidos:
+# clasificación (detectar_categoria), limpieza de nombres (limpiar_nombre), mensaje del PDF (generar_mensaje_df) y
+# comparador (comparar_listas, que con nombres ya limpios y sin parecidos da lo mismo que el comparador por nombre
+# exacto). Las apps se importan en modo "bare" con el cargador del benchmark, que también manda DATOS_DIR a un
+# directorio temporal.
+#
+#   python -m pytest -q test_equivalencia.py
+import pandas as pd
+import pytest
+
+from benchmark import cargar_app
+from productos import detectar_categoria, limpiar_nombre
+from listas import generar_mensaje_df
+from comparador import comparar_listas
+
+APPS = ["app.py", "app-saphirus.py"]
+
+# (nombre, categoría en app.py, categoría en app-saphirus.py, nombre limpio en las dos)
+PRODUCTOS = [
+    ("AROMATIZADOR TEXTIL DISNEY - MICKEY", "🏰 Textiles Disney", "TEXTILES DISNEY", "MICKEY"),
+    ("DIFUSOR AROMATICO DISNEY - FROZEN", "🏰 Difusores Disney", "DIFUSORES DISNEY", "FROZEN"),
+    ("TARJETA AROMATICA SAPHIRUS - UVA", "💳 Tarjetas Aromáticas", "💳 Tarjetas Aromáticas", "UVA"),
+    ("SAHUMERIO SAPHIRUS - LAVANDA", "🧘‍♂️ Sahumerios Saphirus", "🧘‍♂️ Sahumerios Saphirus", "LAVANDA"),
+    ("SAHUMERIO AMBAR - MIRRA", "🔸 Sahumerios Ambar", "🔸 Sahumerios Ambar", "MIRRA"),
+    ("SAHUMERIO HIERBAS - RUDA", "🌿 Sahumerios Hierbas", "🌿 Sahumerios Hierbas", "RUDA"),
+    ("SAHUMERIO HIMALAYA - SAL", "🏔️ Sahumerios Himalaya", "🏔️ Sahumerios Himalaya", "SAL"),
+    ("SAHUMERIO - PALO SANTO", "🧘 Sahumerios Varios", "🧘 Sahumerios Varios", "PALO SANTO"),
+    ("DISPOSITIVO TOUCH NEGRO", "🖱️ Dispositivos Touch", "🖱️ Dispositivos Touch", "NEGRO"),
+    ("REPUESTO TOUCH - BEBE", "🔄 Repuestos de Touch", "🔄 Repuestos de Touch", "BEBE"),
+    ("REPUESTO 9 GR/13 - COCO", "🔄 Repuestos de Touch", "🔄 Repuestos de Touch", "REPUESTO 9 GR/13 - COCO"),
+    ("PERFUME MINI MILANO - 212", "🧴 Perfume Mini Milano", "🧴 Perfume Mini Milano", "212"),
+    ("PARFUM 50 ML - ARMANI", "🧴 Parfum / Perfumes", "🧴 Parfum / Perfumes", "PARFUM 50 ML - ARMANI"),
+    ("SHINY LIMPIAVIDRIOS 500 ML", "✨ Shiny General", "✨ Shiny General", "SHINY LIMPIAVIDRIOS 500 ML"),
+    ("AEROSOL AMBAR - VAINILLA", "🔸 Aerosoles Ambar", "🔸 Aerosoles Ambar", "AEROSOL AMBAR - VAINILLA"),
+    ("AROMATIZADOR TEXTIL 150 ML AMBAR - ROSA", "🔸 Textiles Ambar", "🔸 Textiles Ambar", "ROSA"),
+    ("VELA AMBAR", "🔸 Línea Ambar Varios", "🔸 Línea Ambar Varios", "VELA"),
+    ("HOME SPRAY - FLORES BLANCAS", "🏠 Home Spray", "🏠 Home Spray", "FLORES BLANCAS"),
+    ("DIFUSOR 500ML - MANGO", "🏠 Home Spray", "🏠 Home Spray", "DIFUSOR"),
+    ("APARATO ANALOGICO DECO", "⚙️ Aparatos", "⚙️ Aparatos", "ANALOGICO"),
+    ("HORNILLO CERAMICA", "⚙️ Aparatos", "⚙️ Aparatos", "HORNILLO CHICO"),
+    ("DIFUSOR PREMIUM - CITRUS", "💎 Difusores Premium", "💎 Difusores Premium", "CITRUS"),
+    ("AUTO CARITAS - FELIZ", "😎 Autos - Caritas", "😎 Autos - Caritas", "AUTO CARITAS - FELIZ"),
+    ("AROMATIZADOR RUTA 66 - CUERO", "🛣️ Autos - Ruta 66", "🛣️ Autos - Ruta 66", "AROMATIZADOR - CUERO"),
+    ("AROMATIZADOR AUTO - KIWI", "🚗 Autos - Varios", "🚗 Autos - Varios", "AROMATIZADOR AUTO - KIWI"),
+    ("AROMATIZADOR TEXTIL MINI 60 ML - JAZMIN", "🤏 Textiles Mini", "🤏 Textiles Mini", "JAZMIN"),
+    ("AROMATIZADOR TEXTIL 250 ML - UVA", "👕 Textiles Saphirus", "👕 Textiles Saphirus", "UVA"),
+    ("AEROSOL SAPHIRUS - SANDIA", "💨 Aerosoles Saphirus", "💨 Aerosoles Saphirus", "AEROSOL SAPHIRUS - SANDIA"),
+    ("VARILLA DE REPUESTO", "🎍 Difusores", "🎍 Difusores", "VARILLA DE REPUESTO"),
+    ("VELA DE SOJA - CANELA", "🕯️ Velas", "🕯️ Velas", "VELA DE SOJA - CANELA"),
+    ("ACEITE ESENCIAL - LIMON", "💧 Aceites", "💧 Aceites", "LIMON"),
+    ("ANTIHUMEDAD 200 GR", "💧 Antihumedad", "💧 Antihumedad", "ANTIHUMEDAD 200 GR"),
+    ("LIMPIADOR MULTISUPERFICIE - LAVANDA", "🧼 Limpiadores Multisuperficies", "🧼 Limpiadores Multisuperficies",
+     "LIMPIADOR MULTISUPERFICIE - LAVANDA"),
+    ("aromatizador textil - uva", "👕 Textiles Saphirus", "👕 Textiles Saphirus", "UVA"),
+    ("PRODUCTO SIN CATEGORIA", "📦 Varios", "📦 Varios", "PRODUCTO SIN CATEGORIA"),
+]
+
+FILAS_PDF = [("🕯️ Velas", "VELA DE SOJA - CANELA", 2.0), ("👕 Textiles Saphirus", "UVA", 1.5),
+             ("👕 Textiles Saphirus", "COCO", 3.0), ("🕯️ Velas", "VELA AMBAR", 1.0), ("👕 Textiles Saphirus", "UVA", 4.0),
+             ("🏰 Textiles Disney", "MICKEY", 12.0), ("📦 Varios", "PRODUCTO SIN CATEGORIA", 0.5),
+             ("👕 Textiles Saphirus", "BEBE", 2.0)]
+MENSAJE_PDF = ("📋 *LISTA DE REPOSICIÓN*\n"
+               "\n== 🏰 TEXTILES DISNEY ==\n12 x MICKEY\n"
+               "\n== 👕 TEXTILES SAPHIRUS ==\n2 x BEBE\n3 x COCO\n1.5 x UVA\n4 x UVA\n"
+               "\n== 📦 VARIOS ==\n0.5 x PRODUCTO SIN CATEGORIA\n"
+               "\n== 🕯️ VELAS ==\n1 x VELA AMBAR\n2 x VELA DE SOJA - CANELA\n")
+
+LISTA_A = "📋 *PEDIDO*\n== TEXTILES ==\n3 x UVA\n2 x COCO\n1.5 x BEBE\n== VELAS ==\n1 x VELA AMBAR\n4 x JAZMIN\n"
+LISTA_B = "== TEXTILES ==\n3 x UVA\n1 x COCO\n== VELAS ==\n1 x VELA AMBAR\n2 x LAVANDA\n"
+# (lista A, lista B, faltan, sobran, diferencias)
+COMPARACIONES = [
+    (LISTA_A, LISTA_B, {'BEBE': 1.5, 'JAZMIN': 4.0}, {'LAVANDA': 2.0}, {'COCO': (2.0, 1.0)}),
+    (LISTA_B, LISTA_A, {'LAVANDA': 2.0}, {'BEBE': 1.5, 'JAZMIN': 4.0}, {'COCO': (1.0, 2.0)}),
+    (LISTA_A, LISTA_A, {}, {}, {}),
+    (LISTA_A, "", {'UVA': 3.0, 'COCO': 2.0, 'BEBE': 1.5, 'VELA AMBAR': 1.0, 'JAZMIN': 4.0}, {}, {}),
+]
+
+@pytest.fixture(scope="module", params=APPS)
+def app(request):
+    return cargar_app(request.param)
+
+def test_detectar_categoria(app):
+    columna = 1 + APPS.index(app.__file__.split("/")[-1])
+    esperadas = [fila[columna] for fila in PRODUCTOS]
+    assert [detectar_categoria(app.CLASIFICADOR, fila[0]) for fila in PRODUCTOS] == esperadas
+
+def test_limpiar_nombre(app):
+    columna = 1 + APPS.index(app.__file__.split("/")[-1])
+    limpios = [limpiar_nombre(app.LIMPIEZA, fila[0].upper(), fila[columna]) for fila in PRODUCTOS]
+    assert limpios == [fila[3] for fila in PRODUCTOS]
+
+def test_generar_mensaje_df():
+    assert generar_mensaje_df(pd.DataFrame(FILAS_PDF, columns=["Categoria", "Producto", "Cantidad"])) == MENSAJE_PDF
+
+@pytest.mark.parametrize("texto_a, texto_b, faltan, sobran, diferencias", COMPARACIONES)
+def test_comparar_listas(app, texto_a, texto_b, faltan, sobran, diferencias):
+    r = comparar_listas(app.LIMPIEZA, texto_a, texto_b)
+    assert dict(zip(r['faltan']["Producto"], r['faltan']["Cantidad"])) == faltan
+    assert dict(zip(r['sobran']["Producto"], r['sobran']["Cantidad"])) == sobran
+    assert {p: (e, l) for p, e, l in zip(r['diferencias']["Producto"], r['diferencias']["Esperado"],
+                                         r['diferencias']["Llegó"])} == diferencias
+    assert r['parecidos'].empty
@@ -0,0 +1,142 @@
+# --- WHATSAPP ---
+# Compartido por app.py y app-saphirus.py: cola de envíos por Twilio. Cada app valida sus credenciales y encola.
+import streamlit as st
+from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+import logging
+import uuid
+import threading
+import os
+import time
+import heapq
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- COLA DE WHATSAPP (HILO EN SEGUNDO PLANO) ---
+# Los mensajes no se mandan dentro de la corrida de Streamlit: se encolan y un único hilo del servidor los envía con un
+# cliente de Twilio por cuenta, reutilizado (sesión HTTP con pool de conexiones). Errores de red, 5xx y 429 se
+# reintentan con espera exponencial; otro 4xx (credenciales, número inválido) falla enseguida. A un mismo destino se
+# manda como mucho un mensaje cada WHATSAPP_INTERVALO_DESTINO segundos. Cada mensaje tiene un estado (en cola / enviado
+# / falló) que la UI consulta, y los fallidos guardan el texto para reintentarlos. TWILIO_API_URL (variable de entorno)
+# cambia la URL de la API, ej. por un servidor local de prueba (ver prueba_whatsapp.py).
+WHATSAPP_REINTENTOS = 4
+WHATSAPP_ESPERA_INICIAL = 2.0  # segundos; se duplica en cada reintento
+WHATSAPP_INTERVALO_DESTINO = 1.0
+WHATSAPP_TIMEOUT = 15
+WHATSAPP_HISTORIAL_MAX = 200
+WHATSAPP_CONSULTA_SEGUNDOS = 2
+TWILIO_API_URL = os.environ.get("TWILIO_API_URL")
+ESTADOS_WHATSAPP = {'en cola': "⏳ En cola", 'enviado': "✅ Enviado", 'falló': "❌ Falló"}
+
+@st.cache_resource
+def obtener_cola_whatsapp():
+    # 'pendientes' es un heap (momento, secuencia, id); todo se toca con 'condicion' tomada salvo 'clientes' (solo el hilo)
+    return {'mensajes': OrderedDict(), 'pendientes': [], 'secuencia': 0, 'ultimo_envio': {}, 'clientes': {},
+            'condicion': threading.Condition(), 'hilo': None}
+
+def _cliente_twilio(cola, sid, token):
+    if (sid, token) not in cola['clientes']:
+        cliente = Client(sid, token, http_client=TwilioHttpClient(pool_connections=True, timeout=WHATSAPP_TIMEOUT))
+        if TWILIO_API_URL: cliente.api.base_url = TWILIO_API_URL
+        cola['clientes'][(sid, token)] = cliente
+    return cola['clientes'][(sid, token)]
+
+def _programar_envio(cola, momento, id_mensaje):
+    cola['secuencia'] += 1
+    heapq.heappush(cola['pendientes'], (momento, cola['secuencia'], id_mensaje))
+    cola['condicion'].notify()
+    if cola['hilo'] is None or not cola['hilo'].is_alive():
+        cola['hilo'] = threading.Thread(target=_trabajador_whatsapp, args=(cola,), daemon=True, name="cola-whatsapp")
+        cola['hilo'].start()
+
+def _es_reintentable(error):
+    estado = getattr(error, 'status', None) if isinstance(error, TwilioRestException) else None
+    return estado is None or estado == 429 or estado >= 500
+
+def _siguiente_envio(cola):
+    # Espera al primer mensaje que ya tocó; si su destino recibió uno hace poco, lo corre para más tarde
+    while True:
+        ahora = time.monotonic()
+        if not cola['pendientes'] or cola['pendientes'][0][0] > ahora:
+            cola['condicion'].wait(cola['pendientes'][0][0] - ahora if cola['pendientes'] else None)
+            continue
+        _, _, id_mensaje = heapq.heappop(cola['pendientes'])
+        msg = cola['mensajes'].get(id_mensaje)
+        if msg is None or msg['estado'] != 'en cola': continue
+        libre = cola['ultimo_envio'].get(msg['creds']['TO'], float("-inf")) + WHATSAPP_INTERVALO_DESTINO
+        if libre > ahora:
+            _programar_envio(cola, libre, id_mensaje)
+            continue
+        msg['intentos'] += 1
+        return id_mensaje, msg
+
+def _trabajador_whatsapp(cola):
+    while True:
+        with cola['condicion']:
+            id_mensaje, msg = _siguiente_envio(cola)
+        creds = msg['creds']
+        try:
+            _cliente_twilio(cola, creds['SID'], creds['TOK']).messages.create(body=msg['mensaje'], from_=creds['FROM'], to=creds['TO'])
+            error = None
+        except Exception as e:
+            error = e
+        with cola['condicion']:
+            # El intervalo del destino corre desde que terminó el intento (también los fallidos), no desde que salió:
+            # así el siguiente no puede llegar antes aunque este haya tardado en llegar
+            cola['ultimo_envio'][creds['TO']] = time.monotonic()
+            msg['error'] = None if error is None else str(error)
+            if error is None:
+                msg['estado'] = 'enviado'
+            elif msg['intentos'] < WHATSAPP_REINTENTOS and _es_reintentable(error):
+                _programar_envio(cola, time.monotonic() + WHATSAPP_ESPERA_INICIAL * 2 ** (msg['intentos'] - 1), id_mensaje)
+            else:
+                msg['estado'] = 'falló'
+                logger.warning(f"WhatsApp {id_mensaje} falló tras {msg['intentos']} intentos: {error}")
+
+def encolar_whatsapp(mensaje, creds):
+    cola = obtener_cola_whatsapp()
+    id_mensaje = uuid.uuid4().hex[:8]
+    with cola['condicion']:
+        cola['mensajes'][id_mensaje] = {'mensaje': mensaje, 'creds': dict(creds), 'estado': 'en cola', 'intentos': 0,
+                                        'error': None, 'creado': time.time()}
+        # El historial se recorta por los más viejos ya terminados; los que siguen en cola no se pierden
+        sobran = len(cola['mensajes']) - WHATSAPP_HISTORIAL_MAX
+        if sobran > 0:
+            for viejo in [k for k, m in cola['mensajes'].items() if m['estado'] != 'en cola'][:sobran]:
+                del cola['mensajes'][viejo]
+        _programar_envio(cola, time.monotonic(), id_mensaje)
+    return id_mensaje
+
+def reintentar_whatsapp(id_mensaje):
+    cola = obtener_cola_whatsapp()
+    with cola['condicion']:
+        msg = cola['mensajes'].get(id_mensaje)
+        if msg is None or msg['estado'] != 'falló': return False
+        msg.update(estado='en cola', intentos=0, error=None)
+        _programar_envio(cola, time.monotonic(), id_mensaje)
+    return True
+
+def estado_whatsapp(ids):
+    cola = obtener_cola_whatsapp()
+    with cola['condicion']:
+        return {i: {k: cola['mensajes'][i][k] for k in ('estado', 'intentos', 'error', 'creado')}
+                for i in ids if i in cola['mensajes']}
+
+@st.fragment(run_every=WHATSAPP_CONSULTA_SEGUNDOS)
+def mostrar_envios_whatsapp(maximo=5):
+    # Estado de los últimos envíos de esta sesión; se consulta en memoria, sin tocar Twilio
+    ids = st.session_state.whatsapp_envios[-maximo:]
+    if not ids: return
+    estados = estado_whatsapp(ids)
+    for id_mensaje in reversed(ids):
+        if id_mensaje not in estados: continue
+        e = estados[id_mensaje]
+        detalle = f"{ESTADOS_WHATSAPP[e['estado']]} · {time.strftime('%H:%M:%S', time.localtime(e['creado']))}"
+        if e['intentos'] > 1: detalle += f" · {e['intentos']} intentos"
+        if e['error']: detalle += f" · {e['error'][:120]}"
+        col_txt, col_btn = st.columns([4, 1])
+        col_txt.caption(detalle)
+        if e['estado'] == 'falló':
+            col_btn.button("🔁 Reintentar", key=f"wa_reintentar_{id_mensaje}", on_click=reintentar_whatsapp, args=(id_mensaje,))